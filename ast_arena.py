@@ -0,0 +1,281 @@
+#!/usr/bin/python
+#
+# Copyright (c) 2011 Ivan Vladimirov Ivanov (ivan.vladimirov.ivanov@gmail.com)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+
+
+__author__ = "Ivan Vladimirov Ivanov (ivan.vladimirov.ivanov@gmail.com)"
+
+
+# Stores trees as typed arrays instead of one Python object per node. Node n
+# has a kind in kinds[n] and its operands in
+# operands[starts[n]:starts[n + 1]]. An operand is the index of another node,
+# NONE, or for the text of a token the index of an interned string. Lists
+# and tuples are nodes of their own kinds.
+#
+# Views are read back with the names of the jack_lang_model classes and the
+# attributes of their fields. Lists and tuples come back as real lists and
+# tuples of views. JackToVMCompiler and JackXMLSerializer can walk a view
+# just like a tree of model objects.
+#
+# Save writes the arrays to a file as they are. Load maps the file and puts
+# ctypes arrays on top of the mapping, so nothing is copied until it is read.
+
+import array
+import ctypes
+import hashlib
+import inspect
+import mmap
+import struct
+import sys
+
+import jack_lang_model
+
+
+NONE = 0xffffffff
+
+_TOKEN_CLASSES = frozenset([
+    "Keyword", "Symbol", "IntegerConstant", "StringConstant", "Identifier"
+])
+
+_MODEL_CLASSES = sorted(
+    (name, node_class) for name, node_class in
+    inspect.getmembers(jack_lang_model, inspect.isclass)
+    if hasattr(node_class, "__slots__"))
+
+KIND_NAMES = ["list", "tuple"] + [name for name, _ in _MODEL_CLASSES]
+
+_KINDS = dict((name, kind) for kind, name in enumerate(KIND_NAMES))
+
+_LIST = _KINDS["list"]
+_TUPLE = _KINDS["tuple"]
+
+# The stored fields of every kind. The offsets of tokens are not kept.
+_FIELDS = dict(
+    (_KINDS[name], tuple(field for field in node_class.__slots__
+                         if field != "offset"))
+    for name, node_class in _MODEL_CLASSES)
+
+_MAGIC = "JACKAST\0"
+
+# Padded to a multiple of four bytes, the alignment of the arrays after it.
+_HEADER = struct.Struct("=8s20sB3xIIIII")
+
+# Files written with another set of kinds or fields, or another header, can
+# not be read.
+_VERSION = hashlib.sha1(repr(
+    [(name, _FIELDS[_KINDS[name]]) for name, _ in _MODEL_CLASSES] +
+    [_HEADER.format])).digest()
+
+
+class ArenaError(Exception):
+  def __init__(self, message):
+    self.message = message
+
+
+class _View(object):
+
+  __slots__ = ("arena", "node")
+
+  def __init__(self, arena, node):
+    self.arena = arena
+    self.node = node
+
+
+def _MakeView(name, fields, is_token):
+  def Field(position):
+    def Get(self):
+      arena = self.arena
+      operand = arena.operands[arena.starts[self.node] + position]
+      if is_token:
+        return arena.strings[operand]
+      return arena.Value(operand)
+    return property(Get)
+
+  namespace = {"__slots__": ()}
+  for position, field in enumerate(fields):
+    namespace[field] = Field(position)
+  if is_token:
+    namespace["offset"] = None
+  return type(name, (_View,), namespace)
+
+
+_VIEWS = dict(
+    (_KINDS[name], _MakeView(name, _FIELDS[_KINDS[name]],
+                             name in _TOKEN_CLASSES))
+    for name, _ in _MODEL_CLASSES)
+
+
+class _MappedStrings(object):
+
+  # The string table of a loaded arena, sliced out of the mapping on use.
+
+  def __init__(self, buffer, offsets, start):
+    self.buffer = buffer
+    self.offsets = offsets
+    self.start = start
+
+  def __getitem__(self, index):
+    return self.buffer[self.start + self.offsets[index]:
+                       self.start + self.offsets[index + 1]]
+
+  def __len__(self):
+    return len(self.offsets) - 1
+
+
+class Arena(object):
+
+  def __init__(self):
+    self.kinds = array.array("B")
+    self.starts = array.array("I", [0])
+    self.operands = array.array("I")
+    self.roots = array.array("I")
+    self.strings = []
+    self.string_ids = {}
+
+  def Intern(self, value):
+    string_id = self.string_ids.get(value)
+    if string_id is None:
+      string_id = len(self.strings)
+      self.strings.append(value)
+      self.string_ids[value] = string_id
+    return string_id
+
+  def Add(self, tree):
+    # Stores a tree and returns the index of its root, which is also added
+    # to roots. Children are stored before their parents, with a stack
+    # instead of recursion so that any depth fits.
+    stack = [(tree, False)]
+    results = []
+    while stack:
+      value, expanded = stack.pop()
+      if value is None:
+        results.append(NONE)
+        continue
+
+      name = value.__class__.__name__
+      kind = _KINDS[name]
+      if name in _TOKEN_CLASSES:
+        results.append(self._AddNode(
+            kind, [self.Intern(getattr(value, _FIELDS[kind][0]))]))
+        continue
+
+      if kind == _LIST or kind == _TUPLE:
+        children = value
+      else:
+        children = [getattr(value, field) for field in _FIELDS[kind]]
+      if not expanded:
+        stack.append((value, True))
+        stack.extend((child, False) for child in reversed(children))
+      else:
+        first = len(results) - len(children)
+        node = self._AddNode(kind, results[first:])
+        del results[first:]
+        results.append(node)
+
+    self.roots.append(results[0])
+    return results[0]
+
+  def _AddNode(self, kind, operands):
+    self.kinds.append(kind)
+    self.operands.extend(operands)
+    self.starts.append(len(self.operands))
+    return len(self.kinds) - 1
+
+  def Kind(self, node):
+    return KIND_NAMES[self.kinds[node]]
+
+  def Operands(self, node):
+    return self.operands[self.starts[node]:self.starts[node + 1]]
+
+  def Value(self, operand):
+    # The node an operand refers to, as a view, list or tuple.
+    if operand == NONE:
+      return None
+    kind = self.kinds[operand]
+    if kind == _LIST or kind == _TUPLE:
+      values = [self.Value(child) for child in self.Operands(operand)]
+      return values if kind == _LIST else tuple(values)
+    return _VIEWS[kind](self, operand)
+
+  def Root(self, index):
+    return self.Value(self.roots[index])
+
+  def __len__(self):
+    return len(self.roots)
+
+  def ByteSize(self):
+    size = sum(len(data) * data.itemsize for data in
+               (self.kinds, self.starts, self.operands, self.roots))
+    return size + sum(len(string) for string in self.strings)
+
+  def Save(self, file_name):
+    offsets = array.array("I", [0])
+    for string in self.strings:
+      offsets.append(offsets[-1] + len(string))
+    with open(file_name, "wb") as arena_file:
+      arena_file.write(_HEADER.pack(
+          _MAGIC, _VERSION, sys.byteorder == "little", len(self.kinds),
+          len(self.operands), len(self.roots), len(self.strings),
+          offsets[-1]))
+      # Every array starts at a multiple of four bytes from the start of
+      # the file, and so of the mapping Load puts it in.
+      arena_file.write(self.kinds.tostring())
+      arena_file.write("\0" * (-(_HEADER.size + len(self.kinds)) % 4))
+      for data in (self.starts, self.operands, self.roots, offsets):
+        data.tofile(arena_file)
+      arena_file.write("".join(self.strings))
+
+  @staticmethod
+  def Load(file_name):
+    # The arena is read only, and valid for as long as it is referenced.
+    with open(file_name, "rb") as arena_file:
+      try:
+        buffer = mmap.mmap(arena_file.fileno(), 0, access=mmap.ACCESS_COPY)
+      except ValueError:
+        # Empty files can not be mapped.
+        raise ArenaError("%s is not an AST arena" % (file_name,))
+    if len(buffer) < _HEADER.size:
+      raise ArenaError("%s is not an AST arena" % (file_name,))
+    (magic, version, little_endian, n_nodes, n_operands, n_roots, n_strings,
+     strings_size) = _HEADER.unpack_from(buffer)
+    if magic != _MAGIC:
+      raise ArenaError("%s is not an AST arena" % (file_name,))
+    if version != _VERSION or little_endian != (sys.byteorder == "little"):
+      raise ArenaError("%s was written by another version" % (file_name,))
+
+    arena = Arena()
+    position = _HEADER.size
+    def Map(item_type, count):
+      if position + ctypes.sizeof(item_type) * count > len(buffer):
+        raise ArenaError("%s is truncated" % (file_name,))
+      data = (item_type * count).from_buffer(buffer, position)
+      return data, position + ctypes.sizeof(data)
+    arena.kinds, position = Map(ctypes.c_uint8, n_nodes)
+    position += -position % 4
+    arena.starts, position = Map(ctypes.c_uint32, n_nodes + 1)
+    arena.operands, position = Map(ctypes.c_uint32, n_operands)
+    arena.roots, position = Map(ctypes.c_uint32, n_roots)
+    offsets, position = Map(ctypes.c_uint32, n_strings + 1)
+    if position + strings_size > len(buffer):
+      raise ArenaError("%s is truncated" % (file_name,))
+    arena.strings = _MappedStrings(buffer, offsets, position)
+    arena.string_ids = None
+    return arena
@@ -0,0 +1,208 @@
+#!/usr/bin/python
+#
+# Copyright (c) 2011 Ivan Vladimirov Ivanov (ivan.vladimirov.ivanov@gmail.com)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+
+
+__author__ = "Ivan Vladimirov Ivanov (ivan.vladimirov.ivanov@gmail.com)"
+
+
+# Serializes trees of jack_lang_model objects with marshal, so that tools
+# which only need the tree of a class can skip tokenizing and parsing it.
+#
+# A node is written as a tuple of its kind and its fields, a token as its
+# kind and text. Lists stay lists and tuples get a kind of their own. The
+# body of every subroutine is marshalled on its own and the class, with
+# each body replaced by the place of its data, goes first:
+#
+#   header | class | body 0 | body 1 | ...
+#
+# Loads only reads the header and the class. A body is unmarshalled when
+# it is first used, so the data can be a mapped file and a tool that looks
+# at a few subroutines never pays for the rest.
+
+import hashlib
+import inspect
+import marshal
+import mmap
+import struct
+
+import jack_lang_model
+
+
+_MODEL_CLASSES = sorted(
+    (name, node_class) for name, node_class in
+    inspect.getmembers(jack_lang_model, inspect.isclass)
+    if hasattr(node_class, "__slots__"))
+
+# Kind 0 marks a tuple and kind 1 a subroutine body that is not loaded yet.
+_TUPLE = 0
+_BODY = 1
+
+_KINDS = dict((name, kind) for kind, (name, _) in enumerate(_MODEL_CLASSES, 2))
+
+_CLASSES = dict((_KINDS[name], node_class)
+                for name, node_class in _MODEL_CLASSES)
+
+# The stored fields of every kind. The offsets of tokens are not kept.
+_FIELDS = dict(
+    (_KINDS[name], tuple(field for field in node_class.__slots__
+                         if field != "offset"))
+    for name, node_class in _MODEL_CLASSES)
+
+_SUBROUTINE_DEC = _KINDS["SubroutineDec"]
+
+_MAGIC = "JACKTREE"
+
+# Data written with another set of kinds or fields, or another marshal
+# format, can not be read.
+_VERSION = hashlib.sha1(repr(
+    (marshal.version,
+     [(name, _FIELDS[_KINDS[name]]) for name, _ in _MODEL_CLASSES]))).digest()
+
+_HEADER = struct.Struct("=8s20sI")
+
+
+class AstCacheError(Exception):
+  def __init__(self, message):
+    self.message = message
+
+
+def _Encode(value, bodies):
+  # Subroutine bodies are appended to bodies when a list is given, and left
+  # in place otherwise.
+  if value is None:
+    return None
+  if isinstance(value, list):
+    return [_Encode(item, bodies) for item in value]
+  if isinstance(value, tuple):
+    return (_TUPLE,) + tuple(_Encode(item, bodies) for item in value)
+  kind = _KINDS.get(value.__class__.__name__)
+  if kind is None:
+    # Strings and numbers are written as they are.
+    return value
+  if kind == _SUBROUTINE_DEC and bodies is not None:
+    bodies.append(value.body)
+    fields = [_Encode(getattr(value, field), bodies)
+              for field in _FIELDS[kind][:-1]]
+    return (kind,) + tuple(fields) + ((_BODY, len(bodies) - 1),)
+  return (kind,) + tuple(_Encode(getattr(value, field), bodies)
+                         for field in _FIELDS[kind])
+
+
+def _Decode(value, data):
+  if value.__class__ is list:
+    return [_Decode(item, data) for item in value]
+  if value.__class__ is not tuple:
+    return value
+  kind = value[0]
+  if kind == _TUPLE:
+    return tuple([_Decode(item, data) for item in value[1:]])
+  if kind == _SUBROUTINE_DEC and value[-1][0] == _BODY:
+    fields = [_Decode(item, data) for item in value[1:-1]]
+    node = SubroutineDec(*(fields + [None]))
+    node._data = data
+    node._body_index = value[-1][1]
+    return node
+  return _CLASSES[kind](*[_Decode(item, data) for item in value[1:]])
+
+
+class SubroutineDec(jack_lang_model.SubroutineDec):
+
+  # A subroutine whose body is unmarshalled on first use. It keeps the name
+  # of the class it stands in for, for code that goes by class names.
+
+  __slots__ = ("_data", "_body_index")
+
+  def _GetBody(self):
+    if self._data is not None:
+      data, self._data = self._data, None
+      jack_lang_model.SubroutineDec.body.__set__(
+          self, data.Body(self._body_index))
+    return jack_lang_model.SubroutineDec.body.__get__(self)
+
+  def _SetBody(self, body):
+    self._data = None
+    jack_lang_model.SubroutineDec.body.__set__(self, body)
+
+  body = property(_GetBody, _SetBody)
+
+
+class _Data(object):
+
+  # The serialized bodies of a loaded class, and the offsets at which each
+  # one starts.
+
+  def __init__(self, buffer, offsets, start):
+    self.buffer = buffer
+    self.offsets = offsets
+    self.start = start
+
+  def Body(self, index):
+    value = marshal.loads(self.buffer[self.start + self.offsets[index]:
+                                      self.start + self.offsets[index + 1]])
+    return _Decode(value, self)
+
+
+def Dumps(tree):
+  # Trees nested too deeply for marshal raise a ValueError.
+  bodies = []
+  skeleton = _Encode(tree, bodies)
+  blobs = [marshal.dumps(_Encode(body, None)) for body in bodies]
+  offsets = [0]
+  for blob in blobs:
+    offsets.append(offsets[-1] + len(blob))
+  head = marshal.dumps((skeleton, offsets))
+  return "".join([_HEADER.pack(_MAGIC, _VERSION, len(head)), head] + blobs)
+
+
+def Loads(data):
+  # data can be a string or a mapped file. Bodies are read from it as they
+  # are used, so it must not change while the tree is in use.
+  if len(data) < _HEADER.size:
+    raise AstCacheError("Not a serialized tree")
+  magic, version, head_size = _HEADER.unpack(data[:_HEADER.size])
+  if magic != _MAGIC:
+    raise AstCacheError("Not a serialized tree")
+  if version != _VERSION:
+    raise AstCacheError("The tree was serialized by another version")
+  start = _HEADER.size + head_size
+  try:
+    skeleton, offsets = marshal.loads(data[_HEADER.size:start])
+  except (EOFError, ValueError, TypeError):
+    raise AstCacheError("The serialized tree is truncated")
+  if start + offsets[-1] > len(data):
+    raise AstCacheError("The serialized tree is truncated")
+  return _Decode(skeleton, _Data(data, offsets, start))
+
+
+def Save(tree, file_name):
+  with open(file_name, "wb") as tree_file:
+    tree_file.write(Dumps(tree))
+
+
+def Load(file_name):
+  with open(file_name, "rb") as tree_file:
+    try:
+      buffer = mmap.mmap(tree_file.fileno(), 0, access=mmap.ACCESS_READ)
+    except ValueError:
+      # Empty files can not be mapped.
+      raise AstCacheError("%s is not a serialized tree" % (file_name,))
+  return Loads(buffer)
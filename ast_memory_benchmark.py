@@ -0,0 +1,152 @@
+#!/usr/bin/python
+#
+# Copyright (c) 2011 Ivan Vladimirov Ivanov (ivan.vladimirov.ivanov@gmail.com)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+
+
+__author__ = "Ivan Vladimirov Ivanov (ivan.vladimirov.ivanov@gmail.com)"
+
+
+# Reports how many bytes the nodes of a parsed class take up. The same
+# source is parsed into copies of the jack_lang_model classes that keep
+# their attributes in a __dict__, the way the model did before it used
+# __slots__, into the model classes themselves, into a flattened tree and
+# into an ast_arena.Arena.
+
+import contextlib
+import inspect
+import optparse
+import sys
+
+import ast_arena
+import jack_lang_model
+import lexical_analyser
+import predictive_parser
+
+
+def _DictClasses():
+  classes = {}
+  for name, node_class in inspect.getmembers(jack_lang_model, inspect.isclass):
+    if hasattr(node_class, "__slots__"):
+      classes[name] = type(name, (object,),
+                           {"__init__": node_class.__init__.im_func})
+  return classes
+
+
+@contextlib.contextmanager
+def _ModelClasses(classes):
+  # Every class is put back, even if replacing them stopped halfway.
+  saved = dict((name, getattr(jack_lang_model, name)) for name in classes)
+  try:
+    for name, node_class in classes.items():
+      setattr(jack_lang_model, name, node_class)
+    yield
+  finally:
+    for name, node_class in saved.items():
+      setattr(jack_lang_model, name, node_class)
+
+
+def Parse(program, classes, flat=False):
+  tokens = lexical_analyser.LexicalAnalyser.TokenizeToArray(program)
+  with _ModelClasses(classes):
+    # A new parser, since the terminal parsers hold on to the token classes.
+    parser = predictive_parser.PredictiveParser(predictive_parser.Grammar(
+        predictive_parser.FactoredRules(flat=flat)))
+    return parser.ParseRule(tokens, "Class")
+
+
+def MeasureNodes(tree, node_classes):
+  # Returns the number of nodes of the tree and the bytes they take up,
+  # counting each node's __dict__ if it has one. The lists and strings the
+  # nodes refer to are the same in both layouts and are left out.
+  nodes = 0
+  size = 0
+  seen = set()
+  stack = [tree]
+  while stack:
+    value = stack.pop()
+    if id(value) in seen:
+      continue
+    seen.add(id(value))
+    if isinstance(value, (list, tuple)):
+      stack.extend(value)
+    elif isinstance(value, node_classes):
+      nodes += 1
+      size += sys.getsizeof(value)
+      if hasattr(value, "__dict__"):
+        size += sys.getsizeof(value.__dict__)
+        stack.extend(value.__dict__.values())
+      else:
+        stack.extend(getattr(value, name) for name in value.__slots__)
+  return nodes, size
+
+
+def GenerateProgram(n_subroutines):
+  subroutines = []
+  for n in xrange(n_subroutines):
+    subroutines.append("""
+  method int f%d(int x, Array a) {
+    var int i, sum;
+    let i = 0;
+    while (i < x) {
+      if ((a[i] > 0) & ~(i = 3)) { let sum = sum + (a[i] * 2); }
+      else { do Output.printString("negative"); }
+      let i = i + 1;
+    }
+    return sum;
+  }""" % (n,))
+  return "class Benchmark {\n  field int x;%s\n}\n" % ("".join(subroutines),)
+
+
+def main():
+  parser = optparse.OptionParser(usage="%prog [options] [FILE]")
+  parser.add_option(
+      "-n", "--subroutines", type="int", default=1000,
+      help="size of the generated class measured when no file is given "
+           "(default: %default)")
+  options, args = parser.parse_args()
+
+  if args:
+    with open(args[0]) as program_file:
+      program = program_file.read()
+  else:
+    program = GenerateProgram(options.subroutines)
+
+  dict_classes = _DictClasses()
+  slots_classes = dict(
+      (name, getattr(jack_lang_model, name)) for name in dict_classes)
+  for label, classes, flat in (("__dict__", dict_classes, False),
+                               ("__slots__", slots_classes, False),
+                               ("flat", slots_classes, True)):
+    tree = Parse(program, classes, flat)
+    nodes, size = MeasureNodes(tree, tuple(classes.values()))
+    print "%-10s %8d nodes %11d bytes %6.1f bytes per node" % (
+        label, nodes, size, float(size) / nodes)
+
+  # The arena also stores the lists and tuples the counts above leave out,
+  # but its size is still given per model node.
+  arena = ast_arena.Arena()
+  arena.Add(tree)
+  print "%-10s %8d nodes %11d bytes %6.1f bytes per node" % (
+      "arena", nodes, arena.ByteSize(), float(arena.ByteSize()) / nodes)
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,228 @@
+#!/usr/bin/python
+#
+# Copyright (c) 2011 Ivan Vladimirov Ivanov (ivan.vladimirov.ivanov@gmail.com)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+
+
+__author__ = "Ivan Vladimirov Ivanov (ivan.vladimirov.ivanov@gmail.com)"
+
+
+# The interface of a class is what other classes need to know of it: its
+# name, how many fields and statics it declares and the signatures of its
+# subroutines. It is read from the declarations alone. The bodies of the
+# subroutines are skipped by matching their braces, without tokenizing
+# them, so extraction costs little more than finding the braces.
+#
+# An interface is stored as a JSON object that records the SHA-1 of the
+# source it was extracted from, and is extracted again only once the source
+# changes. Builds keep them in the compilation cache, and jack_compiler.py
+# --interfaces writes them to a .jacki file next to their .jack file.
+
+import hashlib
+import json
+import os
+import re
+
+import compilation_cache
+import lexical_analyser
+import signature_index
+
+EXTENSION = ".jacki"
+
+# Bump whenever extraction changes, so that older .jacki files are ignored.
+_VERSION = 1
+
+# Comments and string constants may hold braces that do not count.
+_RE_SKIPPED = re.compile(r"//[^\n\r]*|/\*.*?\*/|\"[^\"\r\n]*\"|[{}]",
+                         re.DOTALL)
+
+
+class Interface(object):
+
+  __slots__ = ("class_name", "fields", "statics", "subroutines")
+
+  def __init__(self, class_name, fields, statics, subroutines):
+    self.class_name = class_name
+    self.fields = fields
+    self.statics = statics
+    # Subroutine name -> signature_index.Signature
+    self.subroutines = subroutines
+
+  def __eq__(self, other):
+    return (isinstance(other, Interface) and
+            self.class_name == other.class_name and
+            self.fields == other.fields and
+            self.statics == other.statics and
+            self.subroutines == other.subroutines)
+
+  def __ne__(self, other):
+    return not self == other
+
+
+def Skeleton(program):
+  # The source of the class with the bodies of its subroutines left empty
+  # and without comments.
+  pieces = []
+  depth = 0
+  start = 0
+  for match in _RE_SKIPPED.finditer(program):
+    text = match.group(0)
+    if depth < 2:
+      pieces.append(program[start:match.start()])
+    if text == "{":
+      depth += 1
+      if depth <= 2:
+        pieces.append(text)
+    elif text == "}":
+      depth -= 1
+      if depth <= 1:
+        pieces.append(text)
+    elif depth < 2:
+      # A comment still separates the tokens around it.
+      pieces.append(text if text[0] == "\"" else " ")
+    start = match.end()
+  if depth < 2:
+    pieces.append(program[start:])
+  return "".join(pieces)
+
+
+def Extract(program):
+  # The Interface of the class in program, or None if its declarations are
+  # too malformed to tell.
+  try:
+    tokens = lexical_analyser.LexicalAnalyser.TokenizeToArray(
+        Skeleton(program))
+  except lexical_analyser.LexicalError:
+    return None
+  class_signatures = signature_index.TokenSignatures(tokens)
+  if class_signatures is None:
+    return None
+
+  # With the bodies gone, field and static only start class variable
+  # declarations, and each declares one variable plus one per comma.
+  counts = {"field": 0, "static": 0}
+  var_kind = None
+  for index in xrange(len(tokens)):
+    value = tokens.Value(index)
+    if value in counts:
+      var_kind = value
+      counts[var_kind] += 1
+    elif value == ";":
+      var_kind = None
+    elif value == "," and var_kind:
+      counts[var_kind] += 1
+  class_name, subroutines = class_signatures
+  return Interface(class_name, counts["field"], counts["static"], subroutines)
+
+
+def Dumps(interface, source_digest):
+  data = {"version": _VERSION, "source": source_digest, "class": None}
+  if interface is not None:
+    data.update({
+        "class": interface.class_name,
+        "fields": interface.fields,
+        "statics": interface.statics,
+        "subroutines": [
+            [name, signature.kind, signature.arity, signature.return_type]
+            for name, signature in sorted(interface.subroutines.items())]
+    })
+  return json.dumps(data, sort_keys=True)
+
+
+def Loads(data, source_digest):
+  # Returns (True, interface) if data holds the interface of the source
+  # with the given digest, which is None for a malformed class, and
+  # (False, None) if it does not.
+  try:
+    data = json.loads(data)
+    if (data.get("version") != _VERSION or
+        data.get("source") != source_digest):
+      return False, None
+    if data["class"] is None:
+      return True, None
+    # JSON gives back unicode, but names are plain strs everywhere else.
+    subroutines = dict(
+        (str(name), signature_index.Signature(
+            str(kind), arity, str(return_type)))
+        for name, kind, arity, return_type in data["subroutines"])
+    return True, Interface(
+        str(data["class"]), data["fields"], data["statics"], subroutines)
+  except (ValueError, KeyError, TypeError, AttributeError,
+          UnicodeError):
+    return False, None
+
+
+def InterfaceFileName(file_name):
+  return os.path.splitext(file_name)[0] + EXTENSION
+
+
+def SourceInterface(program, cache=None):
+  # The Interface of the class in program, or None if it is malformed. It
+  # is taken from the cache when there is one that has it.
+  if cache is None:
+    return Extract(program)
+  source_digest = hashlib.sha1(program).hexdigest()
+  key = cache.Key(program, kind="jacki")
+  data = cache.Get(key)
+  if data is not None:
+    found, interface = Loads(data, source_digest)
+    if found:
+      return interface
+  interface = Extract(program)
+  try:
+    cache.Put(key, Dumps(interface, source_digest))
+  except (IOError, OSError):
+    # An unwritable cache only costs the next build an extraction.
+    pass
+  return interface
+
+
+def LoadInterface(file_name, cache=None):
+  # The Interface of a .jack file, see SourceInterface. Raises IOError if
+  # the file can not be read.
+  with open(file_name, "rb") as program_file:
+    with lexical_analyser.MapFile(program_file) as program:
+      return SourceInterface(program, cache)
+
+
+def WriteInterfaceFile(file_name):
+  # The Interface of a .jack file, read from the file's .jacki file when
+  # that matches the source, and extracted and written there otherwise.
+  # Raises IOError if either file can not be read or written.
+  interface_file_name = InterfaceFileName(file_name)
+  with open(file_name, "rb") as program_file:
+    with lexical_analyser.MapFile(program_file) as program:
+      source_digest = hashlib.sha1(program).hexdigest()
+      try:
+        with open(interface_file_name, "rb") as interface_file:
+          found, interface = Loads(interface_file.read(), source_digest)
+        if found:
+          return interface
+      except IOError:
+        pass
+      interface = Extract(program)
+
+  try:
+    with compilation_cache.ReplaceFile(
+        interface_file_name, "wb") as interface_file:
+      interface_file.write(Dumps(interface, source_digest))
+  except OSError as error:
+    raise IOError(str(error))
+  return interface
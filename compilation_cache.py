@@ -0,0 +1,262 @@
+#!/usr/bin/python
+#
+# Copyright (c) 2011 Ivan Vladimirov Ivanov (ivan.vladimirov.ivanov@gmail.com)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+
+
+__author__ = "Ivan Vladimirov Ivanov (ivan.vladimirov.ivanov@gmail.com)"
+
+
+import collections
+import contextlib
+import errno
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+
+
+_DEFAULT_MAX_SIZE = 256 * 1024 * 1024
+
+# Temporary files older than this were left behind by a writer that died
+# before renaming them into place.
+_STALE_TEMP_AGE = 60 * 60
+
+# How often TrimIfDue walks the cache.
+_TRIM_INTERVAL = 10 * 60
+
+# The file in the cache directory TrimIfDue keeps the time of the last walk
+# in. Trim only looks into the directories of entries, so it is left alone.
+_TRIM_STAMP = ".last-trim"
+
+_RE_ENTRY_DIRECTORY = re.compile(r"^[0-9a-f]{2}$")
+
+
+def DefaultDirectory():
+  if "JACK_COMPILER_CACHE" in os.environ:
+    return os.environ["JACK_COMPILER_CACHE"]
+  cache_home = os.environ.get(
+      "XDG_CACHE_HOME", os.path.join(os.path.expanduser("~"), ".cache"))
+  return os.path.join(cache_home, "jack_compiler")
+
+
+@contextlib.contextmanager
+def ReplaceFile(file_name, mode="w"):
+  # Yields a file that takes the place of file_name once the block is done,
+  # so that readers such as a concurrent build never see it half written.
+  # If the block fails, file_name keeps what it had. The file is opened like
+  # any other, so it gets the usual permissions.
+  temp_name = "%s.tmp-%d" % (file_name, os.getpid())
+  try:
+    with open(temp_name, mode) as output_file:
+      yield output_file
+    os.rename(temp_name, file_name)
+  except:
+    try:
+      os.remove(temp_name)
+    except OSError:
+      pass
+    raise
+
+
+def Fingerprint(modules):
+  digest = hashlib.sha1()
+  for module in modules:
+    file_name = module.__file__
+    if file_name.endswith((".pyc", ".pyo")):
+      file_name = file_name[:-1]
+    with open(file_name, "rb") as module_file:
+      digest.update(module_file.read())
+  return digest.hexdigest()
+
+
+class CompilationCache(object):
+
+  # Entries are written to a temporary file and renamed into place, so
+  # several processes, or several checkouts sharing one directory, never see
+  # a partially written entry. Two writers racing on the same key write the
+  # same content, so whichever rename wins is correct.
+
+  def __init__(self, directory, version, max_size=_DEFAULT_MAX_SIZE):
+    self.directory = directory
+    self.version = version
+    self.max_size = max_size
+
+  def Key(self, source, kind="vm", context=""):
+    # context is anything else the entry depends on besides the source.
+    digest = hashlib.sha1()
+    digest.update(self.version)
+    digest.update("\0" + kind + "\0")
+    if context:
+      digest.update(context + "\0")
+    digest.update(source)
+    return digest.hexdigest() + "." + kind
+
+  def Get(self, key):
+    path = self._Path(key)
+    try:
+      with open(path, "rb") as entry_file:
+        data = entry_file.read()
+    except IOError:
+      return None
+    try:
+      # The modification time doubles as the last use time for eviction.
+      os.utime(path, None)
+    except OSError:
+      pass
+    return data
+
+  def Put(self, key, data):
+    self._Store(key, lambda entry_file: entry_file.write(data))
+
+  def PutFile(self, key, file_name):
+    # Like Put, with the data copied from a file a piece at a time.
+    with open(file_name, "rb") as data_file:
+      self._Store(key, lambda entry_file: shutil.copyfileobj(
+          data_file, entry_file))
+
+  def _Store(self, key, write):
+    path = self._Path(key)
+    directory = os.path.dirname(path)
+    try:
+      os.makedirs(directory)
+    except OSError as error:
+      if error.errno != errno.EEXIST:
+        raise
+    fd, temp_path = tempfile.mkstemp(prefix=".tmp-", dir=directory)
+    try:
+      with os.fdopen(fd, "wb") as entry_file:
+        write(entry_file)
+      os.rename(temp_path, path)
+    except:
+      os.remove(temp_path)
+      raise
+
+  def Trim(self):
+    entries = []
+    total_size = 0
+    now = time.time()
+    for directory, subdirectories, file_names in os.walk(self.directory):
+      if directory == self.directory:
+        # Only the directories of entries, see _Path. Others, like the
+        # parsers/ of parser_generator, are not ours to evict from.
+        subdirectories[:] = [name for name in subdirectories
+                             if _RE_ENTRY_DIRECTORY.match(name)]
+        continue
+      for file_name in file_names:
+        path = os.path.join(directory, file_name)
+        try:
+          stat = os.stat(path)
+        except OSError:
+          # Removed by another process while we were walking.
+          continue
+        if file_name.startswith(".tmp-"):
+          if now - stat.st_mtime > _STALE_TEMP_AGE:
+            self._Remove(path)
+          continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+        total_size += stat.st_size
+
+    entries.sort()
+    for _, size, path in entries:
+      if total_size <= self.max_size:
+        break
+      self._Remove(path)
+      total_size -= size
+
+  def TrimIfDue(self, interval=_TRIM_INTERVAL):
+    # Trim walks every entry, which costs more than a build that is mostly
+    # cache hits, so builds only trim if no one did for a while. Returns
+    # whether it trimmed.
+    stamp_path = os.path.join(self.directory, _TRIM_STAMP)
+    try:
+      if time.time() - os.path.getmtime(stamp_path) < interval:
+        return False
+    except OSError:
+      pass
+    try:
+      # Touched first, so that concurrent builds do not all trim at once.
+      with open(stamp_path, "a"):
+        pass
+      os.utime(stamp_path, None)
+    except (IOError, OSError):
+      pass
+    self.Trim()
+    return True
+
+  def _Path(self, key):
+    return os.path.join(self.directory, key[:2], key[2:])
+
+  def _Remove(self, path):
+    try:
+      os.remove(path)
+    except OSError:
+      pass
+
+
+class MemoryCache(object):
+
+  # Keeps the most recently used entries of another cache in memory. It is
+  # meant for long running processes and is safe to use from several threads.
+
+  def __init__(self, backing_cache, max_entries=4096):
+    self.backing_cache = backing_cache
+    self.max_entries = max_entries
+    self.entries = collections.OrderedDict()
+    self.lock = threading.Lock()
+
+  def Key(self, source, kind="vm", context=""):
+    return self.backing_cache.Key(source, kind, context)
+
+  def Get(self, key):
+    with self.lock:
+      data = self.entries.pop(key, None)
+      if data is not None:
+        self.entries[key] = data
+        return data
+    data = self.backing_cache.Get(key)
+    if data is not None:
+      self._Remember(key, data)
+    return data
+
+  def Put(self, key, data):
+    self._Remember(key, data)
+    self.backing_cache.Put(key, data)
+
+  def PutFile(self, key, file_name):
+    # The entry is kept in memory anyway.
+    with open(file_name, "rb") as data_file:
+      self.Put(key, data_file.read())
+
+  def Trim(self):
+    self.backing_cache.Trim()
+
+  def TrimIfDue(self, interval=_TRIM_INTERVAL):
+    return self.backing_cache.TrimIfDue(interval)
+
+  def _Remember(self, key, data):
+    with self.lock:
+      self.entries.pop(key, None)
+      self.entries[key] = data
+      while len(self.entries) > self.max_entries:
+        self.entries.popitem(last=False)
@@ -0,0 +1,153 @@
+#!/usr/bin/python
+#
+# Copyright (c) 2011 Ivan Vladimirov Ivanov (ivan.vladimirov.ivanov@gmail.com)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+
+
+__author__ = "Ivan Vladimirov Ivanov (ivan.vladimirov.ivanov@gmail.com)"
+
+
+# This module is the thin front end of compile_server.py. The server imports
+# it too, so only main, which shares its options and file lookup with
+# jack_compiler.py and may have to fall back to compiling in-process, imports
+# the compiler.
+
+import json
+import optparse
+import os
+import socket
+import stat
+import tempfile
+
+
+def DefaultSocketPath():
+  # Kept out of the shared temporary directory itself, where another user
+  # could create the socket first and stand in for the server.
+  directory = os.environ.get("XDG_RUNTIME_DIR")
+  if not directory:
+    directory = os.path.join(
+        tempfile.gettempdir(), "jack_compiler-%d" % (os.getuid(),))
+  return os.path.join(directory, "jack_compiler.sock")
+
+
+def CheckOwner(path):
+  # Raises socket.error if path exists and belongs to another user. Returns
+  # the result of lstat, or None if there is nothing at path.
+  try:
+    info = os.lstat(path)
+  except OSError:
+    return None
+  if info.st_uid != os.getuid():
+    raise socket.error("%s belongs to another user" % (path,))
+  return info
+
+
+def MakePrivateDirectory(directory):
+  # Creates the directory the socket goes into, readable and writable by
+  # this user only, or makes sure an existing one is. Raises socket.error.
+  try:
+    os.makedirs(directory, 0700)
+  except OSError:
+    pass
+  info = CheckOwner(directory)
+  if info is None or not stat.S_ISDIR(info.st_mode):
+    raise socket.error("Can not create the directory " + directory)
+  if info.st_mode & (stat.S_IRWXG | stat.S_IRWXO):
+    raise socket.error("%s is accessible to other users" % (directory,))
+
+
+class CompileClient(object):
+
+  def __init__(self, socket_path):
+    CheckOwner(socket_path)
+    self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    self.socket.connect(socket_path)
+    self.reader = self.socket.makefile("rb")
+    self.writer = self.socket.makefile("wb")
+
+  def Close(self):
+    self.reader.close()
+    self.writer.close()
+    self.socket.close()
+
+  def Request(self, request):
+    self.writer.write(json.dumps(request) + "\n")
+    self.writer.flush()
+    line = self.reader.readline()
+    if not line:
+      raise socket.error("Compile server closed the connection.")
+    return json.loads(line)
+
+  def CompileSource(self, program):
+    return self.Request({"source": program})
+
+  def CompileFile(self, file_name):
+    response = self.Request({"file": os.path.abspath(file_name)})
+    if "error" in response:
+      return response["error"]
+    try:
+      with open(file_name[:-4] + "vm", "w") as output_file:
+        output_file.write(response["vm"])
+    except IOError as error:
+      return str(error)
+    return None
+
+
+def main():
+  import jack_compiler
+  parser = optparse.OptionParser(
+      usage="%prog [options] FILE_OR_DIRECTORY")
+  parser.add_option(
+      "--socket", default=DefaultSocketPath(),
+      help="socket of the compile server (default: %default)")
+  # The cache options only matter when there is no server to compile with.
+  jack_compiler.AddCacheOptions(parser)
+  options, args = parser.parse_args()
+
+  if len(args) != 1:
+    print "Please enter the name of a file or directory which to compile."
+    return
+
+  if not os.path.exists(args[0]):
+    print "Argument is not a valid file or directory."
+    return
+
+  file_names = jack_compiler.FindJackFiles(args[0])
+  try:
+    client = CompileClient(options.socket)
+  except socket.error:
+    # No server is running, so pay the start-up cost once in this process.
+    cache = jack_compiler.CacheFromOptions(options)
+    errors = jack_compiler.CompileFiles(file_names, cache=cache)
+    if cache:
+      cache.TrimIfDue()
+  else:
+    try:
+      errors = [client.CompileFile(file_name) for file_name in file_names]
+    finally:
+      client.Close()
+
+  for error in errors:
+    if error:
+      print error
+
+
+if __name__ == "__main__":
+  main()
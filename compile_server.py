@@ -0,0 +1,211 @@
+#!/usr/bin/python
+#
+# Copyright (c) 2011 Ivan Vladimirov Ivanov (ivan.vladimirov.ivanov@gmail.com)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+
+
+__author__ = "Ivan Vladimirov Ivanov (ivan.vladimirov.ivanov@gmail.com)"
+
+
+import json
+import optparse
+import os
+import socket
+import SocketServer
+import stat
+import threading
+import time
+
+import class_interface
+import compilation_cache
+import compile_client
+import jack_compiler
+import parser_generator
+
+
+# How often, in seconds, the server trims the on-disk cache.
+_TRIM_INTERVAL = 10 * 60
+
+
+class _Project(object):
+
+  # The interfaces of the .jack files of a directory, kept from one request
+  # to the next. A request only stats the files, and the index of the
+  # project is built again only once one of them is added, removed or
+  # changes its modification time or size.
+
+  def __init__(self, directory):
+    self.directory = directory
+    # File name -> (modification time, size, class_interface.Interface)
+    self.files = {}
+    self.signatures = None
+    self.lock = threading.Lock()
+
+  def Signatures(self, cache=None):
+    with self.lock:
+      files = {}
+      changed = self.signatures is None
+      for file_name in jack_compiler.FindJackFiles(self.directory):
+        try:
+          info = os.stat(file_name)
+        except OSError:
+          continue
+        entry = self.files.get(file_name)
+        if entry is None or entry[:2] != (info.st_mtime, info.st_size):
+          try:
+            interface = class_interface.LoadInterface(file_name, cache)
+          except IOError:
+            continue
+          entry = (info.st_mtime, info.st_size, interface)
+          changed = True
+        files[file_name] = entry
+      if changed or len(files) != len(self.files):
+        self.signatures = jack_compiler.InterfaceSignatures(
+            files[file_name][2] for file_name in sorted(files))
+      self.files = files
+      return self.signatures
+
+
+class _CompileRequestHandler(SocketServer.StreamRequestHandler):
+
+  # A connection carries any number of requests, each a JSON object on its
+  # own line, and every request is answered with one JSON line.
+
+  def handle(self):
+    while True:
+      line = self.rfile.readline()
+      if not line:
+        return
+      try:
+        response = self.server.Compile(json.loads(line))
+      except ValueError as error:
+        response = {"error": "Malformed request: %s" % (error,)}
+      self.wfile.write(json.dumps(response) + "\n")
+      self.wfile.flush()
+
+
+class CompileServer(SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+
+  daemon_threads = True
+
+  def __init__(self, socket_path, cache=None):
+    self.socket_path = socket_path
+    self.cache = cache
+    # Directory -> _Project
+    self.projects = {}
+    self.projects_lock = threading.Lock()
+    compile_client.MakePrivateDirectory(
+        os.path.dirname(os.path.abspath(socket_path)))
+    if self._IsServing():
+      raise socket.error("A compile server is already listening on " +
+                         socket_path)
+    self._RemoveStaleSocket()
+    SocketServer.UnixStreamServer.__init__(
+        self, socket_path, _CompileRequestHandler)
+    # Load the generated parser now instead of on the first request.
+    parser_generator.GeneratedParser.Default(flat=True)
+
+  def Compile(self, request):
+    file_name = request.get("file", "<source>")
+    try:
+      if "source" in request:
+        program = request["source"].encode("utf-8")
+      else:
+        with open(file_name, "r") as program_file:
+          program = program_file.read()
+      # The calls of a file are checked against the classes of its
+      # directory, the project a build of that directory would compile.
+      signatures = None
+      if "file" in request:
+        signatures = self._Project(
+            os.path.dirname(os.path.abspath(file_name))).Signatures(
+                self.cache)
+      try:
+        return {"vm": jack_compiler.CompileSource(
+            program, self.cache, signatures=signatures)}
+      except jack_compiler.COMPILE_ERRORS as error:
+        return {"error": jack_compiler.FormatError(file_name, program, error)}
+    except IOError as error:
+      return {"error": str(error)}
+    except Exception as error:
+      return {"error": "%s: internal compiler error: %r" % (file_name, error)}
+
+  def _Project(self, directory):
+    with self.projects_lock:
+      project = self.projects.get(directory)
+      if project is None:
+        project = self.projects[directory] = _Project(directory)
+      return project
+
+  def server_close(self):
+    SocketServer.UnixStreamServer.server_close(self)
+    self._RemoveStaleSocket()
+
+  def _IsServing(self):
+    try:
+      compile_client.CompileClient(self.socket_path).Close()
+      return True
+    except socket.error:
+      return False
+
+  def _RemoveStaleSocket(self):
+    # A socket of another user is left alone, and CheckOwner raises.
+    info = compile_client.CheckOwner(self.socket_path)
+    if info is not None and stat.S_ISSOCK(info.st_mode):
+      try:
+        os.remove(self.socket_path)
+      except OSError:
+        pass
+
+
+def _TrimPeriodically(cache):
+  while True:
+    time.sleep(_TRIM_INTERVAL)
+    cache.Trim()
+
+
+def main():
+  parser = optparse.OptionParser(usage="%prog [options]")
+  parser.add_option(
+      "--socket", default=compile_client.DefaultSocketPath(),
+      help="socket to listen on (default: %default)")
+  jack_compiler.AddCacheOptions(parser)
+  options, _ = parser.parse_args()
+
+  cache = jack_compiler.CacheFromOptions(options)
+  if cache:
+    cache = compilation_cache.MemoryCache(cache)
+    trimmer = threading.Thread(target=_TrimPeriodically, args=(cache,))
+    trimmer.daemon = True
+    trimmer.start()
+
+  server = CompileServer(options.socket, cache)
+  try:
+    server.serve_forever()
+  except KeyboardInterrupt:
+    pass
+  finally:
+    server.server_close()
+    if cache:
+      cache.Trim()
+
+
+if __name__ == "__main__":
+  main()
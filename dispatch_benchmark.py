@@ -0,0 +1,114 @@
+#!/usr/bin/python
+#
+# Copyright (c) 2011 Ivan Vladimirov Ivanov (ivan.vladimirov.ivanov@gmail.com)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+
+
+__author__ = "Ivan Vladimirov Ivanov (ivan.vladimirov.ivanov@gmail.com)"
+
+
+# Compares finding the method for a node by building its name, the way the
+# code generator used to, with looking it up in the code generator's table
+# of handlers, and times whole passes over a generated class.
+
+import optparse
+import time
+
+import ast_memory_benchmark
+import jack_to_vm_compiler
+import jack_xml_serializer
+import lexical_analyser
+import node_dispatch
+import parser_generator
+
+
+def CollectNodes(tree):
+  nodes = []
+  stack = [tree]
+  model_types = tuple(node_dispatch.MODEL_TYPES)
+  while stack:
+    value = stack.pop()
+    if isinstance(value, (list, tuple)):
+      stack.extend(value)
+    elif isinstance(value, model_types):
+      nodes.append(value)
+      stack.extend(getattr(value, name) for name in value.__slots__)
+  return nodes
+
+
+def _Time(function, repeat):
+  start = time.time()
+  for _ in xrange(repeat):
+    function()
+  return (time.time() - start) / repeat
+
+
+def main():
+  parser = optparse.OptionParser(usage="%prog [options] [FILE]")
+  parser.add_option(
+      "-n", "--subroutines", type="int", default=200,
+      help="size of the generated class timed when no file is given "
+           "(default: %default)")
+  parser.add_option(
+      "-r", "--repeat", type="int", default=10,
+      help="number of times every measurement is repeated "
+           "(default: %default)")
+  options, args = parser.parse_args()
+
+  if args:
+    with open(args[0]) as program_file:
+      program = program_file.read()
+  else:
+    program = ast_memory_benchmark.GenerateProgram(options.subroutines)
+  tokens = lexical_analyser.LexicalAnalyser.TokenizeToArray(program)
+
+  for flat in (False, True):
+    tree = parser_generator.GeneratedParser.Parse(tokens, flat=flat)
+    nodes = CollectNodes(tree)
+    compiler = jack_to_vm_compiler.JackToVMCompiler()
+
+    def ByName():
+      for node in nodes:
+        getattr(compiler, "Compile" + node.__class__.__name__, None)
+
+    def ByType():
+      handlers = compiler.handlers
+      for node in nodes:
+        handlers[node.__class__]
+
+    by_name = _Time(ByName, options.repeat)
+    by_type = _Time(ByType, options.repeat)
+    label = "flat" if flat else "full"
+    print "%s: %d nodes, %.0f ns per node by name, %.0f ns by type" % (
+        label, len(nodes), by_name / len(nodes) * 1e9,
+        by_type / len(nodes) * 1e9)
+
+    compile_time = _Time(
+        lambda: jack_to_vm_compiler.JackToVMCompiler().CompileVMCode(tree),
+        options.repeat)
+    serialize_time = _Time(
+        lambda: jack_xml_serializer.JackXMLSerializer().Serialize(tree),
+        options.repeat)
+    print "%s: %.1f ms to compile, %.1f ms to serialize" % (
+        label, compile_time * 1e3, serialize_time * 1e3)
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,154 @@
+#!/usr/bin/python
+#
+# Copyright (c) 2011 Ivan Vladimirov Ivanov (ivan.vladimirov.ivanov@gmail.com)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+
+
+__author__ = "Ivan Vladimirov Ivanov (ivan.vladimirov.ivanov@gmail.com)"
+
+
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import time
+
+
+_IN_MODIFY = 0x00000002
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_FROM = 0x00000040
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_DELETE = 0x00000200
+_IN_Q_OVERFLOW = 0x00004000
+
+_WATCH_MASK = (_IN_MODIFY | _IN_CLOSE_WRITE | _IN_MOVED_FROM | _IN_MOVED_TO |
+               _IN_CREATE | _IN_DELETE)
+
+# struct inotify_event without its variable length name.
+_EVENT_HEADER = struct.Struct("iIII")
+
+
+def _ListFiles(directory, suffix):
+  # A directory that is gone has no files.
+  try:
+    names = os.listdir(directory)
+  except OSError:
+    return []
+  return [os.path.join(directory, name) for name in names
+          if name.endswith(suffix)]
+
+
+class InotifyWatcher(object):
+
+  # Once the kernel's event queue overflows, events were lost and any file
+  # may have changed, so every file there is or was is reported.
+
+  def __init__(self, directory, suffix):
+    self.directory = directory
+    self.suffix = suffix
+    # The files seen so far, which are all there might have been to remove.
+    self.files = set(_ListFiles(directory, suffix))
+    libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6",
+                       use_errno=True)
+    self.fd = libc.inotify_init()
+    if self.fd < 0:
+      raise OSError(ctypes.get_errno(), "inotify_init failed")
+    if libc.inotify_add_watch(self.fd, directory, _WATCH_MASK) < 0:
+      error = ctypes.get_errno()
+      os.close(self.fd)
+      raise OSError(error, "inotify_add_watch failed", directory)
+
+  def Close(self):
+    os.close(self.fd)
+
+  def Wait(self, timeout=None):
+    readable, _, _ = select.select([self.fd], [], [], timeout)
+    if not readable:
+      return set()
+
+    return self._Changes(os.read(self.fd, 64 * 1024))
+
+  def _Changes(self, data):
+    changed = set()
+    pos = 0
+    while pos < len(data):
+      _, mask, _, name_length = _EVENT_HEADER.unpack_from(data, pos)
+      pos += _EVENT_HEADER.size
+      name = data[pos:pos + name_length].rstrip("\0")
+      pos += name_length
+      if mask & _IN_Q_OVERFLOW:
+        files = set(_ListFiles(self.directory, self.suffix))
+        changed |= self.files | files
+        self.files = files
+      elif name.endswith(self.suffix):
+        file_name = os.path.join(self.directory, name)
+        changed.add(file_name)
+        self.files.add(file_name)
+    return changed
+
+
+class PollingWatcher(object):
+
+  def __init__(self, directory, suffix, interval=0.5):
+    self.directory = directory
+    self.suffix = suffix
+    self.interval = interval
+    self.mtimes = self._Scan()
+
+  def Close(self):
+    pass
+
+  def Wait(self, timeout=None):
+    deadline = None if timeout is None else time.time() + timeout
+    while True:
+      mtimes = self._Scan()
+      changed = set(
+          file_name for file_name in set(mtimes) | set(self.mtimes)
+          if mtimes.get(file_name) != self.mtimes.get(file_name))
+      self.mtimes = mtimes
+      if changed:
+        return changed
+      if deadline is None:
+        time.sleep(self.interval)
+      else:
+        remaining = deadline - time.time()
+        if remaining <= 0:
+          return changed
+        time.sleep(min(self.interval, remaining))
+
+  def _Scan(self):
+    mtimes = {}
+    for file_name in _ListFiles(self.directory, self.suffix):
+      try:
+        stat = os.stat(file_name)
+      except OSError:
+        continue
+      mtimes[file_name] = (stat.st_mtime, stat.st_size)
+    return mtimes
+
+
+def CreateWatcher(directory, suffix):
+  try:
+    return InotifyWatcher(directory, suffix)
+  except (AttributeError, OSError):
+    # No inotify on this platform, or we ran out of watches.
+    return PollingWatcher(directory, suffix)
@@ -0,0 +1,133 @@
+#!/usr/bin/python
+#
+# Copyright (c) 2011 Ivan Vladimirov Ivanov (ivan.vladimirov.ivanov@gmail.com)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+
+
+__author__ = "Ivan Vladimirov Ivanov (ivan.vladimirov.ivanov@gmail.com)"
+
+
+import bisect
+
+import jack_lang_model
+import lexical_analyser
+import parser_generator
+import syntax_analyser
+import token_stream
+
+
+def Diff(old, new):
+  # Returns (start, end, text) such that replacing old[start:end] with text
+  # gives new. The common prefix and suffix are found by binary search on
+  # slice comparisons, which run in C.
+  length = min(len(old), len(new))
+  low, high = 0, length
+  while low < high:
+    middle = (low + high + 1) // 2
+    if old[:middle] == new[:middle]:
+      low = middle
+    else:
+      high = middle - 1
+  prefix = low
+
+  low, high = 0, length - prefix
+  while low < high:
+    middle = (low + high + 1) // 2
+    if old[len(old) - middle:] == new[len(new) - middle:]:
+      low = middle
+    else:
+      high = middle - 1
+  suffix = low
+  return prefix, len(old) - suffix, new[prefix:len(new) - suffix]
+
+
+class IncrementalClass(object):
+
+  # The source and tree of a class, together with the offset at which each
+  # of its subroutines starts. An edit that stays inside one subroutine is
+  # relexed and reparsed from the start of that subroutine up to the start
+  # of the next one, and the new SubroutineDec replaces the old one in a
+  # copy of the Class. Anything else reparses the whole class.
+
+  def __init__(self, source, flat=False):
+    self.source = source
+    self.flat = flat
+    self.tree, self.starts, self.end = self._ParseClass(source)
+
+  def Edit(self, start, end, text):
+    # Replaces source[start:end] with text. Returns whether only a single
+    # subroutine had to be reparsed. Errors leave the class as it was.
+    source = self.source[:start] + text + self.source[end:]
+    delta = len(text) - (end - start)
+
+    subroutine = None
+    index = bisect.bisect_right(self.starts, start) - 1
+    if index >= 0:
+      if index + 1 < len(self.starts):
+        stop = self.starts[index + 1]
+      else:
+        stop = self.end
+      if end <= stop:
+        subroutine = self._ParseSubroutine(
+            source, self.starts[index], stop + delta)
+
+    if subroutine is None:
+      self.tree, self.starts, self.end = self._ParseClass(source)
+      self.source = source
+      return False
+
+    subroutine_decs = list(self.tree.subroutine_decs)
+    subroutine_decs[index] = subroutine
+    self.tree = jack_lang_model.Class(
+        self.tree.class_name, self.tree.class_var_decs, subroutine_decs)
+    for i in xrange(index + 1, len(self.starts)):
+      self.starts[i] += delta
+    self.end += delta
+    self.source = source
+    return True
+
+  def _ParseClass(self, source):
+    tokens = lexical_analyser.LexicalAnalyser.TokenizeToArray(source)
+    tree = parser_generator.GeneratedParser.Parse(tokens, flat=self.flat)
+    subroutines, class_end = token_stream.SplitClass(tokens)
+    starts = [tokens.offsets[first] for first, _ in subroutines]
+    return tree, starts, tokens.offsets[class_end]
+
+  def _ParseSubroutine(self, source, start, stop):
+    # The tokens from start are only the ones a full relex would produce if
+    # one of them begins exactly at stop, where the unchanged text resumes.
+    # Otherwise, e.g. when the edit opened a comment or glued two words
+    # together, we give up and None makes the caller reparse everything.
+    tokens = token_stream.TokenArray()
+    try:
+      for kind, value, offset in lexical_analyser.LexicalAnalyser._Scan(
+          source, start):
+        if offset >= stop:
+          break
+        tokens.Append(kind, value, offset)
+      else:
+        return None
+      if offset != stop:
+        return None
+      return parser_generator.GeneratedParser.Parse(
+          tokens, "SubroutineDec", self.flat)
+    except (lexical_analyser.LexicalError, syntax_analyser.SyntacticError):
+      # Reported by the full reparse, with the message it would give.
+      return None
@@ -24,53 +24,554 @@
 __author__ = "Ivan Vladimirov Ivanov (ivan.vladimirov.ivanov@gmail.com)"
 
 
+import contextlib
+import cStringIO
+import functools
+import multiprocessing
+import optparse
 import os
+import re
 import sys
 
+import ast_cache
+import class_interface
+import compilation_cache
+import file_watcher
+import incremental_parser
+import jack_lang_model
 import jack_to_vm_compiler
 import lexical_analyser
+import line_index
+import name_resolver
+import node_dispatch
+import parser_generator
+import predictive_parser
+import signature_index
+import symbol_table
 import syntax_analyser
+import token_stream
 
 
-def CompileFile(file_name):
+# Any change to these modules can change the generated code, so their
+# sources make up the version the compilation cache is keyed by.
+_COMPILER_MODULES = [
+    ast_cache,
+    jack_lang_model,
+    jack_to_vm_compiler,
+    lexical_analyser,
+    name_resolver,
+    node_dispatch,
+    parser_generator,
+    predictive_parser,
+    signature_index,
+    symbol_table,
+    syntax_analyser,
+    token_stream
+]
+
+
+def CompilerVersion():
+  return compilation_cache.Fingerprint(_COMPILER_MODULES)
+
+
+COMPILE_ERRORS = (
+    lexical_analyser.LexicalError,
+    syntax_analyser.SyntacticError,
+    jack_to_vm_compiler.CodeGenerationError
+)
+
+
+def FormatError(file_name, program, error):
+  # Lexical errors already name their line.
+  offset = getattr(error, "offset", None)
+  if offset is None or isinstance(error, lexical_analyser.LexicalError):
+    return "%s: %s" % (file_name, error.message)
+  line, column = line_index.LineIndex(program).Position(offset)
+  return "%s:%d:%d: %s" % (file_name, line, column, error.message)
+
+
+# Classes with fewer subroutines are compiled in one piece even when a pool
+# is available, splitting them costs more than it saves.
+_MIN_SPLIT_SUBROUTINES = 8
+
+# The words of a source that may name a class, see _CacheKey.
+_RE_IDENTIFIER = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+
+
+@contextlib.contextmanager
+def _ReportDeepNesting():
+  # The parser handles any depth, but code generation recurses once per
+  # level of nesting, and too many levels are reported like any other
+  # error in the program.
   try:
-    with open(file_name, "r") as program_file:
-      program = "".join(program_file.readlines())
-      tokens = lexical_analyser.LexicalAnalyser.Tokenize(program)
-      tree = syntax_analyser.SyntaxAnalyser.Parse(tokens)
-      compiler = jack_to_vm_compiler.JackToVMCompiler()
-      serialized_program = compiler.CompileVMCode(tree)
-      with open(file_name[:-4] + "vm", "w") as output_file:
-        output_file.write(serialized_program)
-  except lexical_analyser.LexicalError as error:
-    print error.messagei
+    yield
+  except RuntimeError as error:
+    if "recursion" not in str(error):
+      raise
+    raise jack_to_vm_compiler.CodeGenerationError(
+        "Expression nested too deeply")
+
+
+def _CompileSubroutineInWorker(work):
+  # Errors are returned rather than raised, so that the caller can report
+  # the one a whole class compilation would have. Our exceptions do not
+  # survive pickling, so every outcome is a (kind, value, offset) tuple.
+  class_name, env, signatures, tokens = work
+  try:
+    subroutine = parser_generator.GeneratedParser.Parse(
+        tokens, "SubroutineDec", flat=True)
   except syntax_analyser.SyntacticError as error:
-    print error.message
+    return ("syntax", "Can't parse Class" + os.linesep + error.message,
+            error.offset)
+  compiler = jack_to_vm_compiler.JackToVMCompiler(signatures)
+  compiler.class_name = class_name
+  try:
+    with _ReportDeepNesting():
+      compiler.CompileSubroutineDec(subroutine, env)
+    return ("vm", compiler.writer.lines, None)
   except jack_to_vm_compiler.CodeGenerationError as error:
-    print error.message
-  except IOError as error:
-    print error
+    return ("code", error.message, None)
+
+
+def _CompileSubroutinesInWorker(chunk):
+  return [_CompileSubroutineInWorker(work) for work in chunk]
+
+
+def _CompileClassOnPool(tokens, subroutines, class_end, signatures, pool,
+                        output_file):
+  # The class variables are compiled first, into the symbol table every
+  # subroutine starts from.
+  header = tokens.Slice((0, subroutines[0][0]), (class_end, len(tokens)))
+  try:
+    jack_class = parser_generator.GeneratedParser.Parse(header, flat=True)
+    env = symbol_table.SymbolTable(None)
+    compiler = jack_to_vm_compiler.JackToVMCompiler(signatures, output_file)
+    compiler.CompileClass(jack_class, env)
+  except COMPILE_ERRORS as error:
+    # The header holds the tokens after the class too, so a syntax error in
+    # a subroutine may come before its error. Parsing the whole class finds
+    # the same error as compiling it in one piece would.
+    parser_generator.GeneratedParser.Parse(tokens, flat=True)
+    raise error
+
+  work = [(jack_class.class_name, env, signatures, tokens.Slice(subroutine))
+          for subroutine in subroutines]
+  # Chunks as big as map() would make them, a few for every process. The
+  # chunks are made here, since imap() only takes a timeout without them.
+  size = max(1, len(work) // (4 * multiprocessing.cpu_count()))
+  chunks = [work[start:start + size] for start in xrange(0, len(work), size)]
+  outcomes = pool.imap(_CompileSubroutinesInWorker, chunks)
+
+  # The subroutines are written in order as they arrive. The whole class is
+  # parsed before any of it is compiled, so a syntax error anywhere wins
+  # over a code generation error, and either leaves the output unfinished.
+  errors = {}
+  for _ in xrange(len(chunks)):
+    # A timeout keeps the parent interruptible with Ctrl-C.
+    for kind, value, offset in outcomes.next(sys.maxint):
+      if kind != "vm":
+        errors.setdefault(kind, (value, offset))
+      elif not errors:
+        compiler.writer.lines.extend(value)
+    compiler.writer.Flush()
+  if "syntax" in errors:
+    raise syntax_analyser.SyntacticError(*errors["syntax"])
+  if "code" in errors:
+    raise jack_to_vm_compiler.CodeGenerationError(errors["code"][0])
+
+
+def _CacheKey(program, cache, signatures):
+  # Calls are checked against the other classes, so the output is only
+  # valid for as long as their signatures stay the same. A call names its
+  # class, or a variable whose type does, so only the classes named in the
+  # source count, and changing one class does not invalidate every file.
+  context = ""
+  if signatures:
+    context = signatures.DigestOf(_RE_IDENTIFIER.findall(program))
+  return cache.Key(program, context=context)
+
+
+def WriteSource(program, output_file, pool=None, signatures=None):
+  # Compiles program and writes its code to output_file as it goes. After
+  # an error the output holds the code of some subroutines only.
+  tokens = lexical_analyser.LexicalAnalyser.TokenizeToArray(program)
+  signatures = signature_index.SignatureIndex(
+      signatures or signature_index.OS_INDEX)
+  class_signatures = signature_index.TokenSignatures(tokens)
+  if class_signatures:
+    signatures.AddClass(*class_signatures)
+  split = token_stream.SplitClass(tokens) if pool else None
+  if split and len(split[0]) >= _MIN_SPLIT_SUBROUTINES:
+    _CompileClassOnPool(
+        tokens, split[0], split[1], signatures, pool, output_file)
+  else:
+    tree = parser_generator.GeneratedParser.Parse(tokens, flat=True)
+    compiler = jack_to_vm_compiler.JackToVMCompiler(signatures)
+    with _ReportDeepNesting():
+      compiler.WriteVMCode(tree, output_file)
+
+
+def CompileSource(program, cache=None, pool=None, signatures=None):
+  # signatures is the SignatureIndex of the project the program is part of,
+  # the OS classes are always known.
+  if cache:
+    key = _CacheKey(program, cache, signatures)
+    serialized_program = cache.Get(key)
+    if serialized_program is not None:
+      return serialized_program
+
+  output_file = cStringIO.StringIO()
+  WriteSource(program, output_file, pool, signatures)
+  serialized_program = output_file.getvalue()
+
+  if cache:
+    try:
+      cache.Put(key, serialized_program)
+    except (IOError, OSError):
+      # An unwritable cache only costs us the next build's time.
+      pass
+  return serialized_program
+
+
+def ParseSource(program, cache=None, flat=False):
+  # For tools that only need the tree of a class, such as the XML
+  # serializer. The tree is cached instead of the generated code.
+  if cache:
+    key = cache.Key(program, "flat-ast" if flat else "ast")
+    data = cache.Get(key)
+    if data is not None:
+      try:
+        return ast_cache.Loads(data)
+      except ast_cache.AstCacheError:
+        pass
+
+  tokens = lexical_analyser.LexicalAnalyser.TokenizeToArray(program)
+  tree = parser_generator.GeneratedParser.Parse(tokens, flat=flat)
+
+  if cache:
+    try:
+      cache.Put(key, ast_cache.Dumps(tree))
+    except (IOError, OSError):
+      pass
+    except (RuntimeError, ValueError):
+      # Too deeply nested to serialize, parsing it again will have to do.
+      pass
+  return tree
+
+
+def CompileFile(file_name, cache=None, pool=None, signatures=None):
+  # The code is written to the .vm file as it is compiled, and the cache
+  # is filled from that file.
+  output_name = file_name[:-4] + "vm"
+  try:
+    with open(file_name, "rb") as program_file:
+      with lexical_analyser.MapFile(program_file) as program:
+        if cache:
+          key = _CacheKey(program, cache, signatures)
+          serialized_program = cache.Get(key)
+          if serialized_program is not None:
+            with compilation_cache.ReplaceFile(output_name) as output_file:
+              output_file.write(serialized_program)
+            return None
+        try:
+          with compilation_cache.ReplaceFile(
+              output_name) as output_file:
+            WriteSource(program, output_file, pool, signatures)
+        except COMPILE_ERRORS as error:
+          return FormatError(file_name, program, error)
+  except (IOError, OSError) as error:
+    return str(error)
+
+  if cache:
+    try:
+      cache.PutFile(key, output_name)
+    except (IOError, OSError):
+      pass
+  return None
+
+
+def _CompileFileInWorker(file_name, cache=None, pool=None, signatures=None):
+  # A bug in one file must not take down the rest of the build, so anything
+  # CompileFile does not handle itself is reported as that file's error.
+  try:
+    return CompileFile(file_name, cache, pool, signatures)
+  except Exception as error:
+    return "%s: internal compiler error: %r" % (file_name, error)
+
+
+def InterfaceSignatures(interfaces):
+  # The SignatureIndex of the classes of the OS and of the interfaces, in
+  # that order. Malformed classes have None for an interface and are left
+  # out, compiling them reports why.
+  signatures = signature_index.SignatureIndex(signature_index.OS_INDEX)
+  for interface in interfaces:
+    if interface is not None:
+      signatures.AddClass(interface.class_name, interface.subroutines)
+  return signatures
+
+
+def ProjectSignatures(file_names, cache=None):
+  # The SignatureIndex of the classes of the files and of the OS. Files that
+  # can not be read are left out too.
+  interfaces = []
+  for file_name in file_names:
+    try:
+      interfaces.append(class_interface.LoadInterface(file_name, cache))
+    except IOError:
+      pass
+  return InterfaceSignatures(interfaces)
+
+
+def WriteInterfaces(file_names):
+  # Brings the .jacki file next to every file up to date, returning an
+  # error message or None for each.
+  errors = []
+  for file_name in file_names:
+    try:
+      interface = class_interface.WriteInterfaceFile(file_name)
+    except IOError as error:
+      errors.append(str(error))
+      continue
+    if interface is None:
+      errors.append("%s: malformed class declarations" % (file_name,))
+    else:
+      errors.append(None)
+  return errors
+
+
+# The keyword arguments _CompileFileInPool passes on, set by
+# _InitializeWorker in every pool process.
+_worker_arguments = {}
+
+
+def _InitializeWorker(cache, signatures):
+  # The cache and the project's signatures are sent once to every process,
+  # rather than pickled again with every file.
+  _worker_arguments.update(cache=cache, signatures=signatures)
+
+
+def _CompileFileInPool(file_name):
+  return _CompileFileInWorker(file_name, **_worker_arguments)
+
+
+def CompileFiles(file_names, jobs=0, cache=None):
+  if jobs <= 0:
+    jobs = multiprocessing.cpu_count()
+  signatures = ProjectSignatures(file_names, cache)
+  worker = functools.partial(_CompileFileInWorker, cache=cache,
+                             signatures=signatures)
+  if jobs <= 1 or not file_names:
+    return [worker(file_name) for file_name in file_names]
+
+  pool = multiprocessing.Pool(jobs, _InitializeWorker, (cache, signatures))
+  try:
+    if len(file_names) < jobs:
+      # Too few files to keep every worker busy, so the files are compiled
+      # one at a time and their subroutines go to the pool instead.
+      return [worker(file_name, pool=pool) for file_name in file_names]
+    # map_async().get() with a timeout keeps the parent interruptible with
+    # Ctrl-C, a plain map() blocks signals until every worker is done.
+    results = pool.map_async(_CompileFileInPool, file_names, chunksize=1)
+    return results.get(sys.maxint)
+  finally:
+    pool.terminate()
+    pool.join()
+
+
+def FindJackFiles(path):
+  if os.path.isdir(path):
+    return sorted(os.path.join(path, file_name)
+                  for file_name in os.listdir(path)
+                  if file_name.endswith(".jack"))
+  elif os.path.isfile(path) and path.endswith(".jack"):
+    return [path]
+  else:
+    return []
+
+
+# How long a directory has to stay quiet after a change before we recompile,
+# so that editors saving several files at once trigger a single rebuild.
+_DEBOUNCE_DELAY = 0.1
+
+
+class WatchSession(object):
+
+  # Keeps an IncrementalClass for every file it has compiled, so a change
+  # costs one file's compilation and unchanged files stay parsed. Calls are
+  # checked against the interfaces of the project's files, the way a build
+  # of the whole directory checks them, so a file whose interface changes
+  # leaves the others to be checked again, see Recheck.
+
+  def __init__(self, file_names=()):
+    self.files = {}
+    self.interfaces = {}
+    # Files compiled against interfaces that have changed since.
+    self.stale = set()
+    for file_name in file_names:
+      try:
+        self.interfaces[file_name] = class_interface.LoadInterface(file_name)
+      except IOError:
+        pass
+
+  def Signatures(self):
+    return InterfaceSignatures(
+        interface for _, interface in sorted(self.interfaces.items()))
+
+  def Update(self, file_name):
+    stale = file_name in self.stale
+    self.stale.discard(file_name)
+    try:
+      with open(file_name, "r") as program_file:
+        program = program_file.read()
+    except IOError:
+      # The file is gone, or is being replaced and the next event will
+      # bring it back.
+      self.files.pop(file_name, None)
+      self._SetInterface(file_name, None)
+      self.interfaces.pop(file_name, None)
+      return None
+
+    jack_class = self.files.get(file_name)
+    if jack_class is not None and jack_class.source == program and not stale:
+      return None
+
+    self._SetInterface(file_name, class_interface.Extract(program))
+    try:
+      if jack_class is None:
+        jack_class = incremental_parser.IncrementalClass(program, flat=True)
+      elif jack_class.source != program:
+        # Usually a save changes a single subroutine, and only that one
+        # gets parsed again.
+        jack_class.Edit(*incremental_parser.Diff(jack_class.source, program))
+      compiler = jack_to_vm_compiler.JackToVMCompiler(self.Signatures())
+      with compilation_cache.ReplaceFile(
+          file_name[:-4] + "vm") as output_file:
+        with _ReportDeepNesting():
+          compiler.WriteVMCode(jack_class.tree, output_file)
+    except COMPILE_ERRORS as error:
+      self.files.pop(file_name, None)
+      return FormatError(file_name, program, error)
+    except (IOError, OSError) as error:
+      return str(error)
+    self.files[file_name] = jack_class
+    return None
+
+  def Recheck(self):
+    # Compiles the stale files again. Returns a dict of an error message or
+    # None by file name.
+    errors = {}
+    while self.stale:
+      file_name = min(self.stale)
+      errors[file_name] = self.Update(file_name)
+    return errors
+
+  def _SetInterface(self, file_name, interface):
+    if self.interfaces.get(file_name) != interface:
+      self.stale.update(other for other in self.interfaces
+                        if other != file_name)
+    self.interfaces[file_name] = interface
+
+
+def Watch(directory, watcher=None):
+  if watcher is None:
+    watcher = file_watcher.CreateWatcher(directory, ".jack")
+  changed = set(FindJackFiles(directory))
+  session = WatchSession(changed)
+  try:
+    while True:
+      errors = {}
+      for file_name in sorted(changed):
+        errors[file_name] = session.Update(file_name)
+      # A file may have been checked against an interface that another one
+      # changed after it, and only the second check counts.
+      errors.update(session.Recheck())
+      for file_name in sorted(errors):
+        if errors[file_name]:
+          print errors[file_name]
+      changed = watcher.Wait()
+      while True:
+        more_changes = watcher.Wait(_DEBOUNCE_DELAY)
+        if not more_changes:
+          break
+        changed |= more_changes
+  finally:
+    watcher.Close()
+
+
+def AddCacheOptions(parser):
+  parser.add_option(
+      "--cache-dir", default=compilation_cache.DefaultDirectory(),
+      help="directory of the compilation cache (default: %default)")
+  parser.add_option(
+      "--cache-size", type="int", default=256,
+      help="size limit of the compilation cache in megabytes "
+           "(default: %default)")
+  parser.add_option(
+      "--no-cache", action="store_false", dest="use_cache", default=True,
+      help="compile every file even if its output is cached")
+
+
+def CacheFromOptions(options):
+  # The generated parsers are kept in the same cache directory, if any.
+  if not options.use_cache:
+    parser_generator.GeneratedParser.SetDirectory(None)
+    return None
+  parser_generator.GeneratedParser.SetDirectory(
+      parser_generator.ParserDirectory(options.cache_dir))
+  return compilation_cache.CompilationCache(
+      options.cache_dir, CompilerVersion(), options.cache_size * 1024 * 1024)
 
 
 def main():
-  if len(sys.argv) != 2:
+  parser = optparse.OptionParser(
+      usage="%prog [options] FILE_OR_DIRECTORY")
+  parser.add_option(
+      "-j", "--jobs", type="int", default=0,
+      help="number of processes to compile with, 0 uses one per CPU "
+           "(default)")
+  parser.add_option(
+      "--watch", action="store_true", default=False,
+      help="keep running and recompile .jack files of the directory as "
+           "they change")
+  parser.add_option(
+      "--interfaces", action="store_true", default=False,
+      help="only write the .jacki interface of every class, without "
+           "compiling")
+  AddCacheOptions(parser)
+  options, args = parser.parse_args()
+
+  if len(args) != 1:
     print "Please enter the name of a file or directory which to compile."
     return
 
-  if not os.path.exists(sys.argv[1]):
+  if not os.path.exists(args[0]):
     print "Argument is not a valid file or directory."
     return
 
-  if os.path.isdir(sys.argv[1]):
-    for file_name in os.listdir(sys.argv[1]):
-      if file_name.endswith(".jack"):
-        CompileFile(file_name)
-  elif os.path.isfile(sys.argv[1]):
-    file_name = sys.argv[1]
-    if file_name.endswith(".jack"):
-      CompileFile(file_name)
+  if options.watch:
+    if not os.path.isdir(args[0]):
+      print "Only directories can be watched."
+      return
+    try:
+      Watch(args[0])
+    except KeyboardInterrupt:
+      pass
+    return
+
+  if options.interfaces:
+    for error in WriteInterfaces(FindJackFiles(args[0])):
+      if error:
+        print error
+    return
+
+  cache = CacheFromOptions(options)
+  for error in CompileFiles(FindJackFiles(args[0]), options.jobs, cache):
+    if error:
+      print error
+
+  if cache:
+    cache.TrimIfDue()
 
 
 if __name__ == "__main__":
   main()
-
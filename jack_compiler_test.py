@@ -24,10 +24,40 @@
 __author__ = "Ivan Vladimirov Ivanov (ivan.vladimirov.ivanov@gmail.com)"
 
 
+import ctypes
+import hashlib
+import multiprocessing
+import os
+import pickle
+import shutil
+import socket
+import tempfile
+import threading
+import unittest
+
+import ast_arena
+import ast_cache
+import ast_memory_benchmark
+import class_interface
+import compilation_cache
+import compile_client
+import compile_server
+import file_watcher
+import incremental_parser
+import jack_compiler
+import jack_lang_model
 import jack_to_vm_compiler
 import jack_xml_serializer
 import lexical_analyser
+import line_index
+import name_resolver
+import parser_generator
+import predictive_parser
+import signature_index
+import symbol_table
 import syntax_analyser
+import token_stream
+import token_xml_serializer
 
 
 def RemoveBlanks(xml):
@@ -2255,6 +2285,970 @@ class SquareGame {
     square_vm = self._CompileToHackVM(square_jack)
     square_game_vm = self._CompileToHackVM(square_game_jack)
 
+  def testCompileFilesReportsErrorsInOrder(self):
+    directory = tempfile.mkdtemp()
+    try:
+      sources = {
+          "A.jack": "class A { function void f() { return; } }",
+          "B.jack": "class B { function void f() { return } }",
+          "C.jack": "class C { function void f() { return; } }",
+          "D.jack": "class D { function void f() { return $; } }"}
+      for file_name, source in sources.items():
+        with open(os.path.join(directory, file_name), "w") as jack_file:
+          jack_file.write(source)
+
+      file_names = jack_compiler.FindJackFiles(directory)
+      errors = jack_compiler.CompileFiles(file_names, jobs=2)
+      self.assertEqual(4, len(errors))
+      self.assertEqual(None, errors[0])
+      self.assertTrue(errors[1].startswith(file_names[1]))
+      self.assertEqual(None, errors[2])
+      self.assertTrue(errors[3].startswith(file_names[3]))
+      self.assertTrue(os.path.exists(os.path.join(directory, "A.vm")))
+      self.assertTrue(os.path.exists(os.path.join(directory, "C.vm")))
+      self.assertFalse(os.path.exists(os.path.join(directory, "B.vm")))
+    finally:
+      shutil.rmtree(directory)
+
+  def testCompileSubroutinesOnPool(self):
+    subroutines = []
+    for n in range(2 * jack_compiler._MIN_SPLIT_SUBROUTINES):
+      subroutines.append("""
+          method int f%d(int x) {
+            var int i;
+            while (i < x) {
+              if (i = 3) { let s = s + i; } else { do Output.printInt(a[i]); }
+              let i = i + 1;
+            }
+            return i + f;
+          }""" % (n,))
+    program = "class Big { field int f; static int s; field Array a; %s }" % (
+        "".join(subroutines),)
+    broken_program = program.replace("return i + f;", "return q;", 1).replace(
+        "let i = i + 1;", "let i = i + 1", 2)
+
+    pool = multiprocessing.Pool(2)
+    try:
+      serialized_program = jack_compiler.CompileSource(program, pool=pool)
+      self.assertEqual(jack_compiler.CompileSource(program),
+                       serialized_program)
+      # Labels are numbered from one in every subroutine.
+      self.assertEqual(2 * jack_compiler._MIN_SPLIT_SUBROUTINES,
+                       serialized_program.count("label end_if_1"))
+
+      for source in (broken_program, program + " }", broken_program + " }"):
+        errors = []
+        for subroutine_pool in (None, pool):
+          try:
+            jack_compiler.CompileSource(source, pool=subroutine_pool)
+          except jack_compiler.COMPILE_ERRORS as error:
+            errors.append((error.message, error.offset))
+        self.assertEqual(2, len(errors))
+        self.assertEqual(errors[0], errors[1])
+    finally:
+      pool.terminate()
+      pool.join()
+
+  def testCompilationCache(self):
+    directory = tempfile.mkdtemp()
+    try:
+      cache = compilation_cache.CompilationCache(
+          os.path.join(directory, "cache"), "1", max_size=100)
+      file_name = os.path.join(directory, "A.jack")
+      with open(file_name, "w") as jack_file:
+        jack_file.write("class A { function void f() { return; } }")
+
+      self.assertEqual(None, jack_compiler.CompileFile(file_name, cache))
+      with open(os.path.join(directory, "A.vm")) as vm_file:
+        vm = vm_file.read()
+      key = cache.Key("class A { function void f() { return; } }")
+      self.assertEqual(vm, cache.Get(key))
+
+      # A hit must be served without compiling again.
+      cache.Put(key, "cached")
+      self.assertEqual(None, jack_compiler.CompileFile(file_name, cache))
+      with open(os.path.join(directory, "A.vm")) as vm_file:
+        self.assertEqual("cached", vm_file.read())
+
+      other_version = compilation_cache.CompilationCache(
+          cache.directory, "2")
+      self.assertEqual(None, other_version.Get(other_version.Key(
+          "class A { function void f() { return; } }")))
+
+      old_time = os.path.getmtime(cache._Path(key)) - 10
+      os.utime(cache._Path(key), (old_time, old_time))
+      cache.Put(cache.Key("newer"), "x" * 100)
+      # Generated parsers share the directory, but are not entries.
+      parser_directory = parser_generator.ParserDirectory(cache.directory)
+      os.makedirs(parser_directory)
+      with open(os.path.join(parser_directory, "parser.py"), "w") as module:
+        module.write("x" * 1000)
+      cache.Trim()
+      self.assertEqual(None, cache.Get(key))
+      self.assertEqual("x" * 100, cache.Get(cache.Key("newer")))
+      self.assertEqual(["parser.py"], os.listdir(parser_directory))
+
+      # Builds trim only once in a while.
+      self.assertTrue(cache.TrimIfDue())
+      cache.Put(key, "x" * 1000)
+      self.assertFalse(cache.TrimIfDue())
+      self.assertEqual("x" * 1000, cache.Get(key))
+      self.assertTrue(cache.TrimIfDue(interval=0))
+      self.assertEqual(None, cache.Get(key))
+    finally:
+      shutil.rmtree(directory)
+
+  def testCompileServer(self):
+    directory = tempfile.mkdtemp()
+    socket_path = os.path.join(directory, "server.sock")
+    server = compile_server.CompileServer(socket_path)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    try:
+      client = compile_client.CompileClient(socket_path)
+      try:
+        program = "class A { function int f() { return 1 + 2; } }"
+        self.assertEqual({"vm": jack_compiler.CompileSource(program)},
+                         client.CompileSource(program))
+        response = client.CompileSource("class A { function }")
+        self.assertTrue("error" in response)
+        self.assertFalse("vm" in response)
+
+        # Files are checked against the classes of their directory, which
+        # may replace those of the OS.
+        for name, program in self._OwnOutputProject():
+          with open(os.path.join(directory, name), "w") as jack_file:
+            jack_file.write(program)
+        self.assertEqual(None, client.CompileFile(
+            os.path.join(directory, "Main.jack")))
+        # The index of the directory is kept until one of its files changes.
+        signatures = server._Project(directory).signatures
+        self.assertEqual(None, client.CompileFile(
+            os.path.join(directory, "Main.jack")))
+        self.assertTrue(signatures is server._Project(directory).signatures)
+        output_file_name = os.path.join(directory, "Output.jack")
+        with open(output_file_name, "w") as jack_file:
+          jack_file.write("class Output { function void printInt(int a) "
+                          "{ return; } }")
+        os.utime(output_file_name, (0, 0))
+        self.assertTrue("error" in client.Request(
+            {"file": os.path.join(directory, "Main.jack")}))
+      finally:
+        client.Close()
+    finally:
+      server.shutdown()
+      server.server_close()
+      thread.join()
+      shutil.rmtree(directory)
+
+    # The socket has to be in a directory no other user can get into.
+    self.assertNotEqual(tempfile.gettempdir(), os.path.dirname(
+        compile_client.DefaultSocketPath()))
+    directory = tempfile.mkdtemp()
+    try:
+      private_directory = os.path.join(directory, "private")
+      compile_client.MakePrivateDirectory(private_directory)
+      self.assertEqual(0700, os.stat(private_directory).st_mode & 0777)
+      os.chmod(private_directory, 0755)
+      self.assertRaises(socket.error, compile_server.CompileServer,
+                        os.path.join(private_directory, "server.sock"))
+    finally:
+      shutil.rmtree(directory)
+
+  def _OwnOutputProject(self):
+    # A project with an Output class of its own, whose printInt takes a
+    # different number of arguments than that of the OS.
+    return [("Main.jack", "class Main { function void main() { "
+                          "do Output.printInt(1, 2); return; } }"),
+            ("Output.jack", "class Output { function void printInt("
+                            "int a, int b) { return; } }")]
+
+  def testWatchSessionRecheck(self):
+    directory = tempfile.mkdtemp()
+    try:
+      file_names = []
+      for name, program in self._OwnOutputProject():
+        file_names.append(os.path.join(directory, name))
+        with open(file_names[-1], "w") as jack_file:
+          jack_file.write(program)
+      main_file_name, output_file_name = file_names
+      session = jack_compiler.WatchSession(file_names)
+      for file_name in file_names:
+        self.assertEqual(None, session.Update(file_name))
+      self.assertEqual({}, session.Recheck())
+
+      # A change of the interface of Output leaves Main to be checked again.
+      with open(output_file_name, "w") as jack_file:
+        jack_file.write("class Output { function void printInt(int a) "
+                        "{ return; } }")
+      self.assertEqual(None, session.Update(output_file_name))
+      errors = session.Recheck()
+      self.assertEqual([main_file_name], errors.keys())
+      self.assertTrue(errors[main_file_name])
+      self.assertFalse(main_file_name in session.files)
+
+      # A change of a body alone does not.
+      with open(output_file_name, "w") as jack_file:
+        jack_file.write("class Output { function void printInt(int a) "
+                        "{ return; return; } }")
+      self.assertEqual(None, session.Update(output_file_name))
+      self.assertEqual({}, session.Recheck())
+
+      # Removing a class leaves the others to be checked again too.
+      os.remove(main_file_name)
+      self.assertEqual(None, session.Update(main_file_name))
+      self.assertEqual({output_file_name: None}, session.Recheck())
+      self.assertEqual({output_file_name: session.interfaces[
+          output_file_name]}, session.interfaces)
+    finally:
+      shutil.rmtree(directory)
+
+  def testWatchSession(self):
+    directory = tempfile.mkdtemp()
+    try:
+      file_name = os.path.join(directory, "A.jack")
+      with open(file_name, "w") as jack_file:
+        jack_file.write("class A { function void f() { return; } }")
+      watcher = file_watcher.PollingWatcher(directory, ".jack", 0.01)
+      session = jack_compiler.WatchSession()
+      self.assertEqual(None, session.Update(file_name))
+      tree = session.files[file_name].tree
+
+      # Saving an unchanged file keeps the tree it already has.
+      self.assertEqual(None, session.Update(file_name))
+      self.assertTrue(tree is session.files[file_name].tree)
+
+      with open(file_name, "w") as jack_file:
+        jack_file.write("class A { function int f() { return 1; } }")
+      os.utime(file_name, (0, 0))
+      self.assertEqual(set([file_name]), watcher.Wait(1))
+      self.assertEqual(set(), watcher.Wait(0))
+      self.assertEqual(None, session.Update(file_name))
+      self.assertFalse(tree is session.files[file_name].tree)
+      with open(os.path.join(directory, "A.vm")) as vm_file:
+        self.assertTrue("push constant 1" in vm_file.read())
+
+      # Calls are checked against the classes of the whole directory.
+      file_names = []
+      for name, program in self._OwnOutputProject():
+        file_names.append(os.path.join(directory, name))
+        with open(file_names[-1], "w") as jack_file:
+          jack_file.write(program)
+      session = jack_compiler.WatchSession(file_names)
+      self.assertEqual(None, session.Update(file_names[0]))
+    finally:
+      shutil.rmtree(directory)
+    # Removing the directory removes the files the watcher has seen.
+    self.assertEqual(set([file_name]), watcher.Wait(0))
+
+  def testInotifyWatcherOverflow(self):
+    directory = tempfile.mkdtemp()
+    try:
+      file_names = [os.path.join(directory, name)
+                    for name in ("A.jack", "B.jack", "C.jack")]
+      for file_name in file_names[:2]:
+        open(file_name, "w").close()
+      try:
+        watcher = file_watcher.InotifyWatcher(directory, ".jack")
+      except (AttributeError, OSError):
+        # No inotify on this platform.
+        return
+      try:
+        os.remove(file_names[0])
+        open(file_names[2], "w").close()
+        # Events that are lost are made up for by reporting every file.
+        overflow = file_watcher._EVENT_HEADER.pack(
+            -1, file_watcher._IN_Q_OVERFLOW, 0, 0)
+        self.assertEqual(set(file_names), watcher._Changes(overflow))
+        self.assertEqual(set(file_names[1:]), watcher.files)
+      finally:
+        watcher.Close()
+    finally:
+      shutil.rmtree(directory)
+
+  def testIncrementalClass(self):
+    program = """class A {
+      field int x;
+      method void f() { let x = 1; return; }
+      method int g() { return x; }
+    }"""
+    jack_class = incremental_parser.IncrementalClass(program)
+    serialize = jack_xml_serializer.JackXMLSerializer().Serialize
+
+    def Edit(old_text, new_text, reparses_subroutine):
+      start = jack_class.source.index(old_text)
+      subroutine_decs = jack_class.tree.subroutine_decs
+      self.assertEqual(
+          reparses_subroutine,
+          jack_class.Edit(start, start + len(old_text), new_text))
+      self.assertEqual(self._CompileToXML(jack_class.source),
+                       serialize(jack_class.tree))
+      if reparses_subroutine:
+        # The other subroutines are shared with the previous tree.
+        shared = [old is new for old, new in
+                  zip(subroutine_decs, jack_class.tree.subroutine_decs)]
+        self.assertEqual(len(shared) - 1, sum(shared))
+
+    Edit("let x = 1;", "let x = x + 12;", True)
+    Edit("return x;", "return x * 2;", True)
+    Edit("field int x;", "field int x, y;", False)
+    # Both edits change where the subroutines end.
+    Edit("return; }\n", "return; } //", False)
+    self.assertEqual(1, len(jack_class.tree.subroutine_decs))
+    Edit("return; } //", "return; }\n", False)
+    Edit("return; }", "return; } // f", True)
+    self.assertEqual((7, 8, "ab"), incremental_parser.Diff(
+        "return x;", "return ab;"))
+
+    source = jack_class.source
+    start = source.index("return;")
+    try:
+      jack_class.Edit(start, start + 7, "return")
+      self.fail("Expected a syntax error.")
+    except syntax_analyser.SyntacticError as error:
+      self.assertTrue(error.message.startswith(
+          "Can't parse Class" + os.linesep + "Can't parse SubroutineDec"))
+    self.assertEqual(source, jack_class.source)
+
+  def testModelNodesHaveNoDict(self):
+    program = "class A { function int f(int x) { return -x + A.f(1); } }"
+    tree = parser_generator.GeneratedParser.Parse(
+        lexical_analyser.LexicalAnalyser.TokenizeToArray(program))
+    node_classes = tuple(value for value in vars(jack_lang_model).values()
+                         if isinstance(value, type))
+    nodes, size = ast_memory_benchmark.MeasureNodes(tree, node_classes)
+    self.assertTrue(0 < size < 100 * nodes)
+    self.assertFalse(hasattr(tree, "__dict__"))
+    self.assertFalse(hasattr(tree.subroutine_decs[0].name, "__dict__"))
+
+    # Workers send trees back and forth with the newest pickle protocol.
+    copy = pickle.loads(pickle.dumps(tree, pickle.HIGHEST_PROTOCOL))
+    self.assertEqual(
+        jack_to_vm_compiler.JackToVMCompiler().CompileVMCode(tree),
+        jack_to_vm_compiler.JackToVMCompiler().CompileVMCode(copy))
+
+  def testStreamingParse(self):
+    program = "class A { field int x; %s }" % (
+        " ".join("method int f%d() { return x + %d; }" % (i, i)
+                 for i in range(50)),)
+    directory = tempfile.mkdtemp()
+    try:
+      file_name = os.path.join(directory, "A.jack")
+      with open(file_name, "w") as jack_file:
+        jack_file.write(program)
+      with open(file_name, "rb") as jack_file:
+        window = syntax_analyser.TokenWindow(
+            lexical_analyser.LexicalAnalyser.TokenizeFile(jack_file))
+        tree = syntax_analyser.SyntaxAnalyser.Parse(window)
+      # Only the closing brace of the class is left after the last commit.
+      self.assertEqual(1, len(window.buffer))
+      self.assertEqual(
+          self._CompileToXML(program),
+          jack_xml_serializer.JackXMLSerializer().Serialize(tree))
+    finally:
+      shutil.rmtree(directory)
+
+  def testTokenArray(self):
+    program = """
+        class A {
+          function void f() { do Output.printString("a < b"); return; }
+        }"""
+    tokens = lexical_analyser.LexicalAnalyser.Tokenize(program)
+    token_array = lexical_analyser.LexicalAnalyser.TokenizeToArray(program)
+    self.assertEqual(len(tokens), len(token_array))
+    self.assertEqual(token_stream.KEYWORD, token_array.Kind(0))
+    self.assertEqual("class", token_array.Value(0))
+    self.assertEqual(program.index("class"), token_array.offsets[0])
+    self.assertEqual(None, token_array.Kind(len(token_array)))
+    self.assertEqual(
+        token_xml_serializer.TokenXMLSerializer.SerializeToXML(tokens),
+        token_xml_serializer.TokenXMLSerializer.SerializeToXML(token_array))
+
+    token_array = pickle.loads(pickle.dumps(token_array, 2))
+    self.assertEqual(
+        self._CompileToXML(program),
+        jack_xml_serializer.JackXMLSerializer().Serialize(
+            syntax_analyser.SyntaxAnalyser.Parse(token_array)))
+
+  def testLineIndex(self):
+    index = line_index.LineIndex("ab\ncd\r\nef\rgh")
+    self.assertEqual((1, 1), index.Position(0))
+    self.assertEqual((1, 3), index.Position(2))
+    self.assertEqual((2, 2), index.Position(4))
+    self.assertEqual((3, 1), index.Position(7))
+    self.assertEqual((4, 2), index.Position(11))
+
+    program = "class A {\r\n  function void f() {\r\n    return\r\n  }\r\n}"
+    tokens = lexical_analyser.LexicalAnalyser.Tokenize(program)
+    self.assertEqual(program.index("return"), tokens[-3].offset)
+    try:
+      syntax_analyser.SyntaxAnalyser.Parse(tokens)
+      self.fail("Expected a syntax error.")
+    except syntax_analyser.SyntacticError as error:
+      self.assertTrue(jack_compiler.FormatError(
+          "A.jack", program, error).startswith("A.jack:"))
+
+    try:
+      lexical_analyser.LexicalAnalyser.Tokenize("class A {\r\n\r\n  $ }")
+      self.fail("Expected a lexical error.")
+    except lexical_analyser.LexicalError as error:
+      self.assertEqual("Lexical Error on line 3: $ }", error.message)
+
+  def testNestedIfsParseInLinearTime(self):
+    # Without memoization every level doubles the parse time, so this would
+    # not finish.
+    body = "let x = 1;"
+    for _ in range(30):
+      body = "if (x) { %s } else { let x = 2; }" % (body,)
+    program = "class A { function void f() { var int x; %s return; } }" % (
+        body,)
+    tree = syntax_analyser.SyntaxAnalyser.Parse(
+        lexical_analyser.LexicalAnalyser.TokenizeToArray(program))
+    statement = tree.subroutine_decs[0].body.statements.statements[0]
+    self.assertEqual("IfElseStatement",
+                     statement.statement.if_statement.__class__.__name__)
+
+  def testFlatTree(self):
+    program = """
+        class T {
+          field Array a;
+          method int f(int x, T y) {
+            var int i;
+            let a[i + 1] = -x;
+            let i = a[i];
+            if (x) { return; } else { let i = ~(x = 1); }
+            if (i) { do y.g(1, (2 * 3), "s"); }
+            while (i < 10) { do g(a[1]); let i = i + 1; }
+            return T.h(this) - Math.abs(-1);
+          }
+        }"""
+    tokens = lexical_analyser.LexicalAnalyser.TokenizeToArray(program)
+    wrappers = set(["Statement", "LetStatement", "IfStatement",
+                    "ReturnStatement", "Term", "SubroutineCall"])
+    for parse in (parser_generator.GeneratedParser.Parse,
+                  predictive_parser.PredictiveParser.Parse,
+                  predictive_parser.StackParser.Parse):
+      tree = parse(tokens, flat=True)
+      self.assertEqual(
+          self._CompileToXML(program),
+          jack_xml_serializer.JackXMLSerializer().Serialize(tree))
+      self.assertEqual(
+          self._CompileToHackVM(program),
+          jack_to_vm_compiler.JackToVMCompiler().CompileVMCode(tree))
+
+      names = set()
+      stack = [tree]
+      while stack:
+        node = stack.pop()
+        names.add(node.__class__.__name__)
+        if isinstance(node, (list, tuple)):
+          stack.extend(node)
+        elif hasattr(node, "__slots__"):
+          stack.extend(getattr(node, name) for name in node.__slots__)
+      self.assertEqual(set(), names & wrappers)
+      self.assertTrue("ArrayAccess" in names)
+
+  def testAstArena(self):
+    programs = [
+        "class A { field int x; method void f() { let x = 1; return; } }",
+        """class B {
+             function int g(int n, Array a) {
+               var B b;
+               if (~(n < 0)) { let a[n] = "s"; } else { do b.h(a[1], -n); }
+               while (n) { let n = n - 1; }
+               return B.g(n * 2, null);
+             }
+           }"""]
+    serialize = jack_xml_serializer.JackXMLSerializer().Serialize
+    arena = ast_arena.Arena()
+    for program in programs:
+      tokens = lexical_analyser.LexicalAnalyser.TokenizeToArray(program)
+      for flat in (False, True):
+        arena.Add(parser_generator.GeneratedParser.Parse(tokens, flat=flat))
+    self.assertEqual(4, len(arena))
+
+    directory = tempfile.mkdtemp()
+    try:
+      file_name = os.path.join(directory, "classes.arena")
+      arena.Save(file_name)
+      loaded = ast_arena.Arena.Load(file_name)
+      for index in range(len(arena)):
+        program = programs[index // 2]
+        for tree in (arena.Root(index), loaded.Root(index)):
+          self.assertEqual(self._CompileToXML(program), serialize(tree))
+          self.assertEqual(
+              self._CompileToHackVM(program),
+              jack_to_vm_compiler.JackToVMCompiler().CompileVMCode(tree))
+      self.assertEqual("Class", loaded.Kind(loaded.roots[0]))
+      # The mapping starts on a page, so the arrays are as aligned in memory
+      # as they are in the file.
+      for data in (loaded.starts, loaded.operands, loaded.roots):
+        self.assertEqual(0, ctypes.addressof(data) % 4)
+
+      with open(file_name, "r+b") as arena_file:
+        arena_file.truncate(os.path.getsize(file_name) - 1)
+      self.assertRaises(ast_arena.ArenaError, ast_arena.Arena.Load, file_name)
+      with open(file_name, "r+b") as arena_file:
+        arena_file.write("JACKVM")
+      self.assertRaises(ast_arena.ArenaError, ast_arena.Arena.Load, file_name)
+    finally:
+      shutil.rmtree(directory)
+
+  def testAstCache(self):
+    program = """
+        class A {
+          field Array a;
+          method void f(int n) { let a[n] = "s"; return; }
+          function int g() { do Output.printInt(-1); return A.g(); }
+        }"""
+    serialize = jack_xml_serializer.JackXMLSerializer().Serialize
+    for flat in (False, True):
+      tokens = lexical_analyser.LexicalAnalyser.TokenizeToArray(program)
+      data = ast_cache.Dumps(
+          parser_generator.GeneratedParser.Parse(tokens, flat=flat))
+      tree = ast_cache.Loads(data)
+      # Bodies are only read on first use.
+      self.assertTrue(all(subroutine._data is not None
+                          for subroutine in tree.subroutine_decs))
+      self.assertEqual(self._CompileToXML(program), serialize(tree))
+      self.assertEqual(
+          self._CompileToHackVM(program),
+          jack_to_vm_compiler.JackToVMCompiler().CompileVMCode(tree))
+    self.assertRaises(ast_cache.AstCacheError, ast_cache.Loads, "JACKVM")
+    self.assertRaises(ast_cache.AstCacheError, ast_cache.Loads,
+                      data[:8] + "x" * 20 + data[28:])
+
+    directory = tempfile.mkdtemp()
+    try:
+      cache = compilation_cache.CompilationCache(
+          directory, jack_compiler.CompilerVersion())
+      tree = jack_compiler.ParseSource(program, cache)
+      self.assertEqual(self._CompileToXML(program), serialize(tree))
+      cached = cache.Get(cache.Key(program, "ast"))
+      self.assertEqual(ast_cache.Dumps(tree), cached)
+      tree = jack_compiler.ParseSource(program, cache)
+      self.assertTrue(isinstance(tree.subroutine_decs[0],
+                                 ast_cache.SubroutineDec))
+      self.assertEqual(self._CompileToXML(program), serialize(tree))
+      self.assertEqual(None, cache.Get(cache.Key(program, "flat-ast")))
+    finally:
+      shutil.rmtree(directory)
+
+  def testHandlerTables(self):
+    class DoublingCompiler(jack_to_vm_compiler.JackToVMCompiler):
+      def CompileIntegerConstant(self, integer_constant, env):
+        self.CompilePushCommand(
+            "constant", 2 * int(integer_constant.integer_constant))
+
+    program = """
+        class A {
+          function int f(Array a) { let a[1] = 3; return a[2] + (4); }
+        }"""
+    tokens = lexical_analyser.LexicalAnalyser.TokenizeToArray(program)
+    for flat in (False, True):
+      tree = parser_generator.GeneratedParser.Parse(tokens, flat=flat)
+      self.assertEqual(
+          self._CompileToHackVM(program).replace("constant 4", "constant 8")
+                                        .replace("constant 3", "constant 6")
+                                        .replace("constant 2", "constant 4")
+                                        .replace("constant 1", "constant 2"),
+          DoublingCompiler().CompileVMCode(tree))
+      self.assertEqual(self._CompileToHackVM(program),
+                       jack_to_vm_compiler.JackToVMCompiler().CompileVMCode(
+                           tree))
+
+    # Types the tables were not built with are looked up by name.
+    class Identifier(jack_lang_model.Identifier):
+      __slots__ = ()
+    compiler = jack_to_vm_compiler.JackToVMCompiler()
+    self.assertFalse(Identifier in compiler.handlers)
+    env = symbol_table.SymbolTable(None)
+    env.Insert("x", "int", "static")
+    compiler.CompileTerm(Identifier("x"), env)
+    self.assertEqual(["push static 0"], compiler.writer.lines)
+    self.assertRaises(AttributeError, compiler.CompileTerm, object(), env)
+
+  def testVMWriter(self):
+    program = """
+        class A {
+          function int f(int x) { return x + 1; }
+          function void g() { do A.f(2); return; }
+        }"""
+    tree = parser_generator.GeneratedParser.Parse(
+        lexical_analyser.LexicalAnalyser.TokenizeToArray(program), flat=True)
+    writes = []
+    class OutputFile(object):
+      def write(self, data):
+        writes.append(data)
+    jack_to_vm_compiler.JackToVMCompiler().WriteVMCode(tree, OutputFile())
+    self.assertEqual(self._CompileToHackVM(program), "".join(writes))
+    # Each subroutine is written as soon as it is compiled.
+    self.assertEqual(3, len(writes))
+    self.assertEqual(["function A.f 0", "function A.g 0"],
+                     [data.split(os.linesep)[0] for data in writes[::2]])
+
+    # Files are written as they are compiled, but only replace the last
+    # output once the whole class compiles.
+    directory = tempfile.mkdtemp()
+    try:
+      cache = compilation_cache.CompilationCache(
+          os.path.join(directory, "cache"), "1")
+      file_name = os.path.join(directory, "A.jack")
+      with open(file_name, "w") as jack_file:
+        jack_file.write(program)
+      self.assertEqual(None, jack_compiler.CompileFile(file_name, cache))
+      self.assertEqual(self._CompileToHackVM(program), cache.Get(
+          cache.Key(program)))
+      with open(file_name, "w") as jack_file:
+        jack_file.write(program.replace("return;", "return y;"))
+      self.assertTrue(jack_compiler.CompileFile(file_name))
+      self.assertEqual(["A.jack", "A.vm", "cache"],
+                       sorted(os.listdir(directory)))
+      with open(os.path.join(directory, "A.vm")) as vm_file:
+        self.assertEqual(self._CompileToHackVM(program), vm_file.read())
+    finally:
+      shutil.rmtree(directory)
+
+  def testSymbolTable(self):
+    class_env = symbol_table.SymbolTable(None)
+    for name in ("a", "b", "c"):
+      class_env.Insert(name, "int", "field")
+    class_env.Insert("s", "Array", "static")
+    env = symbol_table.SymbolTable(class_env)
+    env.Insert("b", "boolean", "local")
+    env.Insert("x", "int", "local")
+    env.Insert("x", "char", "local")
+    env.Insert("y", "int", "local")
+
+    self.assertEqual(("int", "field", 2), env.Lookup("c"))
+    self.assertEqual(("boolean", "local", 0), env.Lookup("b"))
+    self.assertEqual(("int", "field", 1), class_env.Lookup("b"))
+    self.assertEqual(("char", "local"), env.Lookup("x")[:2])
+    self.assertEqual(None, env.Lookup("z"))
+    self.assertEqual(3, env.CountKind("local"))
+    self.assertEqual(3, env.CountKind("field"))
+    self.assertEqual(0, env.CountKindLocal("field"))
+    self.assertEqual(1, class_env.CountKind("static"))
+
+  def testUnknownIdentifiersAreReportedTogether(self):
+    program = """
+        class A {
+          field int a;
+          method int f(int x) {
+            let q = a[x] + Math.abs(r);
+            do Output.printInt(q + x);
+            return s.g(a);
+          }
+        }"""
+    tokens = lexical_analyser.LexicalAnalyser.TokenizeToArray(program)
+    for flat in (False, True):
+      tree = parser_generator.GeneratedParser.Parse(tokens, flat=flat)
+      try:
+        jack_to_vm_compiler.JackToVMCompiler().CompileVMCode(tree)
+        self.fail("Unknown identifiers were not reported")
+      except jack_to_vm_compiler.CodeGenerationError as error:
+        self.assertEqual("Unknown identifiers q, r", error.message)
+
+    env = symbol_table.SymbolTable(symbol_table.SymbolTable(None))
+    env.parent.Insert("a", "Array", "field")
+    env.Insert("x", "int", "argument")
+    bindings = name_resolver.Bindings(env)
+    self.assertEqual(("this", 0, "Array"), bindings["a"])
+    self.assertEqual(("argument", 0, "int"), bindings["x"])
+    self.assertEqual(None, bindings["Output"])
+
+  def testSignatureIndex(self):
+    program = """
+        class A {
+          field int x;
+          constructor A new(int a, int b) { return this; }
+          method void m() { do g(x); do m(); return; }
+          function Array g(int a) { return Array.new(a); }
+        }"""
+    tokens = lexical_analyser.LexicalAnalyser.TokenizeToArray(program)
+    class_signatures = signature_index.TokenSignatures(tokens)
+    self.assertEqual(
+        ("A", {"new": signature_index.Signature("constructor", 2, "A"),
+               "m": signature_index.Signature("method", 0, "void"),
+               "g": signature_index.Signature("function", 1, "Array")}),
+        class_signatures)
+    for flat in (False, True):
+      self.assertEqual(class_signatures, signature_index.ClassSignatures(
+          parser_generator.GeneratedParser.Parse(tokens, flat=flat)))
+
+    # Functions of the class are called without an object.
+    vm = jack_compiler.CompileSource(program).splitlines()
+    call = vm.index("call A.g 1")
+    self.assertEqual(["push this 0", "call A.g 1"], vm[call - 1:call + 1])
+    self.assertEqual(["push pointer 0", "call A.m 1"], vm[call + 2:call + 4])
+
+    for call, message in (
+        ("Math.abs(1, 2)", "Math.abs takes 1 arguments, 2 given"),
+        ("s.new(1)", "String.new is not a method"),
+        ("String.length()", "String.length is a method"),
+        ("g()", "A.g takes 1 arguments, 0 given")):
+      try:
+        jack_compiler.CompileSource(
+            "class A { function void g(int a) { var String s; do %s; "
+            "return; } }" % (call,))
+        self.fail("Expected a code generation error.")
+      except jack_to_vm_compiler.CodeGenerationError as error:
+        self.assertEqual(message, error.message)
+
+    directory = tempfile.mkdtemp()
+    try:
+      file_names = [os.path.join(directory, name)
+                    for name in ("A.jack", "B.jack")]
+      with open(file_names[0], "w") as program_file:
+        program_file.write("class A { function void g(int a) { "
+                           "do B.f(1); return; } }")
+      with open(file_names[1], "w") as program_file:
+        program_file.write("class B { function void f(int a, int b) { "
+                           "return; } }")
+      for jobs in (1, 2):
+        errors = jack_compiler.CompileFiles(file_names, jobs=jobs)
+        self.assertEqual(
+            [file_names[0] + ": B.f takes 2 arguments, 1 given", None],
+            errors)
+    finally:
+      shutil.rmtree(directory)
+
+  def testClassInterface(self):
+    program = """
+        class A {
+          field int x, y; // a { in a comment
+          static boolean s;
+          /* } */ field Array a;
+          constructor A new(int b, int c) { let x = b; return this; }
+          method void m() {
+            if (x) { do Output.printString("}{"); } return;
+          }
+          function int g() { return 0; }
+        }"""
+    self.assertEqual(
+        class_interface.Interface(
+            "A", 3, 1,
+            {"new": signature_index.Signature("constructor", 2, "A"),
+             "m": signature_index.Signature("method", 0, "void"),
+             "g": signature_index.Signature("function", 0, "int")}),
+        class_interface.Extract(program))
+    # Bodies are skipped without being tokenized.
+    self.assertEqual("class A { function int g() {} }",
+                     class_interface.Skeleton(
+                         "class A { function int g() { return #; } }"))
+    self.assertEqual(None, class_interface.Extract("class A { field int"))
+
+    directory = tempfile.mkdtemp()
+    try:
+      file_name = os.path.join(directory, "A.jack")
+      with open(file_name, "w") as program_file:
+        program_file.write(program)
+      interface = class_interface.WriteInterfaceFile(file_name)
+      interface_file_name = os.path.join(directory, "A.jacki")
+      self.assertTrue(os.path.exists(interface_file_name))
+
+      # The .jacki file is used as long as the source does not change.
+      with open(interface_file_name, "w") as interface_file:
+        interface_file.write(class_interface.Dumps(
+            class_interface.Interface("B", 0, 0, {}),
+            hashlib.sha1(program).hexdigest()))
+      self.assertEqual("B", class_interface.WriteInterfaceFile(
+          file_name).class_name)
+      with open(file_name, "a") as program_file:
+        program_file.write("\n")
+      self.assertEqual(interface, class_interface.WriteInterfaceFile(
+          file_name))
+      os.remove(interface_file_name)
+
+      # Builds keep interfaces in the compilation cache only.
+      cache = compilation_cache.CompilationCache(
+          os.path.join(directory, "cache"), "1")
+      self.assertEqual(
+          interface.subroutines,
+          jack_compiler.ProjectSignatures([file_name], cache).Class("A"))
+      self.assertEqual(["A.jack", "cache"], sorted(os.listdir(directory)))
+      self.assertEqual(interface, class_interface.SourceInterface(
+          open(file_name).read(), cache))
+
+      # Compiled code is keyed on the classes its source names only.
+      main = "class Main { function void f() { do A.f(); return; } }"
+      signatures = jack_compiler.ProjectSignatures([file_name], cache)
+      key = jack_compiler._CacheKey(main, cache, signatures)
+      signatures.AddClass("B", {})
+      self.assertEqual(key, jack_compiler._CacheKey(main, cache, signatures))
+      signatures.AddClass("A", {})
+      self.assertNotEqual(
+          key, jack_compiler._CacheKey(main, cache, signatures))
+      self.assertNotEqual(key, jack_compiler._CacheKey(main, cache, None))
+    finally:
+      shutil.rmtree(directory)
+
+  def testStackParserHandlesDeepNesting(self):
+    program = """
+        class A {
+          function int f(int x) {
+            if (x) { let x = -(x + 1); } else { return A.f(x - 1); }
+            while (~x) { do A.f((x * 2), "s"); }
+            return x;
+          }
+        }"""
+    tokens = lexical_analyser.LexicalAnalyser.TokenizeToArray(program)
+    self.assertEqual(
+        self._CompileToXML(program),
+        jack_xml_serializer.JackXMLSerializer().Serialize(
+            predictive_parser.StackParser.Parse(tokens)))
+
+    expression = "x"
+    for _ in range(5000):
+      expression = "(%s + 1)" % (expression,)
+    program = "class A { function int f(int x) { return %s; } }" % (
+        expression,)
+    tokens = lexical_analyser.LexicalAnalyser.TokenizeToArray(program)
+    for parse in (predictive_parser.StackParser.Parse,
+                  parser_generator.GeneratedParser.Parse):
+      tree = parse(tokens)
+      statement = tree.subroutine_decs[0].body.statements.statements[0]
+      self.assertEqual("ExpressionReturnStatement",
+                       statement.statement.return_statement.__class__.__name__)
+    # Code generation still recurses, and reports too deep a nesting as an
+    # error in the program.
+    try:
+      jack_compiler.CompileSource(program)
+      self.fail("Expected a code generation error.")
+    except jack_to_vm_compiler.CodeGenerationError as error:
+      self.assertEqual("Expression nested too deeply", error.message)
+
+    try:
+      predictive_parser.StackParser.Parse(
+          lexical_analyser.LexicalAnalyser.TokenizeToArray(
+              "class A { function void f() { let x = 1 } }"))
+      self.fail("Expected a syntax error.")
+    except syntax_analyser.SyntacticError as error:
+      self.assertEqual(40, error.offset)
+      self.assertTrue(error.message.endswith(
+          "Can't parse LetStatement" + os.linesep + "Can't parse symbol: ;"))
+
+  def testSyntaxErrorReportsFurthestFailure(self):
+    program = "class A {\n  function void f() {\n    let x = 1\n  }\n}"
+    try:
+      syntax_analyser.SyntaxAnalyser.Parse(
+          lexical_analyser.LexicalAnalyser.TokenizeToArray(program))
+      self.fail("Expected a syntax error.")
+    except syntax_analyser.SyntacticError as error:
+      self.assertEqual(program.index("}"), error.offset)
+      self.assertTrue("Can't parse RegularLetStatement" in error.message)
+      self.assertTrue("symbol: ;" in error.message.splitlines()[-1])
+
+  def testPredictiveParser(self):
+    program = """
+        class T {
+          field Array a;
+          static int s;
+
+          method int f(int x, T y) {
+            var int i, j;
+            let a[i + 1] = -x;
+            let i = a[j];
+            if (x) { return; } else { let s = ~x; }
+            if (~(x = 1)) { do y.k(1, (2 * 3), "s"); }
+            while (i < 10) { let i = i + 1; }
+            do g();
+            do T.h(a[1]);
+            let j = f(1, y) - Math.abs(-1);
+            return this;
+          }
+
+          function void g() { return; }
+        }"""
+    tokens = lexical_analyser.LexicalAnalyser.TokenizeToArray(program)
+    self.assertEqual(
+        self._CompileToXML(program),
+        jack_xml_serializer.JackXMLSerializer().Serialize(
+            predictive_parser.PredictiveParser.Parse(tokens)))
+    self.assertEqual(
+        self._CompileToHackVM(program),
+        jack_to_vm_compiler.JackToVMCompiler().CompileVMCode(
+            predictive_parser.PredictiveParser.ParseStream(
+                lexical_analyser.LexicalAnalyser.TokenizeIter(program))))
+
+    try:
+      predictive_parser.PredictiveParser.Parse(
+          lexical_analyser.LexicalAnalyser.TokenizeToArray(
+              "class A { function void f() { let x = 1 } }"))
+      self.fail("Expected a syntax error.")
+    except syntax_analyser.SyntacticError as error:
+      self.assertEqual(40, error.offset)
+      self.assertTrue(error.message.endswith("Can't parse symbol: ;"))
+
+  def testGeneratedParser(self):
+    program = """
+        class T {
+          field Array a;
+          method int f(int x, T y) {
+            var int i;
+            let a[i + 1] = -x;
+            if (x) { return; } else { let i = ~x; }
+            while (i < 10) { do y.g(1, (2 * 3), "s"); let i = i + 1; }
+            return f(a[1], y) - Math.abs(-1);
+          }
+        }"""
+    directory = tempfile.mkdtemp()
+    try:
+      rules = predictive_parser.FactoredRules()
+      module = parser_generator.LoadParserModule(rules, directory)
+      self.assertEqual(1, len(os.listdir(directory)))
+      # The second load imports the module written by the first one.
+      reloaded = parser_generator.LoadParserModule(rules, directory)
+      self.assertEqual(
+          module.__file__.rstrip("c"), reloaded.__file__.rstrip("c"))
+      path = module.__file__.rstrip("c")
+      self.assertEqual(0644, os.stat(path).st_mode & 0777)
+      # A module that does not match its digest is generated again rather
+      # than imported.
+      with open(path, "a") as module_file:
+        module_file.write("\ntampered = True\n")
+      reloaded = parser_generator.LoadParserModule(rules, directory)
+      self.assertFalse(hasattr(reloaded, "tampered"))
+      # So is one that others could have written.
+      os.chmod(path, 0666)
+      self.assertFalse(parser_generator._IsTrusted(path))
+      # Without a directory nothing is written.
+      self.assertFalse(hasattr(
+          parser_generator.LoadParserModule(rules, None), "__file__"))
+      # The module is only valid for the string ids it was generated with.
+      fingerprint = parser_generator._Fingerprint(rules)
+      string_ids = token_stream.STRING_IDS
+      token_stream.STRING_IDS = dict(
+          (value, string_id + 1) for value, string_id in string_ids.items())
+      try:
+        self.assertNotEqual(fingerprint, parser_generator._Fingerprint(rules))
+      finally:
+        token_stream.STRING_IDS = string_ids
+      parser = parser_generator.GeneratedParser(module, rules)
+
+      tokens = lexical_analyser.LexicalAnalyser.TokenizeToArray(program)
+      self.assertEqual(
+          self._CompileToXML(program),
+          jack_xml_serializer.JackXMLSerializer().Serialize(
+              parser.ParseRule(tokens, "Class")))
+
+      tokens = lexical_analyser.LexicalAnalyser.TokenizeToArray(
+          "class A { function void f() { let x = 1 } }")
+      try:
+        parser.ParseRule(tokens, "Class")
+        self.fail("Expected a syntax error.")
+      except syntax_analyser.SyntacticError as error:
+        self.assertEqual(40, error.offset)
+        self.assertTrue(error.message.endswith("Can't parse symbol: ;"))
+    finally:
+      shutil.rmtree(directory)
+
+    # Without left factoring the grammar is not LL(1).
+    self.assertRaises(
+        predictive_parser.GrammarError, predictive_parser.PredictiveParser,
+        predictive_parser.Grammar(predictive_parser.FactoredRules(
+            syntax_analyser.SyntaxAnalyser._GRAMMAR)))
+
 
 if __name__ == "__main__":
   unittest.main()
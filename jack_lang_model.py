@@ -24,32 +24,58 @@
 __author__ = "Ivan Vladimirov Ivanov (ivan.vladimirov.ivanov@gmail.com)"
 
 
+KEYWORDS = [
+    "class", "constructor", "function", "method", "field", "static", "var",
+    "int", "char", "boolean", "void", "true", "false", "null", "this",
+    "let", "do", "if", "else", "while", "return"
+]
+
+SYMBOLS = "{}()[].,;+-*/&|<>=~"
+
+
 class Keyword(object):
-  def __init__(self, keyword):
+  __slots__ = ("keyword", "offset")
+
+  def __init__(self, keyword, offset=None):
     self.keyword = keyword
+    self.offset = offset
 
 
 class Symbol(object):
-  def __init__(self, symbol):
+  __slots__ = ("symbol", "offset")
+
+  def __init__(self, symbol, offset=None):
     self.symbol = symbol
+    self.offset = offset
 
 
 class IntegerConstant(object):
-  def __init__(self, integer_constant):
+  __slots__ = ("integer_constant", "offset")
+
+  def __init__(self, integer_constant, offset=None):
     self.integer_constant = integer_constant
+    self.offset = offset
 
 
 class StringConstant(object):
-  def __init__(self, string_constant):
+  __slots__ = ("string_constant", "offset")
+
+  def __init__(self, string_constant, offset=None):
     self.string_constant = string_constant
+    self.offset = offset
 
 
 class Identifier(object):
-  def __init__(self, identifier):
+  __slots__ = ("identifier", "offset")
+
+  def __init__(self, identifier, offset=None):
     self.identifier = identifier
+    self.offset = offset
 
 
 class Class(object):
+  __slots__ = ("class_name", "class_var_decs", "subroutine_decs")
+
   def __init__(self, class_name, class_var_decs, subroutine_decs):
     self.class_name = class_name
     self.class_var_decs = class_var_decs
@@ -57,6 +83,8 @@ class Class(object):
 
 
 class ClassVarDec(object):
+  __slots__ = ("scope", "var_type", "var_names")
+
   def __init__(self, scope, var_type, var_names):
     self.scope = scope
     self.var_type = var_type
@@ -64,11 +92,15 @@ class ClassVarDec(object):
 
 
 class VarType(object):
+  __slots__ = ("var_type",)
+
   def __init__(self, var_type):
     self.var_type = var_type
 
 
 class SubroutineDec(object):
+  __slots__ = ("subroutine_type", "return_type", "name", "param_list", "body")
+
   def __init__(self, subroutine_type, return_type, name, param_list, body):
     self.subroutine_type = subroutine_type
     self.return_type = return_type
@@ -78,54 +110,74 @@ class SubroutineDec(object):
 
 
 class SubroutineBody(object):
+  __slots__ = ("var_decs", "statements")
+
   def __init__(self, var_decs, statements):
     self.var_decs = var_decs
     self.statements = statements
 
 
 class VarDec(object):
+  __slots__ = ("var_type", "var_names")
+
   def __init__(self, var_type, var_names):
     self.var_type = var_type
     self.var_names = var_names
 
 
 class ClassName(object):
+  __slots__ = ("identifier",)
+
   def __init__(self, identifier):
     self.identifier = identifier
 
 
 class SubroutineName(object):
+  __slots__ = ("identifier",)
+
   def __init__(self, identifier):
     self.identifier = identifier
 
 
 class VarName(object):
+  __slots__ = ("identifier",)
+
   def __init__(self, identifier):
     self.identifier = identifier
 
 
 class Statements(object):
+  __slots__ = ("statements",)
+
   def __init__(self, statements):
     self.statements = statements
 
 
 class Statement(object):
+  __slots__ = ("statement",)
+
   def __init__(self, statement):
     self.statement = statement
 
 
 class LetStatement(object):
+  __slots__ = ("let_statement",)
+
   def __init__(self, let_statement):
     self.let_statement = let_statement
 
 
 class RegularLetStatement(object):
+  __slots__ = ("var_name", "expression")
+
   def __init__(self, var_name, expression):
     self.var_name = var_name
     self.expression = expression
 
 
 class ArrayLetStatement(object):
+  __slots__ = ("var_name", "index_expression", "expression")
+
   def __init__(self, var_name, index_expression, expression):
     self.var_name = var_name
     self.index_expression = index_expression
@@ -133,17 +185,23 @@ class ArrayLetStatement(object):
 
 
 class IfStatement(object):
+  __slots__ = ("if_statement",)
+
   def __init__(self, if_statement):
     self.if_statement = if_statement
 
 
 class RegularIfStatement(object):
+  __slots__ = ("expression", "statements")
+
   def __init__(self, expression, statements):
     self.expression = expression
     self.statements = statements
 
 
 class IfElseStatement(object):
+  __slots__ = ("expression", "if_statements", "else_statements")
+
   def __init__(self, expression, if_statements, else_statements):
     self.expression = expression
     self.if_statements = if_statements
@@ -151,60 +209,90 @@ class IfElseStatement(object):
 
 
 class WhileStatement(object):
+  __slots__ = ("expression", "statements")
+
   def __init__(self, expression, statements):
     self.expression = expression
     self.statements = statements
 
 
 class DoStatement(object):
+  __slots__ = ("subroutine_call",)
+
   def __init__(self, subroutine_call):
     self.subroutine_call = subroutine_call
 
 
 class ReturnStatement(object):
+  __slots__ = ("return_statement",)
+
   def __init__(self, return_statement):
     self.return_statement = return_statement
 
 
 class ExpressionReturnStatement(object):
+  __slots__ = ("expression",)
+
   def __init__(self, expression):
     self.expression = expression
 
 
 class NoExpressionReturnStatement(object):
+  __slots__ = ()
+
   def __init__(self):
     pass
 
 
 class Expression(object):
+  __slots__ = ("first_term", "op_term_list")
+
   def __init__(self, first_term, op_term_list):
     self.first_term = first_term
     self.op_term_list = op_term_list
 
 
 class Term(object):
+  __slots__ = ("term",)
+
   def __init__(self, term):
     self.term = term
 
 
+class ArrayAccess(object):
+  __slots__ = ("var_name", "expression")
+
+  def __init__(self, var_name, expression):
+    self.var_name = var_name
+    self.expression = expression
+
+
 class UnaryOpTerm(object):
+  __slots__ = ("op", "term")
+
   def __init__(self, op, term):
     self.op = op
     self.term = term
 
 
 class SubroutineCall(object):
+  __slots__ = ("subroutine_call",)
+
   def __init__(self, subroutine_call):
     self.subroutine_call = subroutine_call
 
 
 class FunctionSubroutineCall(object):
+  __slots__ = ("function_name", "expression_list")
+
   def __init__(self, function_name, expression_list):
     self.function_name = function_name
     self.expression_list = expression_list
 
 
 class MethodSubroutineCall(object):
+  __slots__ = ("var_name", "method_name", "expression_list")
+
   def __init__(self, var_name, method_name, expression_list):
     self.var_name = var_name
     self.method_name = method_name
@@ -212,6 +300,8 @@ class MethodSubroutineCall(object):
 
 
 class StaticMethodSubroutineCall(object):
+  __slots__ = ("class_name", "method_name", "expression_list")
+
   def __init__(self, class_name, method_name, expression_list):
     self.class_name = class_name
     self.method_name = method_name
@@ -219,16 +309,22 @@ class StaticMethodSubroutineCall(object):
 
 
 class Operator(object):
+  __slots__ = ("op",)
+
   def __init__(self, op):
     self.op = op
 
 
 class UnaryOperator(object):
+  __slots__ = ("op",)
+
   def __init__(self, op):
     self.op = op
 
 
 class KeywordConstant(object):
+  __slots__ = ("constant",)
+
   def __init__(self, constant):
     self.constant = constant
 
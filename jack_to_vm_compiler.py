@@ -24,8 +24,13 @@
 __author__ = "Ivan Vladimirov Ivanov (ivan.vladimirov.ivanov@gmail.com)"
 
 
+import cStringIO
+import operator
 import os
 
+import name_resolver
+import node_dispatch
+import signature_index
 import symbol_table
 
 
@@ -34,61 +39,159 @@ class CodeGenerationError(Exception):
     self.message = message
 
 
+class _UnknownIdentifier(CodeGenerationError):
+  # Raised for the first unknown identifier of a subroutine body, which then
+  # reports all of them at once.
+  def __init__(self, name):
+    CodeGenerationError.__init__(self, "Unknown identifier " + name)
+
+
+# The wrapper nodes of trees that are not flat, which compile to the node
+# they wrap.
+_WRAPPED_FIELDS = {
+    "Statement": "statement",
+    "Term": "term",
+    "SubroutineCall": "subroutine_call"
+}
+
+
+def _Handler(compiler_class, name):
+  if name in _WRAPPED_FIELDS:
+    field = _WRAPPED_FIELDS[name]
+    def CompileWrapped(self, node, env):
+      wrapped = getattr(node, field)
+      return self.handlers[wrapped.__class__](self, wrapped, env)
+    return CompileWrapped
+  if name == "tuple":
+    name = "ArrayAccess"
+  return node_dispatch.Method(compiler_class, "Compile" + name)
+
+
+_HANDLERS = node_dispatch.HandlerTables(_Handler)
+
+# Variable types are keywords for the primitive types and identifiers for
+# class types.
+_TYPE_NAMES = node_dispatch.TypeTable(
+    lambda name: operator.attrgetter(name.lower()))
+
+
+_ARITHMETIC_COMMANDS = {
+    "+": "add",
+    "-": "sub",
+    "&": "and",
+    "|": "or",
+    "<": "lt",
+    ">": "gt",
+    "=": "eq"
+}
+
+
+class VMWriter(object):
+
+  # Collects the commands a compiler emits and writes them to output_file,
+  # separated by line breaks and with none after the last one. Compilers
+  # flush it after every subroutine, so that only one subroutine's commands
+  # are held at a time. Without an output_file the commands stay in lines.
+
+  def __init__(self, output_file=None):
+    self.output_file = output_file
+    self.lines = []
+    self.written = False
+
+  def Flush(self):
+    if self.output_file is None or not self.lines:
+      return
+    if self.written:
+      self.output_file.write(os.linesep)
+    self.output_file.write(os.linesep.join(self.lines))
+    self.written = True
+    # Emptied in place, since compilers append to the list directly.
+    del self.lines[:]
+
+
 class JackToVMCompiler(object):
 
-  def __init__(self):
+  def __init__(self, signatures=None, output_file=None):
     self.if_count = 0
     self.while_count = 0
     self.class_name = ""
+    # The subroutines of the classes calls may go to. The class being
+    # compiled is added to it unless it is there already.
+    if signatures is None:
+      signatures = signature_index.SignatureIndex(signature_index.OS_INDEX)
+    self.signatures = signatures
+    # The bindings of the variables of the subroutine being compiled.
+    self.bindings = name_resolver.Bindings(None)
+    # Maps node types to the methods that compile them, see node_dispatch.
+    self.handlers = _HANDLERS.For(self.__class__)
+    self.SetOutput(output_file)
 
   def CompileVMCode(self, jack_program):
-    env = symbol_table.SymbolTable(None)
-    return os.linesep.join(self.CompileClass(jack_program, env))
+    output_file = cStringIO.StringIO()
+    self.WriteVMCode(jack_program, output_file)
+    return output_file.getvalue()
+
+  def WriteVMCode(self, jack_program, output_file):
+    self.SetOutput(output_file)
+    self.CompileClass(jack_program, symbol_table.SymbolTable(None))
+    self.writer.Flush()
+
+  def SetOutput(self, output_file):
+    # Where the commands compiled from now on go, see VMWriter.
+    self.writer = VMWriter(output_file)
+    self.emit = self.writer.lines.append
+
+  # Every other Compile method emits its code through these.
 
   def CompilePushCommand(self, segment, index):
-    return ["push %s %d" % (segment, index)]
+    self.emit("push %s %d" % (segment, index))
 
   def CompilePopCommand(self, segment, index):
-    return ["pop %s %d" % (segment, index)]
+    self.emit("pop %s %d" % (segment, index))
 
   def CompileArithmeticCommand(self, command):
-    return [command]
+    self.emit(command)
 
   def CompileLabelCommand(self, label):
-    return ["label %s" % (label)]
+    self.emit("label %s" % (label))
 
   def CompileGotoCommand(self, label):
-    return ["goto %s" % (label)]
+    self.emit("goto %s" % (label))
 
   def CompileIfCommand(self, label):
-    return ["if-goto %s" % (label)]
+    self.emit("if-goto %s" % (label))
 
   def CompileCallCommand(self, name, n_args):
-    return ["call %s %d" % (name, n_args)]
+    self.emit("call %s %d" % (name, n_args))
 
   def CompileFunctionCommand(self, name, n_locals):
-    return ["function %s %d" % (name, n_locals)]
+    self.emit("function %s %d" % (name, n_locals))
 
   def CompileReturnCommand(self):
-    return ["return"]
+    self.emit("return")
 
   def CompileClass(self, jack_class, env):
-    result = []
     self.class_name = jack_class.class_name
+    if self.class_name.identifier not in self.signatures.classes:
+      self.signatures.AddClass(
+          *signature_index.ClassSignatures(jack_class))
     for class_var_dec in jack_class.class_var_decs:
-      result.extend(self.CompileClassVarDec(class_var_dec, env))
+      self.CompileClassVarDec(class_var_dec, env)
     for subroutine_dec in jack_class.subroutine_decs:
-      result.extend(self.CompileSubroutineDec(subroutine_dec, env))
-    return result
+      self.CompileSubroutineDec(subroutine_dec, env)
+      self.writer.Flush()
 
   def CompileClassVarDec(self, var_dec, env):
     for var_name in var_dec.var_names:
       name = var_name.identifier
       var_type = self._GetVarType(var_dec.var_type.var_type)
       env.Insert(var_name.identifier, var_type, var_dec.scope.keyword)
-    return []
 
   def CompileSubroutineDec(self, subroutine, env):
+    # Labels only have to be unique within a function, so numbering them
+    # per subroutine lets each one be compiled on its own.
+    self.if_count = 0
+    self.while_count = 0
     new_env = symbol_table.SymbolTable(env)
     sub_type = subroutine.subroutine_type.keyword
     return getattr(self, "Compile" + sub_type.capitalize() + "Dec")(
@@ -100,12 +203,10 @@ class JackToVMCompiler(object):
       var_name = param[1].identifier
       env.Insert(var_name, var_type, "argument")
 
-    result = []
-    result.extend(self.CompileFunctionCommand(
+    self.CompileFunctionCommand(
         "%s.%s" % (self.class_name.identifier, subroutine.name.identifier),
-        self._CountLocalVariables(subroutine)))
-    result.extend(self.CompileSubroutineBody(subroutine.body, env))
-    return result
+        self._CountLocalVariables(subroutine))
+    self.CompileSubroutineBody(subroutine.body, env)
 
   def CompileMethodDec(self, subroutine, env):
     env.Insert("this", self.class_name.identifier, "argument")
@@ -114,14 +215,12 @@ class JackToVMCompiler(object):
       var_name = param[1].identifier
       env.Insert(var_name, var_type, "argument")
 
-    result = []
-    result.extend(self.CompileFunctionCommand(
+    self.CompileFunctionCommand(
         "%s.%s" % (self.class_name.identifier, subroutine.name.identifier),
-         self._CountLocalVariables(subroutine)))
-    result.extend(self.CompilePushCommand("argument", 0))
-    result.extend(self.CompilePopCommand("pointer", 0))
-    result.extend(self.CompileSubroutineBody(subroutine.body, env))
-    return result
+         self._CountLocalVariables(subroutine))
+    self.CompilePushCommand("argument", 0)
+    self.CompilePopCommand("pointer", 0)
+    self.CompileSubroutineBody(subroutine.body, env)
 
   def CompileConstructorDec(self, subroutine, env):
     for param in subroutine.param_list:
@@ -129,257 +228,212 @@ class JackToVMCompiler(object):
       var_name = param[1].identifier
       env.Insert(var_name, var_type, "argument")
 
-    result = []
-    result.extend(self.CompileFunctionCommand(
+    self.CompileFunctionCommand(
         "%s.%s" % (self.class_name.identifier, subroutine.name.identifier),
-        1 + self._CountLocalVariables(subroutine)))
-    result.extend(self.CompilePushCommand("constant", env.CountKind("field")))
-    result.extend(self.CompileCallCommand("Memory.alloc", 1))
-    result.extend(self.CompilePopCommand("pointer", 0))
-    result.extend(self.CompileSubroutineBody(subroutine.body, env))
-    return result
+        1 + self._CountLocalVariables(subroutine))
+    self.CompilePushCommand("constant", env.CountKind("field"))
+    self.CompileCallCommand("Memory.alloc", 1)
+    self.CompilePopCommand("pointer", 0)
+    self.CompileSubroutineBody(subroutine.body, env)
 
   def CompileSubroutineBody(self, body, env):
-    result = []
     for var_dec in body.var_decs:
-      result.extend(self.CompileVarDec(var_dec, env))
-    result.extend(self.CompileStatements(body.statements, env))
-    return result
+      self.CompileVarDec(var_dec, env)
+    self.bindings = name_resolver.Bindings(env)
+    try:
+      self.CompileStatements(body.statements, env)
+    except _UnknownIdentifier:
+      unknown = name_resolver.UnknownNames(body.statements, self.bindings)
+      raise CodeGenerationError("Unknown identifier%s %s" % (
+          "s" if len(unknown) > 1 else "", ", ".join(unknown)))
+    finally:
+      self.bindings = name_resolver.Bindings(None)
 
   def CompileVarDec(self, var_dec, env):
     for var_name in var_dec.var_names:
       var_type = self._GetVarType(var_dec.var_type.var_type)
       var_name = var_name.identifier
       env.Insert(var_name, var_type, "local")
-    return []
 
   def CompileStatements(self, statements, env):
-    result = []
     for statement in statements.statements:
-      result.extend(self.CompileStatement(statement, env))
-    return result
+      self.CompileStatement(statement, env)
 
   def CompileStatement(self, statement, env):
-    name = statement.statement.__class__.__name__
-    return getattr(self, "Compile" + name)(
-        statement.statement, env)
+    # The statements of a flattened tree are not wrapped in a Statement.
+    return self.handlers[statement.__class__](self, statement, env)
 
   def CompileLetStatement(self, statement, env):
-    name = statement.let_statement.__class__.__name__
-    return getattr(self, "Compile" + name)(
-        statement.let_statement, env)
+    let_statement = statement.let_statement
+    return self.handlers[let_statement.__class__](self, let_statement, env)
 
   def CompileRegularLetStatement(self, statement, env):
-    value = env.Lookup(statement.var_name.identifier)
-    if value is None:
-      raise CodeGenerationError("Unknown identifier %s" % (
-          statement.var_name.identifier))
-
-    if value[1] == "field":
-      value = (value[0], "this", value[2])
- 
-    result = []
-    result.extend(self.CompileExpression(statement.expression, env))
-    result.extend(self.CompilePopCommand(value[1], value[2]))
-    return result
+    binding = self._GetBinding(statement.var_name, env)
+    self.CompileExpression(statement.expression, env)
+    self.CompilePopCommand(binding[0], binding[1])
 
   def CompileArrayLetStatement(self, statement, env):
-    value = env.Lookup(statement.var_name.identifier)
-    if value is None:
-      raise CodeGenerationError("Unknown identifier %s" % (
-          statement.var_name.identifier))
-
-    if value[1] == "field":
-      value = (value[0], "this", value[2])
-
-    result = []
-    result.extend(self.CompileExpression(statement.expression, env))
-    result.extend(self.CompileExpression(statement.index_expression, env))
-    result.extend(self.CompilePushCommand(value[1], value[2]))
-    result.extend(self.CompileArithmeticCommand("add"))
-    result.extend(self.CompilePopCommand("pointer", 1))
-    result.extend(self.CompilePopCommand("that", 0))
-    return result
+    binding = self._GetBinding(statement.var_name, env)
+    self.CompileExpression(statement.expression, env)
+    self.CompileExpression(statement.index_expression, env)
+    self.CompilePushCommand(binding[0], binding[1])
+    self.CompileArithmeticCommand("add")
+    self.CompilePopCommand("pointer", 1)
+    self.CompilePopCommand("that", 0)
 
   def CompileIfStatement(self, statement, env):
-    name = statement.if_statement.__class__.__name__
-    return getattr(self, "Compile" + name)(
-        statement.if_statement, env)
+    if_statement = statement.if_statement
+    return self.handlers[if_statement.__class__](self, if_statement, env)
 
   def CompileRegularIfStatement(self, statement, env):
     self.if_count += 1
     label = "end_if_%d" % (self.if_count)
 
-    result = []
-    result.extend(self.CompileExpression(statement.expression, env))
-    result.extend(self.CompileArithmeticCommand("not"))
-    result.extend(self.CompileIfCommand(label))
-    result.extend(self.CompileStatements(statement.statements, env))
-    result.extend(self.CompileLabelCommand(label))
-    return result
+    self.CompileExpression(statement.expression, env)
+    self.CompileArithmeticCommand("not")
+    self.CompileIfCommand(label)
+    self.CompileStatements(statement.statements, env)
+    self.CompileLabelCommand(label)
 
   def CompileIfElseStatement(self, statement, env):
     self.if_count += 1
     label1 = "else_clause_%d" % (self.if_count)
     label2 = "end_if_%d" % (self.if_count)
 
-    result = []
-    result.extend(self.CompileExpression(statement.expression, env))
-    result.extend(self.CompileArithmeticCommand("not"))
-    result.extend(self.CompileIfCommand(label1))
-    result.extend(self.CompileStatements(statement.if_statements, env))
-    result.extend(self.CompileGotoCommand(label2))
-    result.extend(self.CompileLabelCommand(label1))
-    result.extend(self.CompileStatements(statement.else_statements, env))
-    result.extend(self.CompileLabelCommand(label2))
-    return result
+    self.CompileExpression(statement.expression, env)
+    self.CompileArithmeticCommand("not")
+    self.CompileIfCommand(label1)
+    self.CompileStatements(statement.if_statements, env)
+    self.CompileGotoCommand(label2)
+    self.CompileLabelCommand(label1)
+    self.CompileStatements(statement.else_statements, env)
+    self.CompileLabelCommand(label2)
 
   def CompileWhileStatement(self, statement, env):
     self.while_count += 1
     label1 = "start_while_%d" % (self.while_count)
     label2 = "end_while_%d" % (self.while_count)
 
-    result = []
-    result.extend(self.CompileLabelCommand(label1))
-    result.extend(self.CompileExpression(statement.expression, env))
-    result.extend(self.CompileArithmeticCommand("not"))
-    result.extend(self.CompileIfCommand(label2))
-    result.extend(self.CompileStatements(statement.statements, env))
-    result.extend(self.CompileGotoCommand(label1))
-    result.extend(self.CompileLabelCommand(label2))
-    return result
+    self.CompileLabelCommand(label1)
+    self.CompileExpression(statement.expression, env)
+    self.CompileArithmeticCommand("not")
+    self.CompileIfCommand(label2)
+    self.CompileStatements(statement.statements, env)
+    self.CompileGotoCommand(label1)
+    self.CompileLabelCommand(label2)
 
   def CompileDoStatement(self, statement, env):
-    result = []
-    result.extend(self.CompileSubroutineCall(statement.subroutine_call, env))
-    result.extend(self.CompilePopCommand("temp", 0))
-    return result
+    self.CompileSubroutineCall(statement.subroutine_call, env)
+    self.CompilePopCommand("temp", 0)
 
   def CompileReturnStatement(self, statement, env):
-    name = statement.return_statement.__class__.__name__
-    return getattr(self, "Compile" + name)(
-        statement.return_statement, env)
+    return_statement = statement.return_statement
+    return self.handlers[return_statement.__class__](
+        self, return_statement, env)
 
   def CompileExpressionReturnStatement(self, statement, env):
-    result = []
-    result.extend(self.CompileExpression(statement.expression, env))
-    result.extend(self.CompileReturnCommand())
-    return result
+    self.CompileExpression(statement.expression, env)
+    self.CompileReturnCommand()
 
   def CompileNoExpressionReturnStatement(self, statement, env):
-    result = []
-    result.extend(self.CompilePushCommand("constant", 0))
-    result.extend(self.CompileReturnCommand())
-    return result
+    self.CompilePushCommand("constant", 0)
+    self.CompileReturnCommand()
 
   def CompileExpression(self, expression, env):
-    result = []
-    result.extend(self.CompileTerm(expression.first_term, env))
+    self.CompileTerm(expression.first_term, env)
     for op, term in expression.op_term_list:
-      result.extend(self.CompileTerm(term, env))
-      result.extend(self.CompileOperator(op, env))
-    return result
+      self.CompileTerm(term, env)
+      self.CompileOperator(op, env)
 
   def CompileTerm(self, term, env):
-    name = term.term.__class__.__name__
-    if name == "tuple":
-      return self.CompileArrayAccess(term.term, env)
-    else:
-      return getattr(self, "Compile" + name)(term.term, env)
+    # Terms may be wrapped in a Term, and array accesses may be tuples.
+    return self.handlers[term.__class__](self, term, env)
 
   def CompileOperator(self, op, env):
-    operator_table = {
-        "+": self.CompileArithmeticCommand("add"),
-        "-": self.CompileArithmeticCommand("sub"),
-        "&": self.CompileArithmeticCommand("and"),
-        "|": self.CompileArithmeticCommand("or"),
-        "<": self.CompileArithmeticCommand("lt"),
-        ">": self.CompileArithmeticCommand("gt"),
-        "=": self.CompileArithmeticCommand("eq"),
-        "*": self.CompileCallCommand("Math.multiply", 2),
-        "/": self.CompileCallCommand("Math.divide", 2)
-    }
-    return operator_table[op.op.symbol]
+    symbol = op.op.symbol
+    if symbol == "*":
+      self.CompileCallCommand("Math.multiply", 2)
+    elif symbol == "/":
+      self.CompileCallCommand("Math.divide", 2)
+    else:
+      self.CompileArithmeticCommand(_ARITHMETIC_COMMANDS[symbol])
 
   def CompileIntegerConstant(self, integer_constant, env):
-    return self.CompilePushCommand(
+    self.CompilePushCommand(
         "constant", int(integer_constant.integer_constant))
 
   def CompileStringConstant(self, string_constant, env):
-    result = []
     n = len(string_constant.string_constant)
-    result.extend(self.CompilePushCommand("constant", n))
-    result.extend(self.CompileCallCommand("String.new", 1))
+    self.CompilePushCommand("constant", n)
+    self.CompileCallCommand("String.new", 1)
     for ch in string_constant.string_constant:
-      result.extend(self.CompilePushCommand("constant", ord(ch)))
-      result.extend(self.CompileCallCommand("String.appendChar", 2))
-    return result
+      self.CompilePushCommand("constant", ord(ch))
+      self.CompileCallCommand("String.appendChar", 2)
 
   def CompileKeywordConstant(self, keyword_constant, env):
     value = keyword_constant.constant.keyword
     if value == "true":
-      result = []
-      result.extend(self.CompilePushCommand("constant", 1))
-      result.extend(self.CompileArithmeticCommand("neg"))
-      return result
+      self.CompilePushCommand("constant", 1)
+      self.CompileArithmeticCommand("neg")
     elif value in ("false", "null"):
-      return self.CompilePushCommand("constant", 0)
+      self.CompilePushCommand("constant", 0)
     elif value == "this":
-      return self.CompilePushCommand("pointer", 0)
-
-    raise CodeGenerationError("Unknown keyword constant " +
-        value)
+      self.CompilePushCommand("pointer", 0)
+    else:
+      raise CodeGenerationError("Unknown keyword constant " +
+          value)
 
   def CompileIdentifier(self, identifier, env):
-    value = env.Lookup(identifier.identifier)
-    if value is None:
-      raise CodeGenerationError("Unknown identifier " + identifier.identifier)
-
-    if value[1] == "field":
-      value = (value[0], "this", value[2])
-
-    _, kind, index = value
-    return self.CompilePushCommand(kind, index)
+    binding = self.bindings[identifier.identifier]
+    if binding is None:
+      binding = self._GetBinding(identifier, env)
+    self.CompilePushCommand(binding[0], binding[1])
 
   def CompileArrayAccess(self, array_access, env):
-    result = []
-    result.extend(self.CompileExpression(array_access[1], env))
-    result.extend(self.CompileIdentifier(array_access[0], env))
-    result.extend(self.CompileArithmeticCommand("add"))
-    result.extend(self.CompilePopCommand("pointer", 1))
-    result.extend(self.CompilePushCommand("that", 0))
-    return result
+    # Either an ArrayAccess or a (var_name, expression) tuple.
+    if isinstance(array_access, tuple):
+      var_name, expression = array_access
+    else:
+      var_name, expression = array_access.var_name, array_access.expression
+    self.CompileExpression(expression, env)
+    self.CompileIdentifier(var_name, env)
+    self.CompileArithmeticCommand("add")
+    self.CompilePopCommand("pointer", 1)
+    self.CompilePushCommand("that", 0)
 
   def CompileSubroutineCall(self, call, env):
-    name = call.subroutine_call.__class__.__name__
-    return getattr(self, "Compile" +  name)(call.subroutine_call, env)
+    return self.handlers[call.__class__](self, call, env)
 
   def CompileFunctionSubroutineCall(self, call, env):
-    result = []
-    result.extend(self.CompilePushCommand("pointer", 0))
+    class_name = self.class_name.identifier
+    signature = self._GetSignature(
+        class_name, call.function_name.identifier, call.expression_list)
+    n_args = len(call.expression_list)
+    # Functions and constructors of the class are called without an object,
+    # anything else is taken to be a method of this one.
+    if signature is None or signature.kind == "method":
+      self.CompilePushCommand("pointer", 0)
+      n_args += 1
     for expression in call.expression_list:
-      result.extend(self.CompileExpression(expression, env))
-    result.extend(self.CompileCallCommand(
-        "%s.%s" % (self.class_name.identifier, call.function_name.identifier),
-        1 + len(call.expression_list)))
-    return result
+      self.CompileExpression(expression, env)
+    self.CompileCallCommand(
+        "%s.%s" % (class_name, call.function_name.identifier), n_args)
 
   def CompileMethodSubroutineCall(self, call, env):
-    value = env.Lookup(call.var_name.identifier)
-    if value is None:
-      return self.CompileStaticMethodSubroutineCall(call, env)
-
-    if value[1] == "field":
-      value = (value[0], "this", value[2])
-
-    result = []
-    result.extend(self.CompilePushCommand(value[1], value[2]))
+    binding = self._GetBinding(call.var_name, env, required=False)
+    if binding is None:
+      self.CompileStaticMethodSubroutineCall(call, env)
+      return
+
+    segment, index, var_type = binding
+    self._GetSignature(var_type, call.method_name.identifier,
+                       call.expression_list, method=True)
+    self.CompilePushCommand(segment, index)
     for expression in call.expression_list:
-      result.extend(self.CompileExpression(expression, env))
-    result.extend(self.CompileCallCommand(
-        "%s.%s" % (value[0], call.method_name.identifier),
-        1 + len(call.expression_list)))
-    return result
+      self.CompileExpression(expression, env)
+    self.CompileCallCommand(
+        "%s.%s" % (var_type, call.method_name.identifier),
+        1 + len(call.expression_list))
 
   def CompileStaticMethodSubroutineCall(self, call, env):
     class_name = ""
@@ -387,26 +441,24 @@ class JackToVMCompiler(object):
       class_name = call.var_name.identifier
     else:
       class_name = call.class_name.identifier
+    self._GetSignature(class_name, call.method_name.identifier,
+                       call.expression_list, method=False)
 
-    result = []
     for expression in call.expression_list:
-      result.extend(self.CompileExpression(expression, env))
-    result.extend(self.CompileCallCommand(
+      self.CompileExpression(expression, env)
+    self.CompileCallCommand(
         "%s.%s" % (class_name, call.method_name.identifier),
-        len(call.expression_list)))
-    return result
+        len(call.expression_list))
 
   def CompileUnaryOpTerm(self, term, env):
-    result = []
-    result.extend(self.CompileTerm(term.term, env))
-    result.extend(self.CompileUnaryOperator(term.op, env))
-    return result
+    self.CompileTerm(term.term, env)
+    self.CompileUnaryOperator(term.op, env)
 
   def CompileUnaryOperator(self, op, env):
     if op.op.symbol == "-":
-      return self.CompileArithmeticCommand("neg")
+      self.CompileArithmeticCommand("neg")
     elif op.op.symbol == "~":
-      return self.CompileArithmeticCommand("not")
+      self.CompileArithmeticCommand("not")
     else:
       raise CodeGenerationError("'%s' is not a unary operator" %
           (op.op.symbol))
@@ -417,9 +469,33 @@ class JackToVMCompiler(object):
       cnt += len(var_dec.var_names)
     return cnt
 
+  def _GetBinding(self, identifier, env, required=True):
+    if self.bindings.env is not env:
+      # Only when called from outside a subroutine body.
+      self.bindings = name_resolver.Bindings(env)
+    binding = self.bindings[identifier.identifier]
+    if binding is None and required:
+      raise _UnknownIdentifier(identifier.identifier)
+    return binding
+
+  def _GetSignature(self, class_name, subroutine_name, arguments,
+                    method=None):
+    # The signature of the subroutine a call goes to, or None if it is not
+    # known. method tells whether the call is made on an object, or is None
+    # if it may be either.
+    signature = self.signatures.Lookup(class_name, subroutine_name)
+    if signature is None:
+      return None
+    name = "%s.%s" % (class_name, subroutine_name)
+    if len(arguments) != signature.arity:
+      raise CodeGenerationError("%s takes %d arguments, %d given" % (
+          name, signature.arity, len(arguments)))
+    if method is not None and method != (signature.kind == "method"):
+      if method:
+        raise CodeGenerationError("%s is not a method" % (name,))
+      raise CodeGenerationError("%s is a method" % (name,))
+    return signature
+
   def _GetVarType(self, var_type):
-    if var_type.__class__.__name__ == "Keyword":
-      return var_type.keyword
-    else:
-      return var_type.identifier
+    return _TYPE_NAMES[var_type.__class__](var_type)
 
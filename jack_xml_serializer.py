@@ -28,12 +28,86 @@ import cgi
 import os
 
 import jack_lang_model
+import node_dispatch
+
+
+def _Unwrap(field, tables):
+  # The handler of a wrapper node of a tree that is not flat, which
+  # serializes the node it wraps with the handlers in the named attribute.
+  def SerializeWrapped(self, node):
+    wrapped = getattr(node, field)
+    return getattr(self, tables)[wrapped.__class__](self, wrapped)
+  return SerializeWrapped
+
+
+def _Handler(serializer_class, name):
+  if name == "SubroutineCall":
+    return _Unwrap("subroutine_call", "handlers")
+  return node_dispatch.Method(serializer_class, "Serialize" + name)
+
+
+def _StatementHandler(serializer_class, name):
+  if name == "Statement":
+    return _Unwrap("statement", "statement_handlers")
+  method = node_dispatch.Method(serializer_class, "Serialize" + name)
+  if name not in serializer_class._FLAT_STATEMENTS:
+    return method
+
+  # A statement of a flattened tree, without the node that names its
+  # element.
+  element, keyword = serializer_class._FLAT_STATEMENTS[name]
+  def SerializeFlatStatement(self, statement):
+    result = []
+    result.append("<%s>" % (element,))
+    if keyword:
+      result.extend(self.SerializeKeyword(keyword))
+    result.extend(method(self, statement))
+    result.append("</%s>" % (element,))
+    return result
+  return SerializeFlatStatement
+
+
+# The methods of the terms whose types are not named after their methods.
+_TERM_METHODS = {
+    "tuple": "ArrayAccess",
+    "Identifier": "IdentifierTerm",
+    "Expression": "ExpressionTerm"
+}
+
+
+def _TermHandler(serializer_class, name):
+  if name == "Term":
+    return _Unwrap("term", "term_handlers")
+  return node_dispatch.Method(
+      serializer_class, "Serialize" + _TERM_METHODS.get(name, name))
+
+
+_HANDLERS = node_dispatch.HandlerTables(_Handler)
+_STATEMENT_HANDLERS = node_dispatch.HandlerTables(_StatementHandler)
+_TERM_HANDLERS = node_dispatch.HandlerTables(_TermHandler)
+
+# Types are keywords for the primitive types and identifiers for classes.
+_IS_KEYWORD = node_dispatch.TypeTable(lambda name: name == "Keyword")
 
 
 class JackXMLSerializer(object):
 
+  # The element and leading keyword of the statements that are wrapped in a
+  # LetStatement, IfStatement or ReturnStatement, unless the tree is flat.
+  _FLAT_STATEMENTS = {
+      "RegularLetStatement": ("letStatement", "let"),
+      "ArrayLetStatement": ("letStatement", "let"),
+      "RegularIfStatement": ("ifStatement", "if"),
+      "IfElseStatement": ("ifStatement", "if"),
+      "ExpressionReturnStatement": ("returnStatement", None),
+      "NoExpressionReturnStatement": ("returnStatement", None)
+  }
+
   def __init__(self):
-    pass
+    # Map node types to the methods that serialize them, see node_dispatch.
+    self.handlers = _HANDLERS.For(self.__class__)
+    self.statement_handlers = _STATEMENT_HANDLERS.For(self.__class__)
+    self.term_handlers = _TERM_HANDLERS.For(self.__class__)
 
   def Serialize(self, jack_program):
     return os.linesep.join(self.SerializeClass(jack_program))
@@ -93,7 +167,7 @@ class JackXMLSerializer(object):
     result.append("<subroutineDec>")
     result.extend(
         self.SerializeKeyword(subroutine_dec.subroutine_type.keyword))
-    if subroutine_dec.return_type.__class__.__name__ == "Keyword":
+    if _IS_KEYWORD[subroutine_dec.return_type.__class__]:
       result.extend(self.SerializeKeyword(subroutine_dec.return_type.keyword))
     else:
       result.extend(self.SerializeVarType(subroutine_dec.return_type))
@@ -106,7 +180,7 @@ class JackXMLSerializer(object):
     return result
 
   def SerializeVarType(self, var_type):
-    if var_type.var_type.__class__.__name__ == "Keyword":
+    if _IS_KEYWORD[var_type.var_type.__class__]:
       return self.SerializeKeyword(var_type.var_type.keyword)
     else:
       return self.SerializeClassName(var_type.var_type)
@@ -164,15 +238,15 @@ class JackXMLSerializer(object):
     return result
 
   def SerializeStatement(self, statement):
-    name = statement.statement.__class__.__name__
-    return getattr(self, "Serialize" + name)(statement.statement)
+    return self.statement_handlers[statement.__class__](self, statement)
 
   def SerializeLetStatement(self, statement):
     result = []
     result.append("<letStatement>")
     result.extend(self.SerializeKeyword("let"))
-    name = statement.let_statement.__class__.__name__
-    result.extend(getattr(self, "Serialize" + name)(statement.let_statement))
+    let_statement = statement.let_statement
+    result.extend(
+        self.handlers[let_statement.__class__](self, let_statement))
     result.append("</letStatement>")
     return result
 
@@ -199,8 +273,8 @@ class JackXMLSerializer(object):
     result = []
     result.append("<ifStatement>")
     result.extend(self.SerializeKeyword("if"))
-    name = statement.if_statement.__class__.__name__
-    result.extend(getattr(self, "Serialize" + name)(statement.if_statement))
+    if_statement = statement.if_statement
+    result.extend(self.handlers[if_statement.__class__](self, if_statement))
     result.append("</ifStatement>")
     return result
 
@@ -253,9 +327,9 @@ class JackXMLSerializer(object):
   def SerializeReturnStatement(self, statement):
     result = []
     result.append("<returnStatement>")
-    name = statement.return_statement.__class__.__name__
+    return_statement = statement.return_statement
     result.extend(
-        getattr(self, "Serialize" + name)(statement.return_statement))
+        self.handlers[return_statement.__class__](self, return_statement))
     result.append("</returnStatement>")
     return result
 
@@ -283,30 +357,36 @@ class JackXMLSerializer(object):
     return result
 
   def SerializeTerm(self, term):
+    # The terms of a flattened tree are not wrapped in a Term.
     result = []
     result.append("<term>")
-    name = term.term.__class__.__name__
-    if name in [
-        "IntegerConstant",
-        "StringConstant",
-        "KeywordConstant",
-        "SubroutineCall",
-        "UnaryOpTerm"]:
-      result.extend(getattr(self, "Serialize" + name)(term.term))
-    elif name == "tuple":
-      result.extend(self.SerializeVarName(term.term[0]))
-      result.extend(self.SerializeSymbol("["))
-      result.extend(self.SerializeExpression(term.term[1]))
-      result.extend(self.SerializeSymbol("]"))
-    elif name == "Identifier":
-      result.extend(self.SerializeIdentifier(term.term.identifier))
-    elif name == "Expression":
-      result.extend(self.SerializeSymbol("("))
-      result.extend(self.SerializeExpression(term.term))
-      result.extend(self.SerializeSymbol(")"))
+    result.extend(self.term_handlers[term.__class__](self, term))
     result.append("</term>")
     return result
 
+  def SerializeArrayAccess(self, array_access):
+    # Either an ArrayAccess or a (var_name, expression) tuple.
+    if isinstance(array_access, tuple):
+      var_name, expression = array_access
+    else:
+      var_name, expression = array_access.var_name, array_access.expression
+    result = []
+    result.extend(self.SerializeVarName(var_name))
+    result.extend(self.SerializeSymbol("["))
+    result.extend(self.SerializeExpression(expression))
+    result.extend(self.SerializeSymbol("]"))
+    return result
+
+  def SerializeIdentifierTerm(self, identifier):
+    return self.SerializeIdentifier(identifier.identifier)
+
+  def SerializeExpressionTerm(self, expression):
+    result = []
+    result.extend(self.SerializeSymbol("("))
+    result.extend(self.SerializeExpression(expression))
+    result.extend(self.SerializeSymbol(")"))
+    return result
+
   def SerializeUnaryOpTerm(self, term):
     result = []
     result.extend(self.SerializeUnaryOperator(term.op))
@@ -317,8 +397,7 @@ class JackXMLSerializer(object):
     return self.SerializeSymbol(op.op.symbol)
 
   def SerializeSubroutineCall(self, call):
-    name = call.subroutine_call.__class__.__name__
-    return getattr(self, "Serialize" + name)(call.subroutine_call)
+    return self.handlers[call.__class__](self, call)
 
   def SerializeFunctionSubroutineCall(self, call):
     result = []
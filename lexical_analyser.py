@@ -24,76 +24,118 @@
 __author__ = "Ivan Vladimirov Ivanov (ivan.vladimirov.ivanov@gmail.com)"
 
 
-import os
+import contextlib
+import mmap
 import re
+
 import jack_lang_model
+import line_index
+import token_stream
 
 
 class LexicalError(Exception):
-  def __init__(self, message):
+  def __init__(self, message, offset=None):
     self.message = message
+    self.offset = offset
 
 
 class LexicalAnalyser(object):
-  
-  _RE_KEYWORD = re.compile(
-      r"(?:"
-      r"class|constructor|function|method|"
-      r"field|static|var|int|char|boolean|"
-      r"void|true|false|null|this|let|do|"
-      r"if|else|while|return"
-      r")(?=[^a-zA-Z0-9_])")
-
-  _RE_SYMBOL = re.compile("[%s]" % (re.escape(r"{}()[].,;+-*/&|<>=~")))
-
-  _RE_INTEGER_CONSTANT = re.compile(r"\d+")
-
-  _RE_STRING_CONSTANT = re.compile(r"\"[^\"\r\n]*\"")
 
-  _RE_IDENTIFIER = re.compile(r"[a-zA-Z_][a-zA-Z_0-9]*")
+  # Every token is matched by one alternation of named groups. Runs of
+  # whitespace and comments are skipped as a single match, and the last
+  # alternative catches any character no token can start with.
+  _RE_TOKEN = re.compile(
+      r"(?P<skip>(?:\s+|//[^\n\r]*|/\*.*?\*/)+)|"
+      r"(?P<symbol>[%s])|"
+      r"(?P<integer_constant>\d+)|"
+      r"\"(?P<string_constant>[^\"\r\n]*)\"|"
+      r"(?P<word>[a-zA-Z_][a-zA-Z_0-9]*)|"
+      r"(?P<error>.)" % (re.escape(jack_lang_model.SYMBOLS),),
+      re.DOTALL)
 
-  _RE_WHITESPACE = re.compile(r"\s")
+  _RE_END_OF_LINE = re.compile(r"[^\n\r]*")
 
-  _RE_COMMENT_1 = re.compile(r"//[^\n\r]*[^\n\r]")
+  _GROUP_KINDS = {
+      "symbol": token_stream.SYMBOL,
+      "integer_constant": token_stream.INTEGER_CONSTANT,
+      "string_constant": token_stream.STRING_CONSTANT
+  }
 
-  _RE_COMMENT_2 = re.compile(r"/\*.*?\*/", re.DOTALL)
+  _WORD_KINDS = dict(
+      (keyword, token_stream.KEYWORD) for keyword in jack_lang_model.KEYWORDS)
 
-  _RE_END_OF_LINE = re.compile(r"[^\n\r]*")
+  @staticmethod
+  def Tokenize(program):
+    return list(LexicalAnalyser.TokenizeIter(program))
 
-  _TOKEN_MATCHING_TABLE = [
-      (_RE_WHITESPACE, None),
-      (_RE_COMMENT_1, None),
-      (_RE_COMMENT_2, None),
-      (_RE_KEYWORD, jack_lang_model.Keyword),
-      (_RE_SYMBOL, jack_lang_model.Symbol),
-      (_RE_INTEGER_CONSTANT, jack_lang_model.IntegerConstant),
-      (_RE_STRING_CONSTANT, jack_lang_model.StringConstant),
-      (_RE_IDENTIFIER, jack_lang_model.Identifier)
-  ]
+  @staticmethod
+  def TokenizeIter(program):
+    token_classes = token_stream.TOKEN_CLASSES
+    for kind, value, offset in LexicalAnalyser._Scan(program):
+      yield token_classes[kind](value, offset)
 
   @staticmethod
-  def Tokenize(program):
-    pos = 0
-    lines = 0
-    n = len(program)
-    tokens = []
-
-    while pos < n:
-      match = None
-      token = None
-      for regex, constructor in LexicalAnalyser._TOKEN_MATCHING_TABLE:
-        match = regex.match(program, pos)
-        if match:
-          if constructor: token = constructor(match.group(0).replace("\"", ""))
-          break
-      if match:
-        pos += len(match.group(0))
-        lines += match.group(0).count(os.linesep)
-        if token: tokens.append(token)
-      else:
-        raise LexicalError("Lexical Error on line %d: %s" % (
-            lines + 1,
-            LexicalAnalyser._RE_END_OF_LINE.match(program, pos).group(0)))
+  def TokenizeFile(program_file):
+    with MapFile(program_file) as program:
+      for token in LexicalAnalyser.TokenizeIter(program):
+        yield token
 
+  @staticmethod
+  def TokenizeToArray(program):
+    tokens = token_stream.TokenArray()
+    append_kind = tokens.kinds.append
+    append_value = tokens.values.append
+    append_offset = tokens.offsets.append
+    string_ids = tokens.string_ids
+    for kind, value, offset in LexicalAnalyser._Scan(program):
+      string_id = string_ids.get(value)
+      if string_id is None:
+        string_id = tokens.Intern(value)
+      append_kind(kind)
+      append_value(string_id)
+      append_offset(offset)
     return tokens
 
+  @staticmethod
+  def _Scan(program, start=0):
+    # start has to be the offset of a token, or of the whitespace before one.
+    group_kinds = LexicalAnalyser._GROUP_KINDS
+    word_kinds = LexicalAnalyser._WORD_KINDS
+    identifier = token_stream.IDENTIFIER
+
+    for match in LexicalAnalyser._RE_TOKEN.finditer(program, start):
+      group = match.lastgroup
+      if group == "skip":
+        continue
+      elif group == "word":
+        word = match.group(group)
+        yield word_kinds.get(word, identifier), word, match.start()
+      elif group == "error":
+        pos = match.start()
+        line, _ = line_index.LineIndex(program).Position(pos)
+        rest_of_line = LexicalAnalyser._RE_END_OF_LINE.match(program, pos)
+        raise LexicalError("Lexical Error on line %d: %s" % (
+            line, rest_of_line.group(0)), pos)
+      else:
+        yield group_kinds[group], match.group(group), match.start()
+
+
+@contextlib.contextmanager
+def MapFile(program_file):
+  # Maps the file into memory so that it can be tokenized without reading it
+  # into a string first. Empty files cannot be mapped, and have no tokens.
+  try:
+    fileno = program_file.fileno()
+  except (AttributeError, IOError):
+    # Not backed by a real file, e.g. a StringIO.
+    yield program_file.read()
+    return
+  try:
+    program = mmap.mmap(fileno, 0, access=mmap.ACCESS_READ)
+  except ValueError:
+    yield ""
+    return
+  try:
+    yield program
+  finally:
+    program.close()
@@ -0,0 +1,51 @@
+#!/usr/bin/python
+#
+# Copyright (c) 2011 Ivan Vladimirov Ivanov (ivan.vladimirov.ivanov@gmail.com)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+
+
+__author__ = "Ivan Vladimirov Ivanov (ivan.vladimirov.ivanov@gmail.com)"
+
+
+import array
+import bisect
+import re
+
+
+class LineIndex(object):
+
+  # Maps offsets in a source to line and column numbers. The table of line
+  # starts is only built when the first position is asked for, so sources
+  # that compile cleanly never pay for it.
+
+  _RE_LINE_BREAK = re.compile(r"\r\n|\r|\n")
+
+  def __init__(self, source):
+    self.source = source
+    self.line_starts = None
+
+  def Position(self, offset):
+    if self.line_starts is None:
+      self.line_starts = array.array("I", [0])
+      self.line_starts.extend(
+          match.end()
+          for match in LineIndex._RE_LINE_BREAK.finditer(self.source))
+    line = bisect.bisect_right(self.line_starts, offset) - 1
+    return line + 1, offset - self.line_starts[line] + 1
@@ -0,0 +1,136 @@
+#!/usr/bin/python
+#
+# Copyright (c) 2011 Ivan Vladimirov Ivanov (ivan.vladimirov.ivanov@gmail.com)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+
+
+__author__ = "Ivan Vladimirov Ivanov (ivan.vladimirov.ivanov@gmail.com)"
+
+
+# Resolves the variables a subroutine uses to the place the code generator
+# finds them at. The binding of a variable is a (segment, index, type)
+# tuple, with fields already in the "this" segment.
+#
+# A subroutine's Bindings look every name up in the symbol table once, the
+# first time it is used, and every later use is a single dict lookup. The
+# names a subroutine uses but does not declare are found by UnknownNames,
+# which walks all of its statements, so that they can be reported together.
+
+import jack_lang_model
+import node_dispatch
+
+
+def Binding(name, env):
+  entry = env.Lookup(name)
+  if entry is None:
+    return None
+  var_type, kind, index = entry
+  if kind == "field":
+    kind = "this"
+  return (kind, index, var_type)
+
+
+class Bindings(dict):
+
+  # Maps names to their bindings, or to None for names that are not
+  # variables, such as the class of a call like Output.printInt(). Without
+  # a symbol table no name is a variable.
+
+  def __init__(self, env):
+    dict.__init__(self)
+    self.env = env
+
+  def __missing__(self, name):
+    if self.env is None:
+      return None
+    binding = Binding(name, self.env)
+    self[name] = binding
+    return binding
+
+
+# How UnknownNames treats the nodes of each type. Nodes that can not
+# contain a variable are skipped, and for the others only the fields that
+# can are followed.
+_IDENTIFIER = 1
+_METHOD_CALL = 2
+_EXPRESSION = 3
+_SEQUENCE = 4
+_LEAF = 5
+
+_LEAVES = frozenset([
+    "Keyword", "Symbol", "IntegerConstant", "StringConstant",
+    "KeywordConstant", "NoExpressionReturnStatement", "Operator",
+    "UnaryOperator", "NoneType", "str", "int"
+])
+
+# Fields that name something other than a variable, or hold an operator.
+_SKIPPED_FIELDS = frozenset([
+    "function_name", "class_name", "method_name", "op", "offset"
+])
+
+
+def _Walk(name):
+  if name == "Identifier":
+    return _IDENTIFIER
+  if name == "MethodSubroutineCall":
+    return _METHOD_CALL
+  if name == "Expression":
+    return _EXPRESSION
+  if name in ("list", "tuple"):
+    return _SEQUENCE
+  if name in _LEAVES:
+    return _LEAF
+  # The fields are those of the model class of the same name, so the views
+  # of an arena are walked as well.
+  return tuple(field for field in getattr(jack_lang_model, name).__slots__
+               if field not in _SKIPPED_FIELDS)
+
+
+_WALKS = node_dispatch.TypeTable(_Walk)
+
+
+def UnknownNames(statements, bindings):
+  # The names statements use as variables that have no binding, in the
+  # order they are first used.
+  unknown = []
+  stack = [statements]
+  while stack:
+    node = stack.pop()
+    walk = _WALKS[node.__class__]
+    if walk == _IDENTIFIER:
+      if bindings[node.identifier] is None:
+        unknown.append(node.identifier)
+    elif walk == _EXPRESSION:
+      stack.append(node.first_term)
+      stack.extend(term for _, term in node.op_term_list)
+    elif walk == _SEQUENCE:
+      stack.extend(node)
+    elif walk == _METHOD_CALL:
+      # A target that is not a variable names the class of a static call.
+      stack.extend(node.expression_list)
+    elif walk != _LEAF:
+      stack.extend(getattr(node, field) for field in walk)
+
+  # Children are pushed in order, so variables are met last use first.
+  first_used = []
+  for name in reversed(unknown):
+    if name not in first_used:
+      first_used.append(name)
+  return first_used
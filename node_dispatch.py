@@ -0,0 +1,91 @@
+#!/usr/bin/python
+#
+# Copyright (c) 2011 Ivan Vladimirov Ivanov (ivan.vladimirov.ivanov@gmail.com)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+
+
+__author__ = "Ivan Vladimirov Ivanov (ivan.vladimirov.ivanov@gmail.com)"
+
+
+# Tables that map the types of tree nodes to whatever a pass does with them,
+# so that a pass looks up a node's handler with its type instead of building
+# a method name from the name of its class for every node.
+#
+# Values are still chosen by the name of a type, on first use. That keeps
+# the tables working for anything that uses the names of the
+# jack_lang_model classes, such as the views of an ast_arena.Arena, and
+# for the tuples some trees use for array accesses.
+
+import functools
+import inspect
+
+import jack_lang_model
+
+
+MODEL_TYPES = [node_class for _, node_class in
+               inspect.getmembers(jack_lang_model, inspect.isclass)
+               if hasattr(node_class, "__slots__")]
+
+
+class TypeTable(dict):
+
+  def __init__(self, compute, node_types=()):
+    dict.__init__(self)
+    self.compute = compute
+    for node_type in node_types:
+      self[node_type] = compute(node_type.__name__)
+
+  def __missing__(self, node_type):
+    value = self.compute(node_type.__name__)
+    self[node_type] = value
+    return value
+
+
+def Method(owner_class, name):
+  # The function behind owner_class's method name, or one that fails the way
+  # calling a missing method would.
+  method = getattr(owner_class, name, None)
+  if method is None:
+    def Missing(*args):
+      raise AttributeError("'%s' object has no attribute '%s'" % (
+          owner_class.__name__, name))
+    return Missing
+  return getattr(method, "__func__", method)
+
+
+class HandlerTables(object):
+
+  # Builds one TypeTable of handlers per class, the first time an instance
+  # of the class asks for it. compute(owner_class, name) returns the handler
+  # for nodes of the named type. Handlers are usually methods found by name
+  # on owner_class, so a subclass changes how a node type is handled by
+  # overriding its method, and handles a new node type by adding one.
+
+  def __init__(self, compute):
+    self.compute = compute
+    self.tables = {}
+
+  def For(self, owner_class):
+    table = self.tables.get(owner_class)
+    if table is None:
+      table = TypeTable(functools.partial(self.compute, owner_class),
+                        MODEL_TYPES + [tuple])
+      self.tables[owner_class] = table
+    return table
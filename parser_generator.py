@@ -0,0 +1,383 @@
+#!/usr/bin/python
+#
+# Copyright (c) 2011 Ivan Vladimirov Ivanov (ivan.vladimirov.ivanov@gmail.com)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+
+
+__author__ = "Ivan Vladimirov Ivanov (ivan.vladimirov.ivanov@gmail.com)"
+
+
+# Turns the LL(1) grammar of predictive_parser into the source of a Python
+# module with one straight-line function per rule. Keyword and symbol checks
+# are inlined as integer comparisons on the arrays of a TokenArray, and
+# rules call each other directly. The module is written to the parsers/
+# directory of the compilation cache once per version of the grammar and
+# imported from there.
+
+import array
+import errno
+import hashlib
+import imp
+import os
+import stat
+
+import compilation_cache
+import jack_lang_model
+import predictive_parser
+import syntax_analyser
+import token_stream
+
+
+_EOF_KIND = 255
+
+# Lookahead keys of the generated code: the string id of a keyword or
+# symbol, which is below this, or this plus the kind of any other token.
+_KIND_BASE = len(token_stream.STRING_IDS)
+
+_TERMINAL_CLASSES = {
+    "IntegerConstant": token_stream.INTEGER_CONSTANT,
+    "StringConstant": token_stream.STRING_CONSTANT,
+    "Identifier": token_stream.IDENTIFIER
+}
+
+
+def _LookaheadKey(key):
+  if key is None:
+    return _KIND_BASE + _EOF_KIND
+  elif isinstance(key, int):
+    return _KIND_BASE + key
+  else:
+    return token_stream.STRING_IDS[key]
+
+
+class _SourceWriter(object):
+
+  def __init__(self):
+    self.lines = []
+    self.indent = 0
+    self.sets = {}
+
+  def Line(self, line):
+    self.lines.append("  " * self.indent + line)
+
+  def Set(self, keys):
+    keys = tuple(sorted(_LookaheadKey(key) for key in keys))
+    if keys not in self.sets:
+      self.sets[keys] = "_SET_%d" % (len(self.sets),)
+    return self.sets[keys]
+
+  def Test(self, keys):
+    if len(keys) == 1:
+      return "la == %d" % (_LookaheadKey(list(keys)[0]),)
+    return "la in " + self.Set(keys)
+
+
+def GenerateSource(grammar):
+  writer = _SourceWriter()
+  writer.indent = 1
+  for name, (kind, body, _) in grammar.rules.items():
+    globals()["_Generate%s" % (kind.capitalize(),)](writer, grammar, name, body)
+  functions = writer.lines
+
+  lines = [
+      "# Generated by parser_generator.py, do not edit.",
+      "",
+      "import os",
+      "",
+      "from jack_lang_model import Keyword, Symbol, IntegerConstant",
+      "from jack_lang_model import StringConstant, Identifier",
+      "from syntax_analyser import SyntacticError",
+      ""
+  ]
+  for keys, set_name in sorted(writer.sets.items(), key=lambda item: item[1]):
+    lines.append("%s = frozenset(%r)" % (set_name, keys))
+  lines.extend([
+      "",
+      "",
+      "def MakeParsers(kinds, values, strings, offsets):",
+      "  n = len(offsets)",
+      "",
+      "  def Fail(i, message):",
+      "    raise SyntacticError(message, offsets[i] if i < n else None)",
+      ""
+  ])
+  lines.extend(functions)
+  lines.append("  return locals()")
+  return "\n".join(lines) + "\n"
+
+
+def _Lookahead(writer):
+  writer.Line("k = kinds[i]")
+  writer.Line("la = values[i] if k < 2 else %d + k" % (_KIND_BASE,))
+
+
+def _Fail(writer, keys):
+  writer.Line("Fail(i, %r)" % (
+      "Can't parse " + predictive_parser._DescribeKeys(keys),))
+
+
+def _Match(writer, symbol, variable, predicted=False):
+  # Emits the code that consumes one symbol and stores its value. The token
+  # check is left out when the lookahead has already selected the symbol.
+  if not predictive_parser.IsTerminal(symbol):
+    writer.Line("%s, i = Parse%s(i)" % (variable, symbol))
+    return
+
+  key = predictive_parser.TerminalKey(symbol)
+  if symbol in _TERMINAL_CLASSES:
+    if not predicted:
+      writer.Line("if kinds[i] != %d:" % (_TERMINAL_CLASSES[symbol],))
+      writer.indent += 1
+      _Fail(writer, [key])
+      writer.indent -= 1
+    writer.Line("%s = %s(strings[values[i]])" % (variable, symbol))
+  else:
+    kind = (token_stream.KEYWORD if symbol.startswith("keyword") else
+            token_stream.SYMBOL)
+    if not predicted:
+      writer.Line("if kinds[i] != %d or values[i] != %d:" % (
+          kind, token_stream.STRING_IDS[key]))
+      writer.indent += 1
+      _Fail(writer, [key])
+      writer.indent -= 1
+    writer.Line("%s = %s(%r)" % (
+        variable, "Keyword" if kind == token_stream.KEYWORD else "Symbol",
+        key))
+  writer.Line("i += 1")
+
+
+def _Begin(writer, name):
+  writer.Line("def Parse%s(i):" % (name,))
+  writer.indent += 1
+
+
+def _End(writer):
+  writer.indent -= 1
+  writer.Line("")
+
+
+def _GenerateSequence(writer, grammar, name, body):
+  _Begin(writer, name)
+  writer.Line("try:")
+  writer.indent += 1
+  for n, symbol in enumerate(body):
+    _Match(writer, symbol, "v%d" % (n,))
+  writer.indent -= 1
+  writer.Line("except SyntacticError as error:")
+  writer.Line("  raise SyntacticError(%r + os.linesep + error.message, "
+              "error.offset)" % ("Can't parse " + name,))
+  writer.Line("return c_%s([%r%s]), i" % (
+      name, name, "".join(", v%d" % (n,) for n in range(len(body)))))
+  _End(writer)
+
+
+def _GenerateChoice(writer, grammar, name, body):
+  _Begin(writer, name)
+  _Lookahead(writer)
+  predictions = set()
+  for n, symbol in enumerate(body):
+    predict = grammar.Predict(name, symbol)
+    predictions |= predict
+    writer.Line("%s %s:" % ("if" if n == 0 else "elif", writer.Test(predict)))
+    writer.indent += 1
+    _Match(writer, symbol, "v", True)
+    writer.indent -= 1
+  writer.Line("else:")
+  writer.indent += 1
+  writer.Line("Fail(i, %r + os.linesep + %r)" % (
+      "Can't parse " + name,
+      "Can't parse " + predictive_parser._DescribeKeys(predictions)))
+  writer.indent -= 1
+  writer.Line("return c_%s([%r, v]), i" % (name, name))
+  _End(writer)
+
+
+def _GenerateStar(writer, grammar, name, body):
+  _Begin(writer, name)
+  writer.Line("result = [%r]" % (name,))
+  writer.Line("while True:")
+  writer.indent += 1
+  _Lookahead(writer)
+  writer.Line("if not (%s):" % (writer.Test(grammar.First(body)),))
+  writer.Line("  return c_%s(result), i" % (name,))
+  _Match(writer, body[0], "v", True)
+  writer.Line("result.append(v)")
+  writer.indent -= 1
+  _End(writer)
+
+
+def _GenerateQuestion(writer, grammar, name, body):
+  _Begin(writer, name)
+  _Lookahead(writer)
+  writer.Line("if not (%s):" % (writer.Test(grammar.First(body)),))
+  writer.Line("  return c_%s([%r]), i" % (name, name))
+  _Match(writer, body[0], "v", True)
+  writer.Line("return c_%s([%r, v]), i" % (name, name))
+  _End(writer)
+
+
+def _Fingerprint(rules):
+  digest = hashlib.sha1()
+  digest.update(repr([(name, kind, body)
+                      for name, (kind, body, _) in rules.items()]))
+  # The generated code compares against the string ids of the keywords and
+  # symbols of jack_lang_model, as token_stream numbers them.
+  digest.update(repr(sorted(token_stream.STRING_IDS.items())))
+  digest.update(compilation_cache.Fingerprint(
+      [jack_lang_model, predictive_parser, token_stream,
+       __import__(__name__)]))
+  return digest.hexdigest()
+
+
+def _ModuleHeader(source):
+  return "# sha1 %s\n" % (hashlib.sha1(source).hexdigest(),)
+
+
+def _WriteModule(path, source):
+  directory = os.path.dirname(path)
+  try:
+    os.makedirs(directory, 0755)
+  except OSError as error:
+    if error.errno != errno.EEXIST:
+      raise
+  with compilation_cache.ReplaceFile(path) as module_file:
+    # Writable by us alone, or _IsTrusted turns it down.
+    os.fchmod(module_file.fileno(), 0644)
+    module_file.write(_ModuleHeader(source))
+    module_file.write(source)
+
+
+def _IsTrusted(path):
+  # Importing a module runs it, so only modules no other user could have
+  # written or replaced are imported: the module, its compiled form and
+  # their directory have to belong to us and be writable by us alone. The
+  # source also has to match the digest _WriteModule put in front of it.
+  try:
+    with open(path, "rb") as module_file:
+      infos = [os.fstat(module_file.fileno())]
+      header = module_file.readline()
+      source = module_file.read()
+    infos.append(os.stat(os.path.dirname(path)))
+    if os.path.exists(path + "c"):
+      infos.append(os.lstat(path + "c"))
+  except (IOError, OSError):
+    return False
+  for info in infos:
+    if (info.st_uid != os.getuid() or
+        info.st_mode & (stat.S_IWGRP | stat.S_IWOTH)):
+      return False
+  return header == _ModuleHeader(source)
+
+
+def ParserDirectory(cache_directory):
+  # Where the modules go in a compilation cache directory. It is not one
+  # of the directories CompilationCache.Trim evicts entries from.
+  return os.path.join(cache_directory, "parsers")
+
+
+def LoadParserModule(rules, directory=None, suffix=""):
+  # Every load under a different suffix is a separate module object, so it
+  # can be given its own constructors. Without a directory the module is
+  # generated on every run.
+  module_name = "jack_parser_" + _Fingerprint(rules)
+  source = None
+  if directory is not None:
+    path = os.path.join(directory, module_name + ".py")
+    if _IsTrusted(path):
+      return imp.load_source(module_name + suffix, path)
+    source = GenerateSource(predictive_parser.Grammar(rules))
+    try:
+      _WriteModule(path, source)
+    except (IOError, OSError):
+      # An unwritable cache only costs us the generation on every run.
+      pass
+    else:
+      if _IsTrusted(path):
+        return imp.load_source(module_name + suffix, path)
+  if source is None:
+    source = GenerateSource(predictive_parser.Grammar(rules))
+  module = imp.new_module(module_name + suffix)
+  exec compile(source, module_name, "exec") in module.__dict__
+  return module
+
+
+class GeneratedParser(object):
+
+  _defaults = {}
+
+  # Where Default loads its modules from, see SetDirectory. Only builds that
+  # use a cache set it, so nothing is written otherwise.
+  _directory = None
+
+  _PADDING_KINDS = array.array("B", [_EOF_KIND, _EOF_KIND])
+  _PADDING_VALUES = array.array("I", [0, 0])
+
+  def __init__(self, module, rules, flat=False):
+    self.module = module
+    self.flat = flat
+    for name, (_, _, constructor) in rules.items():
+      setattr(module, "c_" + name, constructor)
+
+  @staticmethod
+  def SetDirectory(directory):
+    # The directory the default parsers keep their modules in, or None to
+    # generate them in memory. Parsers loaded before are kept.
+    GeneratedParser._directory = directory
+
+  @staticmethod
+  def Default(flat=False):
+    if flat not in GeneratedParser._defaults:
+      rules = predictive_parser.FactoredRules(flat=flat)
+      GeneratedParser._defaults[flat] = GeneratedParser(
+          LoadParserModule(rules, GeneratedParser._directory,
+                           suffix="_flat" if flat else ""),
+          rules, flat)
+    return GeneratedParser._defaults[flat]
+
+  @staticmethod
+  def Parse(tokens, start="Class", flat=False):
+    return GeneratedParser.Default(flat).ParseRule(tokens, start)
+
+  def ParseRule(self, tokens, start):
+    tokens = syntax_analyser.TokenSource(tokens)
+    if isinstance(tokens, syntax_analyser.TokenWindow):
+      # The generated code indexes arrays directly, streams go through the
+      # table driven parser instead.
+      return predictive_parser.PredictiveParser.Default(self.flat).ParseRule(
+          tokens, start)
+
+    # Two end of input markers let the generated code look ahead without
+    # checking bounds.
+    parsers = self.module.MakeParsers(
+        tokens.kinds + self._PADDING_KINDS,
+        tokens.values + self._PADDING_VALUES,
+        tokens.strings, tokens.offsets)
+    try:
+      result, index = parsers["Parse" + start](0)
+    except RuntimeError as error:
+      if "recursion" not in str(error):
+        raise
+      # Too deeply nested for one Python frame per rule.
+      return predictive_parser.StackParser.Default(self.flat).ParseRule(
+          tokens, start)
+    if index < len(tokens):
+      raise syntax_analyser.SyntacticError(
+          "Unparsed tokens left.", tokens.Offset(index))
+    return result
@@ -0,0 +1,574 @@
+#!/usr/bin/python
+#
+# Copyright (c) 2011 Ivan Vladimirov Ivanov (ivan.vladimirov.ivanov@gmail.com)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+
+
+__author__ = "Ivan Vladimirov Ivanov (ivan.vladimirov.ivanov@gmail.com)"
+
+
+import collections
+import os
+
+import jack_lang_model
+import syntax_analyser
+import token_stream
+
+
+jlm = jack_lang_model
+
+
+class GrammarError(Exception):
+  def __init__(self, message):
+    self.message = message
+
+
+def _MakeCall(name, suffix):
+  if suffix[0] == "call":
+    return jlm.FunctionSubroutineCall(name, suffix[1])
+  else:
+    return jlm.MethodSubroutineCall(name, suffix[1], suffix[2])
+
+
+def _MakeIdentifierTerm(name, suffix):
+  if suffix is None:
+    return name
+  elif suffix[0] == "array":
+    return (name, suffix[1])
+  else:
+    return jlm.SubroutineCall(_MakeCall(name, suffix))
+
+
+def _MakeFlatIdentifierTerm(name, suffix):
+  if suffix is None:
+    return name
+  elif suffix[0] == "array":
+    return jlm.ArrayAccess(name, suffix[1])
+  else:
+    return _MakeCall(name, suffix)
+
+
+# The rules of SyntaxAnalyser._GRAMMAR whose alternatives share a prefix,
+# rewritten so that one token of lookahead picks the alternative. Their
+# constructors build the same trees the original rules do. A qualified call
+# is always a MethodSubroutineCall, because MethodCall is tried before
+# StaticMethodCall and accepts exactly the same tokens.
+_FACTORED_GRAMMAR = [
+    ("LetStatement", ["sequence", "keywordlet", "VarName", "ArrayIndex",
+                      "symbol=", "Expression", "symbol;"],
+     lambda res: jlm.LetStatement(
+         jlm.RegularLetStatement(res[2], res[5]) if res[3] is None else
+         jlm.ArrayLetStatement(res[2], res[3], res[5]))),
+    ("ArrayIndex", ["question", "BracketedExpression"],
+     lambda res: res[1] if len(res) > 1 else None),
+    ("BracketedExpression", ["sequence", "symbol[", "Expression", "symbol]"],
+     lambda res: res[2]),
+    ("IfStatement", ["sequence", "RegularIfStatement", "ElseClause"],
+     lambda res: jlm.IfStatement(
+         res[1] if res[2] is None else
+         jlm.IfElseStatement(res[1].expression, res[1].statements, res[2]))),
+    ("ElseClause", ["question", "ElseBlock"],
+     lambda res: res[1] if len(res) > 1 else None),
+    ("ElseBlock", ["sequence", "keywordelse", "symbol{", "Statements",
+                   "symbol}"],
+     lambda res: res[3]),
+    ("ReturnStatement", ["sequence", "keywordreturn", "ReturnValue",
+                         "symbol;"],
+     lambda res: jlm.ReturnStatement(
+         jlm.NoExpressionReturnStatement() if res[2] is None else
+         jlm.ExpressionReturnStatement(res[2]))),
+    ("ReturnValue", ["question", "Expression"],
+     lambda res: res[1] if len(res) > 1 else None),
+    ("SubroutineCall", ["sequence", "Identifier", "CallSuffix"],
+     lambda res: jlm.SubroutineCall(_MakeCall(res[1], res[2]))),
+    ("CallSuffix", ["choice", "ArgumentList", "QualifiedCall"],
+     lambda res: res[1]),
+    ("ArgumentList", ["sequence", "symbol(", "ExpressionList", "symbol)"],
+     lambda res: ("call", res[2])),
+    ("QualifiedCall", ["sequence", "symbol.", "SubroutineName", "symbol(",
+                       "ExpressionList", "symbol)"],
+     lambda res: ("method", res[2], res[4])),
+    ("Term", ["choice", "IntegerConstant", "KeywordConstant",
+              "StringConstant", "IdentifierTerm", "ParenExpression",
+              "UnaryOpTerm"],
+     lambda res: jlm.Term(res[1])),
+    ("IdentifierTerm", ["sequence", "Identifier", "TermSuffix"],
+     lambda res: _MakeIdentifierTerm(res[1], res[2])),
+    ("TermSuffix", ["question", "IdentifierSuffix"],
+     lambda res: res[1] if len(res) > 1 else None),
+    ("IdentifierSuffix", ["choice", "ArraySuffix", "ArgumentList",
+                          "QualifiedCall"],
+     lambda res: res[1]),
+    ("ArraySuffix", ["sequence", "symbol[", "Expression", "symbol]"],
+     lambda res: ("array", res[2]))
+]
+
+# Constructors of the flattened trees, which leave out the nodes that only
+# wrap a single child: Statement, LetStatement, IfStatement, ReturnStatement,
+# Term and SubroutineCall. Statements, terms and calls are then the leaf
+# node itself, and an array access is an ArrayAccess instead of a tuple.
+_FLAT_CONSTRUCTORS = {
+    "Statement": lambda res: res[1],
+    "LetStatement": lambda res: (
+        jlm.RegularLetStatement(res[2], res[5]) if res[3] is None else
+        jlm.ArrayLetStatement(res[2], res[3], res[5])),
+    "IfStatement": lambda res: (
+        res[1] if res[2] is None else
+        jlm.IfElseStatement(res[1].expression, res[1].statements, res[2])),
+    "ReturnStatement": lambda res: (
+        jlm.NoExpressionReturnStatement() if res[2] is None else
+        jlm.ExpressionReturnStatement(res[2])),
+    "SubroutineCall": lambda res: _MakeCall(res[1], res[2]),
+    "Term": lambda res: res[1],
+    "IdentifierTerm": lambda res: _MakeFlatIdentifierTerm(res[1], res[2])
+}
+
+_TERMINAL_KINDS = {
+    "IntegerConstant": token_stream.INTEGER_CONSTANT,
+    "StringConstant": token_stream.STRING_CONSTANT,
+    "Identifier": token_stream.IDENTIFIER
+}
+
+_KIND_NAMES = {
+    token_stream.INTEGER_CONSTANT: "integer constant",
+    token_stream.STRING_CONSTANT: "string constant",
+    token_stream.IDENTIFIER: "identifier",
+    None: "end of input"
+}
+
+# The parser never backtracks, so a TokenWindow can forget every token
+# before the end of one of these.
+_COMMIT_RULES = ("ClassVarDec", "SubroutineDec", "Statement")
+
+
+def IsTerminal(symbol):
+  return (symbol.startswith("keyword") or symbol.startswith("symbol") or
+          symbol in _TERMINAL_KINDS)
+
+
+def TerminalKey(symbol):
+  # Lookahead keys are the text of keywords and symbols, which never clash,
+  # and the kind of every other token. None stands for the end of input.
+  if symbol.startswith("keyword"):
+    return symbol[7:]
+  elif symbol.startswith("symbol"):
+    return symbol[6:]
+  else:
+    return _TERMINAL_KINDS[symbol]
+
+
+def _Lookahead(tokens, index):
+  kind = tokens.Kind(index)
+  if kind == token_stream.KEYWORD or kind == token_stream.SYMBOL:
+    return tokens.Value(index)
+  return kind
+
+
+def _DescribeKey(key):
+  if key in _KIND_NAMES:
+    return _KIND_NAMES[key]
+  elif key.isalpha():
+    return "keyword: " + key
+  else:
+    return "symbol: " + key
+
+
+def _DescribeKeys(keys):
+  return " or ".join(sorted(_DescribeKey(key) for key in keys))
+
+
+def FactoredRules(rules=None, flat=False):
+  if rules is None:
+    rules = syntax_analyser.SyntaxAnalyser._GRAMMAR + _FACTORED_GRAMMAR
+  grammar = collections.OrderedDict()
+  for name, body, constructor in rules:
+    if flat:
+      constructor = _FLAT_CONSTRUCTORS.get(name, constructor)
+    grammar[name] = (body[0], body[1:], constructor)
+  return grammar
+
+
+class Grammar(object):
+
+  # FIRST and FOLLOW sets of the rules reachable from the start rule, in the
+  # representation of SyntaxAnalyser._GRAMMAR.
+
+  def __init__(self, rules, start="Class"):
+    self.start = start
+    self.rules = collections.OrderedDict()
+    self._AddReachable(rules, start)
+    self.nullable = set()
+    self.first = dict((name, set()) for name in self.rules)
+    self.follow = dict((name, set()) for name in self.rules)
+    self._ComputeFirst()
+    self._ComputeFollow()
+
+  def First(self, symbols):
+    first = set()
+    for symbol in symbols:
+      if IsTerminal(symbol):
+        first.add(TerminalKey(symbol))
+        return first
+      first |= self.first[symbol]
+      if symbol not in self.nullable:
+        return first
+    return first
+
+  def Nullable(self, symbols):
+    return all(not IsTerminal(symbol) and symbol in self.nullable
+               for symbol in symbols)
+
+  def Predict(self, name, symbol):
+    predict = self.First([symbol])
+    if self.Nullable([symbol]):
+      predict |= self.follow[name]
+    return predict
+
+  def _AddReachable(self, rules, name):
+    if name in self.rules or IsTerminal(name):
+      return
+    if name not in rules:
+      raise GrammarError("Unknown rule " + name)
+    self.rules[name] = rules[name]
+    for symbol in rules[name][1]:
+      self._AddReachable(rules, symbol)
+
+  def _ComputeFirst(self):
+    changed = True
+    while changed:
+      changed = False
+      for name, (kind, body, _) in self.rules.items():
+        if kind == "sequence":
+          first = self.First(body)
+          nullable = self.Nullable(body)
+        elif kind == "choice":
+          first = set()
+          for symbol in body:
+            first |= self.First([symbol])
+          nullable = any(self.Nullable([symbol]) for symbol in body)
+        else:
+          first = self.First(body)
+          nullable = True
+        if not first <= self.first[name]:
+          self.first[name] |= first
+          changed = True
+        if nullable and name not in self.nullable:
+          self.nullable.add(name)
+          changed = True
+
+  def _ComputeFollow(self):
+    self.follow[self.start].add(None)
+    changed = True
+    while changed:
+      changed = False
+      for name, (kind, body, _) in self.rules.items():
+        for i, symbol in enumerate(body):
+          if IsTerminal(symbol):
+            continue
+          if kind == "sequence":
+            follow = self.First(body[i + 1:])
+            if self.Nullable(body[i + 1:]):
+              follow |= self.follow[name]
+          elif kind == "star":
+            follow = self.First([symbol]) | self.follow[name]
+          else:
+            follow = set(self.follow[name])
+          if not follow <= self.follow[symbol]:
+            self.follow[symbol] |= follow
+            changed = True
+
+
+class PredictiveParser(object):
+
+  # An LL(1) parser built from a Grammar. Every choice is made by looking
+  # up the next token in a prediction table, so nothing is ever parsed
+  # twice and the first mismatch is the error.
+
+  _defaults = {}
+
+  def __init__(self, grammar):
+    self.grammar = grammar
+    self.parsers = {}
+    children = {}
+    for name, (kind, body, constructor) in grammar.rules.items():
+      children[name] = [None] * len(body)
+      function = getattr(self, "_Generate%sParser" % (kind.capitalize(),))
+      self.parsers[name] = function(
+          name, body, constructor, children[name])
+    for name, (_, body, _) in grammar.rules.items():
+      for i, symbol in enumerate(body):
+        children[name][i] = self._SymbolParser(symbol)
+
+  @staticmethod
+  def Default(flat=False):
+    if flat not in PredictiveParser._defaults:
+      PredictiveParser._defaults[flat] = PredictiveParser(
+          Grammar(FactoredRules(flat=flat)))
+    return PredictiveParser._defaults[flat]
+
+  @staticmethod
+  def Parse(tokens, start="Class", flat=False):
+    return PredictiveParser.Default(flat).ParseRule(tokens, start)
+
+  @staticmethod
+  def ParseStream(tokens, start="Class", flat=False):
+    return PredictiveParser.Parse(
+        syntax_analyser.TokenWindow(tokens), start, flat)
+
+  def ParseRule(self, tokens, start):
+    tokens = syntax_analyser.TokenSource(tokens)
+    result, index = self.parsers[start](tokens, 0)
+    if tokens.Kind(index) is not None:
+      raise syntax_analyser.SyntacticError(
+          "Unparsed tokens left.", tokens.Offset(index))
+    return result
+
+  def _SymbolParser(self, symbol):
+    if not IsTerminal(symbol):
+      return self.parsers[symbol]
+    elif symbol.startswith("keyword"):
+      return self._GenerateKeywordParser(symbol[7:])
+    elif symbol.startswith("symbol"):
+      return self._GenerateSymbolParser(symbol[6:])
+    else:
+      return self._GenerateTokenParser(
+          _TERMINAL_KINDS[symbol], getattr(jlm, symbol))
+
+  def _GenerateKeywordParser(self, keyword):
+    def Parser(tokens, index):
+      if (tokens.Kind(index) == token_stream.KEYWORD and
+          tokens.Value(index) == keyword):
+        return jlm.Keyword(keyword), index + 1
+      raise self._Expected(tokens, index, [keyword])
+    return Parser
+
+  def _GenerateSymbolParser(self, symbol):
+    def Parser(tokens, index):
+      if (tokens.Kind(index) == token_stream.SYMBOL and
+          tokens.Value(index) == symbol):
+        return jlm.Symbol(symbol), index + 1
+      raise self._Expected(tokens, index, [symbol])
+    return Parser
+
+  def _GenerateTokenParser(self, kind, constructor):
+    def Parser(tokens, index):
+      if tokens.Kind(index) == kind:
+        return constructor(tokens.Value(index)), index + 1
+      raise self._Expected(tokens, index, [kind])
+    return Parser
+
+  def _GenerateSequenceParser(self, name, sequence, constructor, children):
+    commits = name in _COMMIT_RULES
+    def Parser(tokens, index):
+      result = [name]
+      try:
+        for child in children:
+          res, index = child(tokens, index)
+          result.append(res)
+      except syntax_analyser.SyntacticError as error:
+        raise syntax_analyser.SyntacticError(
+            "Can't parse " + name + os.linesep + error.message, error.offset)
+      if commits:
+        tokens.Release(index)
+      return constructor(result), index
+    return Parser
+
+  def _GenerateChoiceParser(self, name, choice, constructor, children):
+    predictions = self._Predictions(name, choice)
+    commits = name in _COMMIT_RULES
+    table = dict((key, i) for i, symbol in enumerate(choice)
+                 for key in self.grammar.Predict(name, symbol))
+    def Parser(tokens, index):
+      i = table.get(_Lookahead(tokens, index))
+      if i is None:
+        raise syntax_analyser.SyntacticError(
+            "Can't parse " + name + os.linesep +
+            self._Expected(tokens, index, predictions).message,
+            tokens.Offset(index))
+      res, index = children[i](tokens, index)
+      if commits:
+        tokens.Release(index)
+      return constructor([name, res]), index
+    return Parser
+
+  def _GenerateStarParser(self, name, thing, constructor, children):
+    first = self._Predictions(name, thing)
+    def Parser(tokens, index):
+      result = [name]
+      while _Lookahead(tokens, index) in first:
+        res, index = children[0](tokens, index)
+        result.append(res)
+      return constructor(result), index
+    return Parser
+
+  def _GenerateQuestionParser(self, name, thing, constructor, children):
+    first = self._Predictions(name, thing)
+    def Parser(tokens, index):
+      result = [name]
+      if _Lookahead(tokens, index) in first:
+        res, index = children[0](tokens, index)
+        result.append(res)
+      return constructor(result), index
+    return Parser
+
+  def _Predictions(self, name, symbols):
+    # Returns the lookahead keys that select each symbol, or for a star or
+    # question rule its only symbol, and checks that they do not overlap.
+    kind = self.grammar.rules[name][0]
+    if kind in ("star", "question"):
+      first = self.grammar.First(symbols)
+      if self.grammar.Nullable(symbols):
+        raise GrammarError("%s repeats a rule that can be empty" % (name,))
+      conflicts = first & self.grammar.follow[name]
+      if conflicts:
+        raise GrammarError("%s is ambiguous on %s" % (
+            name, _DescribeKeys(conflicts)))
+      return first
+
+    predictions = set()
+    for symbol in symbols:
+      predict = self.grammar.Predict(name, symbol)
+      conflicts = predictions & predict
+      if conflicts:
+        raise GrammarError("%s is ambiguous on %s" % (
+            name, _DescribeKeys(conflicts)))
+      predictions |= predict
+    return predictions
+
+  def _Expected(self, tokens, index, keys):
+    return syntax_analyser.SyntacticError(
+        "Can't parse " + _DescribeKeys(keys), tokens.Offset(index))
+
+
+class StackParser(object):
+
+  # Parses with the prediction tables of a PredictiveParser, but keeps the
+  # rules being parsed on an explicit stack instead of the Python one, so
+  # any nesting depth fits. Each frame holds the rule, the position in its
+  # body and the children parsed so far.
+
+  _defaults = {}
+
+  _SEQUENCE, _CHOICE, _STAR, _QUESTION = range(4)
+
+  def __init__(self, grammar):
+    predictive_parser = PredictiveParser(grammar)
+    self.rules = {}
+    for name, (kind, body, constructor) in grammar.rules.items():
+      kind = getattr(self, "_" + kind.upper())
+      if kind == self._CHOICE:
+        predictions = dict(
+            (key, i) for i, symbol in enumerate(body)
+            for key in grammar.Predict(name, symbol))
+      elif kind == self._SEQUENCE:
+        predictions = None
+      else:
+        predictions = predictive_parser._Predictions(name, body)
+      self.rules[name] = (name, kind, [], constructor, predictions,
+                          name in _COMMIT_RULES)
+    for name, (_, body, _) in grammar.rules.items():
+      self.rules[name][2].extend(self._Child(symbol) for symbol in body)
+
+  @staticmethod
+  def Default(flat=False):
+    if flat not in StackParser._defaults:
+      StackParser._defaults[flat] = StackParser(
+          Grammar(FactoredRules(flat=flat)))
+    return StackParser._defaults[flat]
+
+  @staticmethod
+  def Parse(tokens, start="Class", flat=False):
+    return StackParser.Default(flat).ParseRule(tokens, start)
+
+  @staticmethod
+  def ParseStream(tokens, start="Class", flat=False):
+    return StackParser.Parse(syntax_analyser.TokenWindow(tokens), start, flat)
+
+  def _Child(self, symbol):
+    # A rule, or a terminal as (kind, text or None, constructor, key).
+    if not IsTerminal(symbol):
+      return self.rules[symbol]
+    key = TerminalKey(symbol)
+    if symbol.startswith("keyword"):
+      return (token_stream.KEYWORD, key, jlm.Keyword, key)
+    elif symbol.startswith("symbol"):
+      return (token_stream.SYMBOL, key, jlm.Symbol, key)
+    else:
+      return (key, None, getattr(jlm, symbol), key)
+
+  def ParseRule(self, tokens, start):
+    tokens = syntax_analyser.TokenSource(tokens)
+    index = 0
+    stack = [[self.rules[start], 0, [start]]]
+    while True:
+      frame = stack[-1]
+      rule, position, result = frame
+      _, kind, children, constructor, predictions, commits = rule
+
+      child = None
+      if kind == self._SEQUENCE:
+        if position < len(children):
+          child = children[position]
+      elif kind == self._CHOICE:
+        if position == 0:
+          i = predictions.get(_Lookahead(tokens, index))
+          if i is None:
+            raise self._Error(tokens, index, stack, predictions, rule)
+          child = children[i]
+      elif kind == self._STAR or position == 0:
+        if _Lookahead(tokens, index) in predictions:
+          child = children[0]
+      frame[1] = position + 1
+
+      if child is None:
+        stack.pop()
+        if commits:
+          tokens.Release(index)
+        value = constructor(result)
+        if not stack:
+          break
+        stack[-1][2].append(value)
+      elif len(child) == 4:
+        token_kind, text, token_constructor, key = child
+        if (tokens.Kind(index) != token_kind or
+            (text is not None and tokens.Value(index) != text)):
+          raise self._Error(tokens, index, stack, [key])
+        result.append(token_constructor(
+            text if text is not None else tokens.Value(index)))
+        index += 1
+      else:
+        stack.append([child, 0, [child[0]]])
+
+    if tokens.Kind(index) is not None:
+      raise syntax_analyser.SyntacticError(
+          "Unparsed tokens left.", tokens.Offset(index))
+    return value
+
+  def _Error(self, tokens, index, stack, keys, choice=None):
+    # Builds the message the recursive parser would: every sequence being
+    # parsed adds a line, and so does a choice that found no alternative.
+    lines = ["Can't parse " + _DescribeKeys(keys)]
+    if choice is not None:
+      lines.append("Can't parse " + choice[0])
+    for rule, _, _ in reversed(stack):
+      if rule[1] == self._SEQUENCE:
+        lines.append("Can't parse " + rule[0])
+    return syntax_analyser.SyntacticError(
+        os.linesep.join(reversed(lines)), tokens.Offset(index))
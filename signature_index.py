@@ -0,0 +1,215 @@
+#!/usr/bin/python
+#
+# Copyright (c) 2011 Ivan Vladimirov Ivanov (ivan.vladimirov.ivanov@gmail.com)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+
+
+__author__ = "Ivan Vladimirov Ivanov (ivan.vladimirov.ivanov@gmail.com)"
+
+
+# The kind, number of parameters and return type of the subroutines of
+# every class of a project and of the standard library of the Jack OS. The
+# code generator uses it to call functions without passing an object, and
+# to report calls with the wrong number of arguments or of the wrong kind
+# of subroutine.
+
+import hashlib
+
+import token_stream
+
+
+class Signature(object):
+  __slots__ = ("kind", "arity", "return_type")
+
+  def __init__(self, kind, arity, return_type):
+    self.kind = kind
+    self.arity = arity
+    self.return_type = return_type
+
+  def __eq__(self, other):
+    return (isinstance(other, Signature) and
+            (self.kind, self.arity, self.return_type) ==
+            (other.kind, other.arity, other.return_type))
+
+  def __ne__(self, other):
+    return not self == other
+
+  def __repr__(self):
+    return "Signature(%r, %d, %r)" % (self.kind, self.arity, self.return_type)
+
+
+def _OSClass(*subroutines):
+  return dict((name, Signature(kind, arity, return_type))
+              for kind, name, arity, return_type in subroutines)
+
+
+# The API of the Jack OS, as the book specifies it.
+OS_CLASSES = {
+    "Math": _OSClass(
+        ("function", "init", 0, "void"),
+        ("function", "abs", 1, "int"),
+        ("function", "multiply", 2, "int"),
+        ("function", "divide", 2, "int"),
+        ("function", "min", 2, "int"),
+        ("function", "max", 2, "int"),
+        ("function", "sqrt", 1, "int")),
+    "String": _OSClass(
+        ("constructor", "new", 1, "String"),
+        ("method", "dispose", 0, "void"),
+        ("method", "length", 0, "int"),
+        ("method", "charAt", 1, "char"),
+        ("method", "setCharAt", 2, "void"),
+        ("method", "appendChar", 1, "String"),
+        ("method", "eraseLastChar", 0, "void"),
+        ("method", "intValue", 0, "int"),
+        ("method", "setInt", 1, "void"),
+        ("function", "backSpace", 0, "char"),
+        ("function", "doubleQuote", 0, "char"),
+        ("function", "newLine", 0, "char")),
+    "Array": _OSClass(
+        ("function", "new", 1, "Array"),
+        ("method", "dispose", 0, "void")),
+    "Output": _OSClass(
+        ("function", "init", 0, "void"),
+        ("function", "moveCursor", 2, "void"),
+        ("function", "printChar", 1, "void"),
+        ("function", "printString", 1, "void"),
+        ("function", "printInt", 1, "void"),
+        ("function", "println", 0, "void"),
+        ("function", "backSpace", 0, "void")),
+    "Screen": _OSClass(
+        ("function", "init", 0, "void"),
+        ("function", "clearScreen", 0, "void"),
+        ("function", "setColor", 1, "void"),
+        ("function", "drawPixel", 2, "void"),
+        ("function", "drawLine", 4, "void"),
+        ("function", "drawRectangle", 4, "void"),
+        ("function", "drawCircle", 3, "void")),
+    "Keyboard": _OSClass(
+        ("function", "init", 0, "void"),
+        ("function", "keyPressed", 0, "char"),
+        ("function", "readChar", 0, "char"),
+        ("function", "readLine", 1, "String"),
+        ("function", "readInt", 1, "int")),
+    "Memory": _OSClass(
+        ("function", "init", 0, "void"),
+        ("function", "peek", 1, "int"),
+        ("function", "poke", 2, "void"),
+        ("function", "alloc", 1, "Array"),
+        ("function", "deAlloc", 1, "void")),
+    "Sys": _OSClass(
+        ("function", "init", 0, "void"),
+        ("function", "halt", 0, "void"),
+        ("function", "error", 1, "void"),
+        ("function", "wait", 1, "void"))
+}
+
+
+class SignatureIndex(object):
+
+  # Classes added to an index hide the classes of the same name in its
+  # base, so a project can replace a class of the OS with its own.
+
+  def __init__(self, base=None):
+    self.base = base
+    self.classes = {}
+
+  def AddClass(self, class_name, subroutines):
+    self.classes[class_name] = subroutines
+
+  def HasClass(self, class_name):
+    return (class_name in self.classes or
+            (self.base is not None and self.base.HasClass(class_name)))
+
+  def Class(self, class_name):
+    # The subroutines of a class by name, or None for an unknown class.
+    subroutines = self.classes.get(class_name)
+    if subroutines is None and self.base is not None:
+      return self.base.Class(class_name)
+    return subroutines
+
+  def Lookup(self, class_name, subroutine_name):
+    subroutines = self.Class(class_name)
+    if subroutines is None:
+      return None
+    return subroutines.get(subroutine_name)
+
+  def DigestOf(self, class_names):
+    # Changes whenever a signature of one of the classes does, or one of
+    # them is added or removed. Names that are not classes may be given,
+    # such as every identifier of a source, and count only once they are.
+    digest = hashlib.sha1()
+    for class_name in sorted(set(class_names)):
+      subroutines = self.Class(class_name)
+      if subroutines is not None:
+        digest.update(repr((class_name, sorted(
+            (name, signature.kind, signature.arity, signature.return_type)
+            for name, signature in subroutines.items()))))
+    return digest.hexdigest()
+
+
+def _OSIndex():
+  index = SignatureIndex()
+  for class_name, subroutines in OS_CLASSES.items():
+    index.AddClass(class_name, subroutines)
+  return index
+
+
+OS_INDEX = _OSIndex()
+
+
+def ClassSignatures(jack_class):
+  # The name and subroutines of a parsed class.
+  subroutines = {}
+  for subroutine in jack_class.subroutine_decs:
+    return_type = subroutine.return_type
+    if hasattr(return_type, "var_type"):
+      return_type = return_type.var_type
+    # A keyword for void and the primitive types, an identifier for classes.
+    return_type = (getattr(return_type, "keyword", None) or
+                   return_type.identifier)
+    subroutines[subroutine.name.identifier] = Signature(
+        subroutine.subroutine_type.keyword, len(subroutine.param_list),
+        return_type)
+  return jack_class.class_name.identifier, subroutines
+
+
+def TokenSignatures(tokens):
+  # The name and subroutines of the class in a TokenArray, read from the
+  # declarations alone, or None if the class is too malformed to tell.
+  split = token_stream.SplitClass(tokens)
+  if split is None or len(tokens) < 2:
+    return None
+  comma = token_stream.STRING_IDS[","]
+  close_paren = token_stream.STRING_IDS[")"]
+  subroutines = {}
+  for start, end in split[0]:
+    # kind, return type, name, "(", parameters, ")"
+    if end - start < 5:
+      return None
+    arity = 0
+    index = start + 4
+    while index < end and tokens.values[index] != close_paren:
+      if arity == 0 or tokens.values[index] == comma:
+        arity += 1
+      index += 1
+    subroutines[tokens.Value(start + 2)] = Signature(
+        tokens.Value(start), arity, tokens.Value(start + 1))
+  return tokens.Value(1), subroutines
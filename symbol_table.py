@@ -25,34 +25,41 @@ __author__ = "Ivan Vladimirov Ivanov (ivan.vladimirov.ivanov@gmail.com)"
 
 
 class SymbolTable(object):
-  
+
+  # Every table keeps the number of entries of each kind it holds, and the
+  # list of its own and its ancestors' entries, innermost first, so that
+  # neither inserting nor looking up has to walk the parent tables.
+
   def __init__(self, parent):
     self.parent = parent
     self.table = {}
+    self.kind_counts = {}
+    if parent:
+      self.scopes = [self.table] + parent.scopes
+      self.scope_counts = [self.kind_counts] + parent.scope_counts
+    else:
+      self.scopes = [self.table]
+      self.scope_counts = [self.kind_counts]
 
   def Lookup(self, name):
-    if name in self.table:
-      return self.table[name]
-    elif self.parent:
-      return self.parent.Lookup(name)
-    else:
-      return None
+    for table in self.scopes:
+      entry = table.get(name)
+      if entry is not None:
+        return entry
+    return None
 
   def Insert(self, name, entry_type, entry_kind):
-    index = self.CountKindLocal(entry_kind)
+    index = self.kind_counts.get(entry_kind, 0)
+    # A name declared twice keeps its last entry, and only counts once.
+    previous = self.table.get(name)
+    if previous is not None:
+      self.kind_counts[previous[1]] -= 1
+    self.kind_counts[entry_kind] = self.kind_counts.get(entry_kind, 0) + 1
     self.table[name] = (entry_type, entry_kind, index)
 
   def CountKind(self, entry_kind):
-    cnt = self.CountKindLocal(entry_kind)
-    if self.parent:
-      return cnt + self.parent.CountKind(entry_kind)
-    else:
-      return cnt
+    return sum(kind_counts.get(entry_kind, 0)
+               for kind_counts in self.scope_counts)
 
   def CountKindLocal(self, entry_kind):
-    cnt = 0
-    for _, (_, kind, _) in self.table.items():
-      if kind == entry_kind:
-        cnt += 1
-    return cnt
-
+    return self.kind_counts.get(entry_kind, 0)
@@ -27,14 +27,70 @@ __author__ = "Ivan Vladimirov Ivanov (ivan.vladimirov.ivanov@gmail.com)"
 import os
 
 import jack_lang_model
+import token_stream
 
 
 jlm = jack_lang_model
 
 
 class SyntacticError(Exception):
-  def __init__(self, message):
+  def __init__(self, message, offset=None):
     self.message = message
+    self.offset = offset
+
+
+# Stored in the memo table under (rule, index) until that rule has been tried
+# at that index. A failed rule is memoized as None.
+_NOT_MEMOIZED = object()
+
+
+class TokenWindow(object):
+
+  # Pulls tokens from an iterator as the parser asks for them and keeps only
+  # those the parser may still backtrack to, so a file does not have to be
+  # tokenized in full before parsing can start.
+
+  def __init__(self, tokens):
+    self.tokens = iter(tokens)
+    self.buffer = []
+    self.base = 0
+    self.exhausted = False
+
+  def Get(self, index):
+    offset = index - self.base
+    while offset >= len(self.buffer):
+      if self.exhausted:
+        return None
+      try:
+        self.buffer.append(next(self.tokens))
+      except StopIteration:
+        self.exhausted = True
+    return self.buffer[offset]
+
+  def Kind(self, index):
+    token = self.Get(index)
+    return token_stream.KINDS[token.__class__] if token else None
+
+  def Value(self, index):
+    return token_stream.TokenValue(self.Get(index))
+
+  def Offset(self, index):
+    token = self.Get(index)
+    return token.offset if token else None
+
+  def Release(self, index):
+    if index > self.base:
+      del self.buffer[:index - self.base]
+      self.base = index
+
+
+def TokenSource(tokens):
+  # Parsers read tokens through Kind(), Value(), Offset() and Release(),
+  # which a TokenArray and a TokenWindow provide. Anything else is a sequence
+  # of token objects.
+  if isinstance(tokens, (TokenWindow, token_stream.TokenArray)):
+    return tokens
+  return token_stream.TokenArray.FromTokens(tokens)
 
 
 class SyntaxAnalyser(object):
@@ -178,23 +234,55 @@ class SyntaxAnalyser(object):
        lambda res: jlm.KeywordConstant(res[1]))
   ]
 
-  def __init__(self, tokens):
-    self.n = len(tokens)
-    self.tokens = tokens
-    for rule in self._GRAMMAR:
-      function = getattr(self, "Generate%sParser" % (rule[1][0].capitalize(),))
-      function(rule[0], rule[1][1:], rule[2])
+  # The generated parsers are installed on the class, so they only need to be
+  # built by the first instance in a process.
+  _parsers_generated = False
+
+  # Once one of these has been parsed the parser never backtracks into it,
+  # so a TokenWindow can forget every token before its end, and the memo
+  # table every result before it.
+  _COMMIT_RULES = ("ClassVarDec", "SubroutineDec")
+
+  # The memo table is emptied when it grows past this many entries, which
+  # only happens for a single enormous subroutine.
+  _MEMO_LIMIT = 1 << 16
+
+  def __init__(self, tokens, memoize=True):
+    self.tokens = TokenSource(tokens)
+    self.memo = {} if memoize else None
+    # Parsers signal failure by returning None. The only failure reported
+    # to the user is the one that got furthest into the input, so all we
+    # keep is its index, what was expected there and the rules being parsed.
+    self.rule_stack = []
+    self.furthest = -1
+    self.expected = []
+    self.failure_rules = []
+    if not SyntaxAnalyser._parsers_generated:
+      for rule in self._GRAMMAR:
+        function = getattr(
+            self, "Generate%sParser" % (rule[1][0].capitalize(),))
+        function(rule[0], rule[1][1:], rule[2])
+        self.MemoizeParser(rule[0])
+      SyntaxAnalyser._parsers_generated = True
 
   @staticmethod
-  def Parse(tokens):
-    syntax_analyser = SyntaxAnalyser(tokens)
+  def Parse(tokens, memoize=True):
+    syntax_analyser = SyntaxAnalyser(tokens, memoize)
     parser = getattr(syntax_analyser, "ParseClass")
-    result, index = parser(0)
-    if index < len(tokens):
-      raise SyntacticError("Unparsed tokens left.")
+    outcome = parser(0)
+    if outcome is None:
+      raise syntax_analyser._FurthestFailure()
+    result, index = outcome
+    if syntax_analyser.tokens.Kind(index) is not None:
+      raise SyntacticError("Unparsed tokens left.",
+                           syntax_analyser.tokens.Offset(index))
     else:
       return result
 
+  @staticmethod
+  def ParseStream(tokens, memoize=True):
+    return SyntaxAnalyser.Parse(TokenWindow(tokens), memoize)
+
   def CallParser(self, parser_name, index):
     if parser_name.startswith("keyword"):
       return self.ParseKeyword(parser_name[7:], index)
@@ -204,30 +292,55 @@ class SyntaxAnalyser(object):
       return getattr(self, "Parse" + parser_name)(index)
 
   def GenerateSequenceParser(self, name, sequence, constructor):
+    commits = name in self._COMMIT_RULES
     def Parser(self, index):
-      try:
-        i = index
-        result = []
-        result.append(name)
-        for parser_name in sequence:
-          res, i = self.CallParser(parser_name, i)
-          result.append(res)
-        return constructor(result), i
-      except SyntacticError as error:
-        raise SyntacticError("Can't parse " +
-            name + os.linesep + error.message)
+      self.rule_stack.append(name)
+      i = index
+      result = []
+      result.append(name)
+      for parser_name in sequence:
+        outcome = self.CallParser(parser_name, i)
+        if outcome is None:
+          self.rule_stack.pop()
+          return None
+        res, i = outcome
+        result.append(res)
+      self.rule_stack.pop()
+      if commits:
+        self.tokens.Release(i)
+        if self.memo:
+          self.memo.clear()
+      return constructor(result), i
+    setattr(SyntaxAnalyser, "Parse" + name, Parser)
+
+  def MemoizeParser(self, name):
+    # Remembers the outcome of every rule at every token index, failures
+    # included, so that alternatives sharing a prefix parse it only once.
+    parser = getattr(SyntaxAnalyser, "Parse" + name)
+    def Parser(self, index):
+      memo = self.memo
+      if memo is None:
+        return parser(self, index)
+      key = (name, index)
+      outcome = memo.get(key, _NOT_MEMOIZED)
+      if outcome is _NOT_MEMOIZED:
+        outcome = parser(self, index)
+        if len(memo) >= self._MEMO_LIMIT:
+          memo.clear()
+        memo[key] = outcome
+      return outcome
     setattr(SyntaxAnalyser, "Parse" + name, Parser)
 
   def GenerateChoiceParser(self, name, choice, constructor):
     def Parser(self, index):
-      i = index
+      self.rule_stack.append(name)
       for parser_name in choice:
-        try:
-          res, i = self.CallParser(parser_name, i)
-          return constructor([name, res]), i
-        except SyntacticError as error:
-          pass
-      raise SyntacticError("Can't parse " + name)
+        outcome = self.CallParser(parser_name, index)
+        if outcome is not None:
+          self.rule_stack.pop()
+          return constructor([name, outcome[0]]), outcome[1]
+      self.rule_stack.pop()
+      return None
     setattr(SyntaxAnalyser, "Parse" + name, Parser)
 
   def GenerateStarParser(self, name, thing, constructor):
@@ -235,64 +348,72 @@ class SyntaxAnalyser(object):
       i = index
       result = []
       result.append(name)
-      try:
-        while True:
-          res, i = self.CallParser(thing[0], i)
-          result.append(res)
-      except SyntacticError as error:
-        return constructor(result), i
+      while True:
+        outcome = self.CallParser(thing[0], i)
+        if outcome is None:
+          return constructor(result), i
+        res, i = outcome
+        result.append(res)
     setattr(SyntaxAnalyser, "Parse" + name, Parser)
 
   def GenerateQuestionParser(self, name, thing, constructor):
     def Parser(self, index):
-      i = index
       result = []
       result.append(name)
-      try:
-        res, i = self.CallParser(thing[0], i)
-        result.append(res)
-        return constructor(result), i
-      except SyntacticError as error:
-        return constructor(result), i
+      outcome = self.CallParser(thing[0], index)
+      if outcome is None:
+        return constructor(result), index
+      result.append(outcome[0])
+      return constructor(result), outcome[1]
     setattr(SyntaxAnalyser, "Parse" + name, Parser)
 
   def ParseKeyword(self, keyword, index):
-    token = self._NextToken(index)
-    if (token and token.__class__.__name__ == "Keyword" and
-        token.keyword == keyword):
+    if (self.tokens.Kind(index) == token_stream.KEYWORD and
+        self.tokens.Value(index) == keyword):
       return jack_lang_model.Keyword(keyword), index + 1
     else:
-      raise SyntacticError("Can't parse keyword: %s" % (keyword,))
+      return self._Fail(index, "keyword", keyword)
 
   def ParseSymbol(self, symbol, index):
-    token = self._NextToken(index)
-    if (token and token.__class__.__name__ == "Symbol" and
-        token.symbol == symbol):
+    if (self.tokens.Kind(index) == token_stream.SYMBOL and
+        self.tokens.Value(index) == symbol):
       return jack_lang_model.Symbol(symbol), index + 1
     else:
-      raise SyntacticError("Can't parse symbol: %s" % (symbol,))
+      return self._Fail(index, "symbol", symbol)
 
   def ParseIntegerConstant(self, index):
-    token = self._NextToken(index)
-    if token and token.__class__.__name__ == "IntegerConstant":
-      return jack_lang_model.IntegerConstant(token.integer_constant), index + 1
+    if self.tokens.Kind(index) == token_stream.INTEGER_CONSTANT:
+      return (jack_lang_model.IntegerConstant(self.tokens.Value(index)),
+              index + 1)
     else:
-      raise SyntacticError("Can't parse integer constant")
+      return self._Fail(index, "integer constant")
 
   def ParseStringConstant(self, index):
-    token = self._NextToken(index)
-    if token and token.__class__.__name__ == "StringConstant":
-      return jack_lang_model.StringConstant(token.string_constant), index + 1
+    if self.tokens.Kind(index) == token_stream.STRING_CONSTANT:
+      return (jack_lang_model.StringConstant(self.tokens.Value(index)),
+              index + 1)
     else:
-      raise SyntacticError("Can't parse string constant")
+      return self._Fail(index, "string constant")
 
   def ParseIdentifier(self, index):
-    token = self._NextToken(index)
-    if token and token.__class__.__name__ == "Identifier":
-      return jack_lang_model.Identifier(token.identifier), index + 1
+    if self.tokens.Kind(index) == token_stream.IDENTIFIER:
+      return jack_lang_model.Identifier(self.tokens.Value(index)), index + 1
     else:
-      raise SyntacticError("Can't parse identifier")
+      return self._Fail(index, "identifier")
 
-  def _NextToken(self, index):
-    return self.tokens[index] if index < self.n else None
+  def _Fail(self, index, expected, value=None):
+    if index > self.furthest:
+      self.furthest = index
+      self.expected = [(expected, value)]
+      self.failure_rules = list(self.rule_stack)
+    elif index == self.furthest and (expected, value) not in self.expected:
+      self.expected.append((expected, value))
+    return None
 
+  def _FurthestFailure(self):
+    lines = ["Can't parse " + rule for rule in self.failure_rules]
+    lines.append("Can't parse " + " or ".join(
+        "%s: %s" % (expected, value) if value else expected
+        for expected, value in self.expected))
+    return SyntacticError(os.linesep.join(lines),
+                          self.tokens.Offset(self.furthest))
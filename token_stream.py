@@ -0,0 +1,179 @@
+#!/usr/bin/python
+#
+# Copyright (c) 2011 Ivan Vladimirov Ivanov (ivan.vladimirov.ivanov@gmail.com)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+
+
+__author__ = "Ivan Vladimirov Ivanov (ivan.vladimirov.ivanov@gmail.com)"
+
+
+import array
+
+import jack_lang_model
+
+
+KEYWORD = 0
+SYMBOL = 1
+INTEGER_CONSTANT = 2
+STRING_CONSTANT = 3
+IDENTIFIER = 4
+
+TOKEN_CLASSES = [
+    jack_lang_model.Keyword,
+    jack_lang_model.Symbol,
+    jack_lang_model.IntegerConstant,
+    jack_lang_model.StringConstant,
+    jack_lang_model.Identifier
+]
+
+_TOKEN_ATTRIBUTES = [
+    "keyword",
+    "symbol",
+    "integer_constant",
+    "string_constant",
+    "identifier"
+]
+
+KINDS = dict((token_class, kind)
+             for kind, token_class in enumerate(TOKEN_CLASSES))
+
+# Keywords and symbols are interned first and in a fixed order, so their
+# string ids are the same in every TokenArray.
+_VOCABULARY = jack_lang_model.KEYWORDS + list(jack_lang_model.SYMBOLS)
+
+STRING_IDS = dict((string, string_id)
+                  for string_id, string in enumerate(_VOCABULARY))
+
+_SUBROUTINE_KEYWORDS = frozenset(
+    STRING_IDS[keyword] for keyword in ("constructor", "function", "method"))
+
+
+def TokenKind(token):
+  return KINDS[token.__class__]
+
+
+def TokenValue(token):
+  return getattr(token, _TOKEN_ATTRIBUTES[KINDS[token.__class__]])
+
+
+class TokenArray(object):
+
+  # A token stream stored as parallel typed arrays: one byte for the kind of
+  # each token, the index of its text in an interned string table and its
+  # offset in the source.
+
+  def __init__(self):
+    self.kinds = array.array("B")
+    self.values = array.array("I")
+    self.offsets = array.array("I")
+    self.strings = list(_VOCABULARY)
+    self.string_ids = dict(STRING_IDS)
+
+  @staticmethod
+  def FromTokens(tokens):
+    token_array = TokenArray()
+    for token in tokens:
+      token_array.Append(
+          TokenKind(token), TokenValue(token), token.offset or 0)
+    return token_array
+
+  def Intern(self, value):
+    string_id = self.string_ids.get(value)
+    if string_id is None:
+      string_id = len(self.strings)
+      self.strings.append(value)
+      self.string_ids[value] = string_id
+    return string_id
+
+  def Append(self, kind, value, offset=0):
+    self.kinds.append(kind)
+    self.values.append(self.Intern(value))
+    self.offsets.append(offset)
+
+  def Slice(self, *ranges):
+    # A TokenArray of the tokens in the given (start, end) ranges, with only
+    # the strings they use.
+    token_array = TokenArray()
+    for start, end in ranges:
+      token_array.kinds.extend(self.kinds[start:end])
+      token_array.offsets.extend(self.offsets[start:end])
+      token_array.values.extend(
+          [token_array.Intern(self.strings[value])
+           for value in self.values[start:end]])
+    return token_array
+
+  def Kind(self, index):
+    return self.kinds[index] if index < len(self.kinds) else None
+
+  def Value(self, index):
+    return self.strings[self.values[index]]
+
+  def Offset(self, index):
+    return self.offsets[index] if index < len(self.kinds) else None
+
+  def Release(self, index):
+    # Every token stays available, see syntax_analyser.TokenWindow.
+    pass
+
+  def Token(self, index):
+    return TOKEN_CLASSES[self.kinds[index]](
+        self.strings[self.values[index]], self.offsets[index])
+
+  def __len__(self):
+    return len(self.kinds)
+
+  def __iter__(self):
+    for index in xrange(len(self.kinds)):
+      yield self.Token(index)
+
+  def __getstate__(self):
+    # The interning dictionary is rebuilt on load instead of being pickled.
+    return (self.kinds, self.values, self.offsets, self.strings)
+
+  def __setstate__(self, state):
+    self.kinds, self.values, self.offsets, self.strings = state
+    self.string_ids = dict(
+        (string, string_id) for string_id, string in enumerate(self.strings))
+
+
+def SplitClass(tokens):
+  # Returns the (start, end) token ranges of the subroutines of a class and
+  # the index of the brace that closes it, or None if the braces do not
+  # balance. Subroutines are the only things that start with one of their
+  # keywords directly inside the class braces.
+  open_brace = STRING_IDS["{"]
+  close_brace = STRING_IDS["}"]
+  depth = 0
+  starts = []
+  for index in xrange(len(tokens)):
+    kind = tokens.kinds[index]
+    value = tokens.values[index]
+    if kind == SYMBOL:
+      if value == open_brace:
+        depth += 1
+      elif value == close_brace:
+        depth -= 1
+        if depth == 0:
+          break
+    elif kind == KEYWORD and depth == 1 and value in _SUBROUTINE_KEYWORDS:
+      starts.append(index)
+  else:
+    return None
+  return zip(starts, starts[1:] + [index]), index
@@ -27,27 +27,28 @@ __author__ = "Ivan Vladimirov Ivanov (ivan.vladimirov.ivanov@gmail.com)"
 import cgi
 import os
 
+import token_stream
+
 
 class TokenXMLSerializer(object):
 
+  _TAGS = {
+      token_stream.KEYWORD: "keyword",
+      token_stream.SYMBOL: "symbol",
+      token_stream.INTEGER_CONSTANT: "integerConstant",
+      token_stream.STRING_CONSTANT: "stringConstant",
+      token_stream.IDENTIFIER: "identifier"
+  }
+
   @staticmethod
   def SerializeToXML(tokens):
+    if not isinstance(tokens, token_stream.TokenArray):
+      tokens = token_stream.TokenArray.FromTokens(tokens)
     result = []
     result.append("<tokens>")
-    for token in tokens:
-      if token.__class__.__name__ == "Keyword":
-        result.append("<keyword>%s</keyword>" % (cgi.escape(token.keyword),))
-      elif token.__class__.__name__ == "Symbol":
-        result.append("<symbol>%s</symbol>" % (cgi.escape(token.symbol),))
-      elif token.__class__.__name__ == "IntegerConstant":
-        result.append("<integerConstant>%s</integerConstant>" % (
-            cgi.escape(token.integer_constant),))
-      elif token.__class__.__name__ == "StringConstant":
-        result.append("<stringConstant>%s</stringConstant>" % (
-            cgi.escape(token.string_constant),))
-      elif token.__class__.__name__ == "Identifier":
-        result.append("<identifier>%s</identifier>" % (
-            cgi.escape(token.identifier),))
+    for index in xrange(len(tokens)):
+      tag = TokenXMLSerializer._TAGS[tokens.Kind(index)]
+      result.append("<%s>%s</%s>" % (
+          tag, cgi.escape(tokens.Value(index)), tag))
     result.append("</tokens>")
     return os.linesep.join(result)
-